@@ -1,5 +1,6 @@
 # attendance_app/__init__.py
 
+import os
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
@@ -7,9 +8,53 @@ from flask_migrate import Migrate
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'your_secret_key_here'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///attendance.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///attendance.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+# Background jobs: threads per web process (0 = leave jobs to `flask run-jobs`)
+# and the directory finished artifacts are written to.
+app.config['JOB_WORKERS'] = int(os.environ.get('JOB_WORKERS', 2))
+app.config['JOB_ARTIFACT_DIR'] = os.environ.get('JOB_ARTIFACT_DIR', os.path.join(app.instance_path, 'jobs'))
+# A running job's heartbeat is refreshed every JOB_HEARTBEAT_SECONDS; one
+# silent for JOB_STALE_SECONDS is taken back from its dead worker and run
+# again, up to JOB_MAX_ATTEMPTS times (see attendance_app/jobs.py).
+app.config['JOB_HEARTBEAT_SECONDS'] = int(os.environ.get('JOB_HEARTBEAT_SECONDS', 30))
+app.config['JOB_STALE_SECONDS'] = int(os.environ.get('JOB_STALE_SECONDS', 120))
+app.config['JOB_MAX_ATTEMPTS'] = int(os.environ.get('JOB_MAX_ATTEMPTS', 3))
+
+# Shared secret NFC readers send as a bearer token to the clock-event API
+# (unset = the API refuses every batch). Reader events stamped more than
+# READER_EVENT_MAX_AGE seconds before or READER_EVENT_MAX_AHEAD seconds after
+# the server's clock are answered 'stale' and not recorded; the age covers a
+# reader spooling through a long outage.
+app.config['READER_API_TOKEN'] = os.environ.get('READER_API_TOKEN')
+app.config['READER_EVENT_MAX_AGE'] = int(os.environ.get('READER_EVENT_MAX_AGE', 24 * 3600))
+app.config['READER_EVENT_MAX_AHEAD'] = int(os.environ.get('READER_EVENT_MAX_AHEAD', 300))
+
+# Fold punches from the clock_event log into attendance rows right after each
+# punch (0 = leave it to `flask derive-attendance --watch`).
+app.config['DERIVE_INLINE'] = os.environ.get('DERIVE_INLINE', '1') != '0'
+
+# SQLite tuning applied to every connection (see attendance_app/database.py).
+# synchronous=NORMAL in WAL mode survives a crashed worker; FULL also
+# survives power loss at the cost of an fsync per commit.
+app.config['SQLITE_WAL'] = os.environ.get('SQLITE_WAL', '1') != '0'
+app.config['SQLITE_SYNCHRONOUS'] = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+app.config['SQLITE_BUSY_TIMEOUT'] = int(os.environ.get('SQLITE_BUSY_TIMEOUT', 10000))  # ms
+app.config['SQLITE_CACHE_SIZE'] = int(os.environ.get('SQLITE_CACHE_SIZE', -32000))  # negative = KiB
+app.config['SQLITE_MMAP_SIZE'] = int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))  # bytes
+
+# Group commit: punches from concurrent requests share one transaction (one
+# fsync), up to GROUP_COMMIT_MAX_BATCH of them or whatever arrives within
+# GROUP_COMMIT_WINDOW_MS of the first.
+app.config['GROUP_COMMIT'] = os.environ.get('GROUP_COMMIT', '0') == '1'
+app.config['GROUP_COMMIT_MAX_BATCH'] = int(os.environ.get('GROUP_COMMIT_MAX_BATCH', 64))
+app.config['GROUP_COMMIT_WINDOW_MS'] = float(os.environ.get('GROUP_COMMIT_WINDOW_MS', 5))
+
+# Kiosk QR codes carry a token signed with SECRET_KEY that rotates every
+# QR_TOKEN_SECONDS (see attendance_app/qr_tokens.py).
+app.config['QR_TOKEN_SECONDS'] = int(os.environ.get('QR_TOKEN_SECONDS', 15))
+
 db = SQLAlchemy(app)
 migrate = Migrate(app, db)
 
@@ -17,9 +62,13 @@ login_manager = LoginManager(app)
 login_manager.login_view = 'auth.login'  # your login route name
 
 # Import blueprints and routes after app and db are created
+from attendance_app import database
 from attendance_app.auth import auth
-from attendance_app import routes
+from attendance_app import routes, commands
 from attendance_app.routes import api_bp
 
 app.register_blueprint(auth, url_prefix='/auth')
 app.register_blueprint(api_bp)
+
+from attendance_app.identity import load_identity_index
+load_identity_index()
@@ -0,0 +1,206 @@
+# attendance_app/cache.py
+#
+# Result cache for the report and manager dashboard pages. Cached results
+# are tagged with the data version, a counter in the data_version table that
+# every flush writing attendance, breaks, deductions, advances, users or
+# holidays increments in the same transaction. A result computed for an
+# older version is never served, and since the counter lives in the
+# database all workers see the same version.
+#
+# The same table holds narrower counters, one row per scope: USER_VERSION
+# moves only with user writes, HOLIDAY_VERSION only with holiday writes and
+# ATTENDANCE_VERSION only with attendance writes. The process-local caches
+# (presence, identity index, working calendar) compare their scope's counter
+# with the one they were loaded at to notice writes made by other processes.
+# They read it through request_version(), which reads each counter once per
+# app context (a request, a job, a CLI command) and moves it along with the
+# commits made in that context.
+
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from flask import request, session, make_response, g, has_app_context
+from flask_login import current_user
+from sqlalchemy import event, select
+from sqlalchemy.dialects.sqlite import insert
+from attendance_app import db
+from attendance_app.models import (
+    User, Attendance, BreakSession, Deduction, AdvanceSalary, Holiday, DataVersion
+)
+
+VERSIONED_MODELS = (Attendance, BreakSession, Deduction, AdvanceSalary, User, Holiday)
+
+# data_version rows
+DATA_VERSION = 1  # any of VERSIONED_MODELS
+USER_VERSION = 2
+HOLIDAY_VERSION = 3
+ATTENDANCE_VERSION = 4  # bulk attendance writes bump it themselves
+
+SCOPED_MODELS = ((USER_VERSION, User), (HOLIDAY_VERSION, Holiday), (ATTENDANCE_VERSION, Attendance))
+
+
+def data_version(scope=DATA_VERSION):
+    version = db.session.execute(
+        select(DataVersion.version).where(DataVersion.id == scope)
+    ).scalar()
+    return version or 0
+
+
+def request_version(scope=DATA_VERSION):
+    """
+    data_version(scope), read at most once per app context; the commits made
+    in the context since move it along (see _advance_request_versions).
+    """
+    if not has_app_context():
+        return data_version(scope)
+    versions = g.setdefault('data_versions', {})
+    if scope not in versions:
+        versions[scope] = data_version(scope)
+    return versions[scope]
+
+
+def bump_data_version(connection, scope=DATA_VERSION):
+    """Increment a data version; call after writes that bypass the ORM. Returns the new version."""
+    stmt = insert(DataVersion).values(id=scope, version=1, updated_at=datetime.utcnow())
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['id'],
+        set_={'version': DataVersion.version + 1, 'updated_at': stmt.excluded.updated_at}
+    )
+    return connection.execute(stmt.returning(DataVersion.version)).scalar()
+
+
+def committed_versions(session, scope=DATA_VERSION):
+    """
+    For after_commit listeners: (version before, version after) the bumps of
+    scope made by the committing transaction, None if it made none, or False
+    when that cannot be told because a savepoint that bumped it rolled back.
+    """
+    return session.info.get('data_versions', {}).get(scope)
+
+
+def bumped_in_transaction(session, scope=DATA_VERSION):
+    """
+    True while the session's open transaction has bumped scope: what it
+    reads is not committed yet and must not be cached under that version.
+    """
+    return scope in session.info.get('data_versions', {})
+
+
+class ResultCache:
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, key, version, compute):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                return entry[1]
+
+        value = compute()
+
+        with self._lock:
+            self._entries[key] = (version, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+result_cache = ResultCache()
+
+
+def role_key(user):
+    return (user.role, bool(getattr(user, 'is_admin', False)))
+
+
+def cached_page(view, filters, compute, render):
+    """
+    Serve a page whose data depends only on (view, filters, role). compute()
+    builds the data, render(data) turns it into the response body.
+    """
+    key = (view, filters, role_key(current_user))
+    version = data_version()
+
+    # The rendered page also greets the signed-in user and echoes the query
+    # string, so the ETag covers both.
+    etag = hashlib.sha1(
+        repr((key, version, current_user.get_id(), request.full_path)).encode()
+    ).hexdigest()
+
+    # Pending flash messages must be rendered, so they never get a 304.
+    if etag in request.if_none_match and '_flashes' not in session:
+        response = make_response('', 304)
+    else:
+        response = make_response(render(result_cache.get_or_compute(key, version, compute)))
+
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+@event.listens_for(db.session, 'before_flush')
+def _collect_data_changes(session, flush_context, instances):
+    changed = session.info.setdefault('data_changed', set())
+    changed_objects = list(session.new) + list(session.deleted) + [
+        obj for obj in session.dirty if isinstance(obj, VERSIONED_MODELS) and session.is_modified(obj)
+    ]
+    for obj in changed_objects:
+        if isinstance(obj, VERSIONED_MODELS):
+            changed.add(DATA_VERSION)
+            for scope, model in SCOPED_MODELS:
+                if isinstance(obj, model):
+                    changed.add(scope)
+
+
+@event.listens_for(db.session, 'after_flush')
+def _apply_data_changes(session, flush_context):
+    versions = session.info.setdefault('data_versions', {})
+    for scope in sorted(session.info.pop('data_changed', ())):
+        version = bump_data_version(session.connection(), scope)
+        span = versions.get(scope)
+        if span is not False:
+            versions[scope] = (span[0] if span else version - 1, version)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _advance_request_versions(session):
+    if not has_app_context() or not g.get('data_versions'):
+        return
+    versions = g.data_versions
+    for scope in list(versions):
+        span = committed_versions(session, scope)
+        if span is None:
+            continue
+        if span and span[0] == versions[scope]:
+            versions[scope] = span[1]
+        else:
+            del versions[scope]  # someone else wrote in between: read it again
+
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def _forget_rolled_back_versions(session, previous_transaction):
+    # A savepoint rolled back: the bumps it made are undone, so the spans
+    # recorded so far no longer say which versions this transaction wrote.
+    if previous_transaction.nested:
+        versions = session.info.get('data_versions', {})
+        for scope in versions:
+            versions[scope] = False
+
+
+@event.listens_for(db.session, 'after_transaction_end')
+def _clear_versions(session, transaction):
+    if transaction.parent is None:
+        session.info.pop('data_versions', None)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_data_changes(session):
+    session.info.pop('data_changed', None)
@@ -0,0 +1,100 @@
+# attendance_app/clock_events.py
+#
+# The punch log. Every punch (a card scan, a QR scan, the clock-in / out and
+# break buttons, a batch from an NFC reader) is one insert into clock_event
+# and nothing else; attendance and break rows are derived from the log
+# afterwards by attendance_app.deriver. Each event carries an idempotency
+# key, so a reader batch that is re-sent after a lost response is recorded
+# once and gets the original results back. Reader events must be stamped
+# within READER_EVENT_MAX_AGE / READER_EVENT_MAX_AHEAD of the server's clock,
+# so a reader cannot backdate or postdate punches at will.
+
+import uuid
+from datetime import datetime, timedelta
+from sqlalchemy import select
+from attendance_app import app, db
+from attendance_app.models import ClockEvent
+from attendance_app.identity import identity_index
+
+MAX_CLOCK_EVENTS = 500
+
+# scan toggles: clock in, else clock out, else nothing (one session a day).
+PUNCH_KINDS = ('scan', 'in', 'out', 'break_start', 'break_end')
+
+# Results returned to readers: recorded, unknown_card (recorded, but no user
+# has that card), invalid (malformed event, not recorded), stale (stamped
+# outside the accepted window around server time, not recorded).
+
+
+def record_punch(user_id, kind, occurred_at=None, reader_id='web', serial_number=None, key=None):
+    """Add one event to the current transaction. Does not commit."""
+    if kind not in PUNCH_KINDS:
+        raise ValueError(f"Unknown punch kind: {kind}")
+    event = ClockEvent(
+        key=key or uuid.uuid4().hex, kind=kind, reader_id=reader_id, serial_number=serial_number,
+        occurred_at=occurred_at or datetime.now(), user_id=user_id
+    )
+    db.session.add(event)
+    return event
+
+
+def parse_event(event):
+    """Validate one event; returns (key, reader_id, serial, naive local datetime) or None."""
+    if not isinstance(event, dict):
+        return None
+    key, reader_id, serial = event.get('key'), event.get('reader_id'), event.get('serial')
+    if not all(isinstance(value, str) and value for value in (key, reader_id, serial)):
+        return None
+    if len(key) > 64 or len(reader_id) > 64 or len(serial) > 255:
+        return None
+    try:
+        occurred_at = datetime.fromisoformat(event.get('timestamp'))
+    except (TypeError, ValueError):
+        return None
+    if occurred_at.tzinfo is not None:
+        occurred_at = occurred_at.astimezone().replace(tzinfo=None)
+    return key, reader_id, serial.strip(), occurred_at
+
+
+def _result(user_id):
+    return 'recorded' if user_id is not None else 'unknown_card'
+
+
+def record_clock_events(events):
+    """
+    Record a batch of raw reader event dicts in the current transaction and
+    return one compact result dict per event, in request order. Does not commit.
+    """
+    parsed = [parse_event(event) for event in events]
+    now = datetime.now()
+    earliest = now - timedelta(seconds=app.config['READER_EVENT_MAX_AGE'])
+    latest = now + timedelta(seconds=app.config['READER_EVENT_MAX_AHEAD'])
+    keys = {event[0] for event in parsed if event}
+    recorded = {}
+    if keys:
+        recorded = {
+            key: user_id for key, user_id in db.session.execute(
+                select(ClockEvent.key, ClockEvent.user_id).where(ClockEvent.key.in_(keys))
+            )
+        }
+
+    results = []
+    for raw, event in zip(events, parsed):
+        if event is None:
+            results.append({'key': raw.get('key') if isinstance(raw, dict) else None, 'result': 'invalid'})
+            continue
+        key, reader_id, serial, occurred_at = event
+        if key in recorded:
+            user_id = recorded[key]
+            results.append({'key': key, 'result': _result(user_id), 'user_id': user_id, 'duplicate': True})
+            continue
+        if not earliest <= occurred_at <= latest:
+            results.append({'key': key, 'result': 'stale'})
+            continue
+
+        identity = identity_index.by_serial(serial)
+        user_id = identity.id if identity else None
+        record_punch(user_id, 'scan', occurred_at, reader_id=reader_id, serial_number=serial, key=key)
+        recorded[key] = user_id
+        results.append({'key': key, 'result': _result(user_id), 'user_id': user_id})
+    return results
@@ -0,0 +1,180 @@
+# attendance_app/commands.py
+#
+# Maintenance commands, run with `flask --app run <command>`.
+
+import json
+import time
+from datetime import timedelta
+import click
+from sqlalchemy import select, update, bindparam
+from attendance_app import app, db
+from attendance_app.models import Attendance, Holiday
+from attendance_app.jobs import run_queued_jobs, purge_jobs
+from attendance_app.payslips import build_payslips, PAYSLIP_FORMATS
+from attendance_app.query_plans import check_query_plans, capture_route_queries
+from attendance_app.rollup import rebuild_rollups
+from attendance_app.deriver import derive_pending, rebuild_attendance
+
+
+@app.cli.command('rebuild-rollups')
+def rebuild_rollups_command():
+    """Recompute the payroll_rollup table from attendance, deductions and advances."""
+    count = rebuild_rollups(db.session)
+    db.session.commit()
+    click.echo(f"Rebuilt {count} payroll rollup row(s).")
+
+
+@app.cli.command('backfill-attendance-minutes')
+@click.option('--chunk-size', default=1000, show_default=True, help='Rows updated per transaction.')
+def backfill_attendance_minutes_command(chunk_size):
+    """Fill worked_minutes/regular_minutes on rows saved before those columns existed."""
+    update_stmt = update(Attendance).where(Attendance.id == bindparam('row_id')).values(
+        worked_minutes=bindparam('worked'),
+        regular_minutes=bindparam('regular'),
+    )
+
+    last_id, total = 0, 0
+    while True:
+        rows = db.session.execute(
+            select(Attendance.id, Attendance.date, Attendance.clock_in, Attendance.clock_out, Attendance.overtime)
+            .where(Attendance.id > last_id, Attendance.worked_minutes == None)
+            .order_by(Attendance.id)
+            .limit(chunk_size)
+        ).all()
+        if not rows:
+            break
+
+        params = []
+        for row_id, day, clock_in, clock_out, overtime in rows:
+            worked, regular = Attendance.compute_minutes(day, clock_in, clock_out, overtime)
+            params.append({'row_id': row_id, 'worked': worked, 'regular': regular})
+        db.session.connection().execute(update_stmt, params)
+        db.session.commit()
+
+        last_id = rows[-1][0]
+        total += len(rows)
+        click.echo(f"  {total} row(s) updated")
+
+    count = rebuild_rollups(db.session)
+    db.session.commit()
+    click.echo(f"Backfilled {total} attendance row(s), rebuilt {count} payroll rollup row(s).")
+
+
+@app.cli.command('derive-attendance')
+@click.option('--watch', is_flag=True, help='Keep deriving new punches until interrupted.')
+@click.option('--interval', default=1.0, show_default=True, help='Seconds between polls for new punches.')
+def derive_attendance_command(watch, interval):
+    """Fold punches recorded in clock_event into attendance and break rows."""
+    while True:
+        count = derive_pending()
+        db.session.rollback()  # end the read transaction so the next poll sees new punches
+        if count or not watch:
+            click.echo(f"Derived {count} punch(es).")
+        if not watch:
+            break
+        time.sleep(interval)
+
+
+@app.cli.command('rebuild-attendance')
+@click.argument('start', type=click.DateTime(formats=['%Y-%m-%d']))
+@click.argument('end', type=click.DateTime(formats=['%Y-%m-%d']))
+def rebuild_attendance_command(start, end):
+    """Re-derive attendance and breaks from clock_event for START..END (YYYY-MM-DD)."""
+    rebuilt, kept = rebuild_attendance(start.date(), end.date())
+    click.echo(f"Rebuilt {rebuilt} employee-day(s).")
+    if kept:
+        click.echo(f"Kept {kept} employee-day(s) holding imported or edited rows; fix those by hand.")
+
+
+@app.cli.command('add-holiday')
+@click.argument('day', type=click.DateTime(formats=['%Y-%m-%d']))
+@click.argument('name', required=False)
+def add_holiday_command(day, name):
+    """Mark DAY (YYYY-MM-DD) as a public holiday."""
+    if Holiday.query.filter_by(date=day.date()).first():
+        click.echo(f"{day.date()} is already a holiday.")
+        return
+    db.session.add(Holiday(date=day.date(), name=name))
+    db.session.commit()
+    click.echo(f"Added holiday {day.date()}.")
+
+
+@app.cli.command('remove-holiday')
+@click.argument('day', type=click.DateTime(formats=['%Y-%m-%d']))
+def remove_holiday_command(day):
+    """Remove the public holiday on DAY (YYYY-MM-DD)."""
+    holiday = Holiday.query.filter_by(date=day.date()).first()
+    if not holiday:
+        click.echo(f"{day.date()} is not a holiday.")
+        return
+    db.session.delete(holiday)
+    db.session.commit()
+    click.echo(f"Removed holiday {day.date()}.")
+
+
+@app.cli.command('check-query-plans')
+@click.option('--verbose', is_flag=True, help='Print every checked statement.')
+def check_query_plans_command(verbose):
+    """Fail when a hot query falls back to a full table scan."""
+    failures = 0
+    for name, sql, scans in check_query_plans():
+        if scans:
+            failures += 1
+            click.echo(f"FULL SCAN  {name}: {'; '.join(scans)}")
+            click.echo(f"           {sql}")
+        elif verbose:
+            click.echo(f"ok         {name}")
+    db.session.rollback()
+
+    if failures:
+        raise SystemExit(f"{failures} hot query(s) use a full table scan.")
+    click.echo("All hot queries use an index.")
+
+
+@app.cli.command('capture-route-queries', hidden=True)
+@click.argument('output', type=click.Path(dir_okay=False))
+def capture_route_queries_command(output):
+    """Write the SQL the routes emit to OUTPUT as JSON; run by check-query-plans on a scratch database."""
+    statements = capture_route_queries()
+    with open(output, 'w') as target:
+        json.dump({label: [(sql, list(params)) for sql, params in captured]
+                   for label, captured in statements.items()}, target, default=str)
+
+
+@app.cli.command('run-jobs')
+@click.option('--once', is_flag=True, help='Run the jobs queued now and exit.')
+@click.option('--interval', default=2.0, show_default=True, help='Seconds between polls for new jobs.')
+def run_jobs_command(once, interval):
+    """Run queued export jobs in this process (use with JOB_WORKERS=0 on the web server)."""
+    while True:
+        count = run_queued_jobs()
+        if count:
+            click.echo(f"Ran {count} job(s).")
+        if once:
+            break
+        time.sleep(interval)
+
+
+@app.cli.command('purge-jobs')
+@click.option('--days', default=7, show_default=True, help='Delete finished jobs older than this.')
+def purge_jobs_command(days):
+    """Delete old finished jobs and their files."""
+    count = purge_jobs(timedelta(days=days))
+    click.echo(f"Purged {count} job(s).")
+
+
+@app.cli.command('generate-payslips')
+@click.argument('month', type=click.DateTime(formats=['%Y-%m']))
+@click.option('--format', 'output_format', type=click.Choice(PAYSLIP_FORMATS), default='zip', show_default=True)
+@click.option('--workers', type=int, default=1, show_default=True, help='PDF render processes; more than 1 starts a pool.')
+@click.option('--output', type=click.Path(dir_okay=False), default=None, help='Target file (default: generated name).')
+def generate_payslips_command(month, output_format, workers, output):
+    """Render the payslips of every employee for MONTH (YYYY-MM)."""
+    result = build_payslips(month.year, month.month, output_format, workers=workers)
+    if result is None:
+        raise SystemExit("No employees found.")
+
+    data, filename, _ = result
+    with open(output or filename, 'wb') as target:
+        target.write(data.read())
+    click.echo(f"Wrote {output or filename}.")
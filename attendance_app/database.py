@@ -0,0 +1,184 @@
+# attendance_app/database.py
+#
+# SQLite setup for several web workers sharing one database file.
+#
+# Every new connection is switched to WAL (readers no longer block the
+# writer, nor the writer the readers) and gets the synchronous level, busy
+# timeout, page cache and mmap size from the SQLITE_* settings, so a worker
+# that finds the database busy waits for it instead of failing with
+# "database is locked".
+#
+# Punches and their derivation go through write_queue: one writer thread
+# per process runs them one after another, each in a short transaction
+# started with BEGIN IMMEDIATE. Taking the write lock up front means a
+# transaction never has to upgrade a read lock mid-way (which SQLite
+# refuses instead of waiting), and workers queue on the busy timeout
+# rather than on each other's half-finished transactions.
+#
+# With GROUP_COMMIT on, punches queued with run_grouped() are committed in
+# micro-batches: the writer collects up to GROUP_COMMIT_MAX_BATCH of them,
+# waiting at most GROUP_COMMIT_WINDOW_MS for more, runs each under its own
+# SAVEPOINT (a failing punch only loses its own writes) and commits them
+# all at once. Every request still waits until the commit holding its punch
+# has finished, but a rush of punches costs one commit, and one fsync, per
+# batch instead of one each. Derivation then joins the next batch as well.
+
+import queue
+import threading
+import time as timer
+from concurrent.futures import Future
+from sqlalchemy import event
+from attendance_app import app, db
+from attendance_app.presence import invalidate_presence
+
+SYNCHRONOUS_LEVELS = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    synchronous = app.config['SQLITE_SYNCHRONOUS'].upper()
+    if synchronous not in SYNCHRONOUS_LEVELS:
+        raise ValueError(f"SQLITE_SYNCHRONOUS must be one of {', '.join(SYNCHRONOUS_LEVELS)}")
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={'WAL' if app.config['SQLITE_WAL'] else 'DELETE'}")
+    cursor.execute(f"PRAGMA synchronous={synchronous}")
+    cursor.execute(f"PRAGMA busy_timeout={int(app.config['SQLITE_BUSY_TIMEOUT'])}")
+    cursor.execute(f"PRAGMA cache_size={int(app.config['SQLITE_CACHE_SIZE'])}")
+    cursor.execute(f"PRAGMA mmap_size={int(app.config['SQLITE_MMAP_SIZE'])}")
+    cursor.close()
+
+
+with app.app_context():
+    if db.engine.dialect.name == 'sqlite':
+        event.listen(db.engine, 'connect', _set_sqlite_pragmas)
+
+
+@event.listens_for(db.session, 'after_begin')
+def _begin_immediate(session, transaction, connection):
+    if session.info.get('begin_immediate') and not transaction.nested and connection.dialect.name == 'sqlite':
+        connection.exec_driver_sql('BEGIN IMMEDIATE')
+
+
+class WriteQueue:
+    """Runs write transactions one at a time on a dedicated thread."""
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.jobs = 0
+        self.commits = 0
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+                self._thread.start()
+
+    def submit(self, func, *args, grouped=False, **kwargs):
+        """
+        Queue func(*args, **kwargs) to run in its own transaction, committed
+        when it returns. func uses db.session as usual and may commit itself,
+        unless grouped, in which case it may share the transaction with other
+        grouped writes and must not commit. Returns a Future for its result.
+        """
+        future = Future()
+        self._queue.put((future, func, args, kwargs, grouped))
+        self._start()
+        return future
+
+    def run(self, func, *args, **kwargs):
+        """Like submit(), but waits and returns func's result (or raises its exception)."""
+        if threading.current_thread() is self._thread:
+            return func(*args, **kwargs)  # already on the writer, e.g. a write calling another
+        return self.submit(func, *args, **kwargs).result()
+
+    def run_grouped(self, func, *args, **kwargs):
+        """run() for a small write that does not commit itself, e.g. a punch."""
+        if threading.current_thread() is self._thread:
+            return func(*args, **kwargs)
+        return self.submit(func, *args, grouped=True, **kwargs).result()
+
+    def stats(self):
+        return {'jobs': self.jobs, 'commits': self.commits}
+
+    def _next_batch(self, job):
+        # Collect grouped jobs behind job; returns (batch, the non-grouped job that ended it or None).
+        batch = [job]
+        deadline = timer.monotonic() + app.config['GROUP_COMMIT_WINDOW_MS'] / 1000
+        while len(batch) < app.config['GROUP_COMMIT_MAX_BATCH']:
+            try:
+                following = self._queue.get(timeout=max(0.0, deadline - timer.monotonic()))
+            except queue.Empty:
+                break
+            if not following[4]:
+                return batch, following
+            batch.append(following)
+        return batch, None
+
+    def _run(self):
+        with app.app_context():
+            db.session.info['begin_immediate'] = True
+            while True:
+                job = self._queue.get()
+                if job[4] and app.config['GROUP_COMMIT']:
+                    batch, job = self._next_batch(job)
+                    self._run_batch(batch)
+                if job is not None:
+                    self._run_one(job)
+
+    def _run_one(self, job):
+        future, func, args, kwargs, _ = job
+        if not future.set_running_or_notify_cancel():
+            return
+        self.jobs += 1
+        try:
+            result = func(*args, **kwargs)
+            db.session.commit()
+            self.commits += 1
+        except BaseException as e:
+            db.session.rollback()
+            future.set_exception(e)
+        else:
+            future.set_result(result)
+        finally:
+            # Results are handed to other threads; nothing may stay bound to this session.
+            db.session.expunge_all()
+
+    def _run_batch(self, batch):
+        outcomes = []
+        try:
+            for future, func, args, kwargs, _ in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                self.jobs += 1
+                try:
+                    with db.session.begin_nested():
+                        result = func(*args, **kwargs)
+                except Exception as e:
+                    # Rolling back the savepoint also dropped the presence
+                    # updates collected from the jobs before it.
+                    invalidate_presence(db.session)
+                    outcomes.append((future, None, e))
+                else:
+                    outcomes.append((future, result, None))
+            db.session.commit()
+            self.commits += 1
+        except BaseException as e:
+            db.session.rollback()
+            for future, _, error in outcomes:
+                future.set_exception(error or e)
+            running = {outcome[0] for outcome in outcomes}
+            for future, *_ in batch:
+                if future.running() and future not in running:
+                    future.set_exception(e)
+        else:
+            for future, result, error in outcomes:
+                if error is None:
+                    future.set_result(result)
+                else:
+                    future.set_exception(error)
+        finally:
+            db.session.expunge_all()
+
+
+write_queue = WriteQueue()
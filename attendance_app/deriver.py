@@ -0,0 +1,296 @@
+# attendance_app/deriver.py
+#
+# Folds the punch log (clock_event) into Attendance and BreakSession rows.
+#
+# derive_pending() applies the events recorded since its last run, oldest
+# punch first, on top of the current rows: a punch opens or closes a session
+# or a break, and every session it touches gets its overtime and late
+# minutes from calculate_attendance_metrics(). Punches that change nothing
+# (a second clock-in, a clock-out without a session, a scan after the day's
+# session is closed, a punch older than the day's last one) are ignored.
+# The last derived event id is kept in clock_event_cursor and claimed in the
+# same transaction as the derived rows, so each event is applied once even
+# with several processes deriving.
+#
+# The punch routes call derive_in_request() after committing their event;
+# it runs on the write queue, so concurrent requests line up behind one
+# writer and the first run applies every pending event in one transaction.
+# Requests arriving while a run is still queued wait for that run rather than
+# queueing their own; with GROUP_COMMIT on, the run is committed together
+# with the punches batched around it. With DERIVE_INLINE off, run
+# `flask derive-attendance --watch` instead.
+#
+# rebuild_attendance() re-derives every (user, day) that has clock events in
+# a date range from scratch. Only days whose rows all came from those events
+# are replaced: a day that also holds a session or break written without a
+# punch (a sheet import, an admin adding or editing a row) is left as it is,
+# since its events alone no longer describe it.
+
+import threading
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from sqlalchemy import select, update, delete, tuple_
+from sqlalchemy.dialects.sqlite import insert
+from attendance_app import app, db
+from attendance_app.models import Attendance, BreakSession, ClockEvent, ClockEventCursor
+from attendance_app.presence import Punch, attach, invalidate_presence
+from attendance_app.rollup import refresh_rollups, month_key
+from attendance_app.cache import ATTENDANCE_VERSION, bump_data_version
+from attendance_app.work_calendar import calculate_attendance_metrics
+from attendance_app.database import write_queue
+
+DERIVE_BATCH_SIZE = 1000
+REBUILD_CHUNK_SIZE = 200  # users per transaction
+PAIR_CHUNK_SIZE = 400  # (user, day) pairs per IN list: two bound variables each, SQLite allows 999 on old builds
+
+_lock = threading.Lock()
+_queued = None  # the derive_pending() run waiting on the write queue, if any
+_queued_lock = threading.Lock()
+
+
+def _transition(kind, moment, latest, open_break):
+    """The change one punch makes to a day: 'in', 'out', 'break_start', 'break_end' or None."""
+    is_open = latest is not None and latest.clock_out is None
+    if kind == 'scan':
+        kind = 'out' if is_open else ('in' if latest is None else None)
+    if kind == 'in':
+        if is_open or (latest is not None and (moment <= latest.clock_in or moment < latest.clock_out)):
+            return None
+        return 'in'
+    if kind == 'out':
+        return 'out' if is_open and moment >= latest.clock_in else None
+    if kind == 'break_start':
+        return 'break_start' if open_break is None else None
+    if kind == 'break_end':
+        return 'break_end' if open_break is not None and moment >= open_break.start_time else None
+    return None
+
+
+def _set_metrics(attendance):
+    # An open session is measured up to its clock-in: early arrival and lateness only.
+    attendance.overtime, attendance.late_minutes = calculate_attendance_metrics(
+        attendance.date, attendance.clock_in, attendance.clock_out or attendance.clock_in
+    )
+
+
+class _Day:
+    """Latest session and open break of one (user, day) while events are applied."""
+
+    def __init__(self, user_id, day, latest=None, open_break=None):
+        self.user_id, self.day = user_id, day
+        self.latest, self.open_break = latest, open_break
+        self.sessions, self.breaks = [], []
+
+    def apply(self, kind, moment):
+        change = _transition(kind, moment, self.latest, self.open_break)
+        if change == 'in':
+            self.latest = Attendance(user_id=self.user_id, date=self.day, clock_in=moment, clock_out=None)
+            _set_metrics(self.latest)
+            self.sessions.append(self.latest)
+        elif change == 'out':
+            if isinstance(self.latest, Punch):
+                self.latest = attach(self.latest)
+            self.latest.clock_out = moment
+            _set_metrics(self.latest)
+        elif change == 'break_start':
+            self.open_break = BreakSession(user_id=self.user_id, date=self.day, start_time=moment, end_time=None)
+            if self.latest is not None and self.latest.clock_out is None:
+                if isinstance(self.latest, Punch):
+                    self.open_break.attendance_id = self.latest.id
+                else:
+                    self.open_break.attendance = self.latest
+            self.breaks.append(self.open_break)
+        elif change == 'break_end':
+            self.open_break.end_time = moment
+            self.open_break = None
+        return change
+
+
+def _latest_session(user_id, day):
+    # Read inside the derive transaction, never from the presence store: that
+    # only hints the request side and can lag behind other processes' punches.
+    row = db.session.execute(
+        select(*[getattr(Attendance, field) for field in Punch._fields])
+        .where(Attendance.user_id == user_id, Attendance.date == day)
+        .order_by(Attendance.clock_in.desc(), Attendance.id.desc())
+        .limit(1)
+    ).first()
+    return Punch(*row) if row else None
+
+
+def _open_break(user_id, day):
+    return BreakSession.query.filter_by(user_id=user_id, date=day, end_time=None) \
+        .order_by(BreakSession.id.desc()).first()
+
+
+def _cursor():
+    return db.session.execute(
+        select(ClockEventCursor.last_event_id).where(ClockEventCursor.id == 1)
+    ).scalar()
+
+
+def _claim(previous, last_event_id):
+    # Moves the cursor only if no other process moved it since we read it.
+    if previous is None:
+        stmt = insert(ClockEventCursor).values(id=1, last_event_id=last_event_id, updated_at=datetime.utcnow())
+        result = db.session.execute(stmt.on_conflict_do_nothing(index_elements=['id']))
+    else:
+        result = db.session.execute(
+            update(ClockEventCursor)
+            .where(ClockEventCursor.id == 1, ClockEventCursor.last_event_id == previous)
+            .values(last_event_id=last_event_id, updated_at=datetime.utcnow())
+        )
+    return result.rowcount == 1
+
+
+def _apply_events(rows):
+    days = {}
+    for event_id, user_id, kind, occurred_at in sorted(rows, key=lambda row: (row.occurred_at, row.id)):
+        if user_id is None:
+            continue
+        day = occurred_at.date()
+        state = days.get((user_id, day))
+        if state is None:
+            state = days[user_id, day] = _Day(
+                user_id, day, _latest_session(user_id, day), _open_break(user_id, day)
+            )
+        state.apply(kind, occurred_at.time())
+    for state in days.values():
+        db.session.add_all(state.sessions + state.breaks)
+
+
+def derive_pending(batch_size=DERIVE_BATCH_SIZE, commit=True):
+    """
+    Apply every event recorded since the last run, committing per batch (or
+    only flushing, with commit=False). Returns the number applied.
+    """
+    applied = 0
+    with _lock:
+        while True:
+            previous = _cursor()
+            rows = db.session.execute(
+                select(ClockEvent.id, ClockEvent.user_id, ClockEvent.kind, ClockEvent.occurred_at)
+                .where(ClockEvent.id > (previous or 0))
+                .order_by(ClockEvent.id)
+                .limit(batch_size)
+            ).all()
+            if not rows:
+                return applied
+
+            _apply_events(rows)
+            if not _claim(previous, rows[-1].id):
+                if not commit:
+                    raise RuntimeError("clock_event_cursor moved during an uncommitted derivation")
+                db.session.rollback()  # another process derived these first
+                continue
+            if commit:
+                db.session.commit()
+            else:
+                db.session.flush()
+            applied += len(rows)
+
+
+def derive_in_request():
+    """Derive right after a punch was committed, unless left to `flask derive-attendance`."""
+    if not app.config['DERIVE_INLINE']:
+        return
+    global _queued
+    with _queued_lock:
+        # A run that has not started yet will see our event too.
+        future = _queued
+        if future is None or future.running() or future.done():
+            if app.config['GROUP_COMMIT']:
+                future = write_queue.submit(derive_pending, commit=False, grouped=True)
+            else:
+                future = write_queue.submit(derive_pending)
+            _queued = future
+    try:
+        future.result()
+    except Exception:
+        # The punch is recorded; the next run picks it up.
+        app.logger.exception("Deriving attendance from clock events failed")
+
+
+def _fold_day(user_id, day, events):
+    state = _Day(user_id, day)
+    for kind, occurred_at in events:
+        state.apply(kind, occurred_at.time())
+    return state.sessions, state.breaks
+
+
+def _pair_chunks(pairs):
+    for i in range(0, len(pairs), PAIR_CHUNK_SIZE):
+        yield pairs[i:i + PAIR_CHUNK_SIZE]
+
+
+def _pairs_in(model, pairs):
+    return tuple_(model.user_id, model.date).in_(pairs)
+
+
+def _derived_days(pairs, events):
+    """The (user, day) pairs whose every session and break starts and ends at one of the day's event times."""
+    times = {pair: {occurred_at.time() for _, occurred_at in day_events} for pair, day_events in events.items()}
+    foreign = set()
+    for model, start, end in ((Attendance, Attendance.clock_in, Attendance.clock_out),
+                              (BreakSession, BreakSession.start_time, BreakSession.end_time)):
+        for some in _pair_chunks(pairs):
+            for user_id, day, started, ended in db.session.execute(
+                select(model.user_id, model.date, start, end).where(_pairs_in(model, some))
+            ):
+                moments = times[user_id, day]
+                if started not in moments or (ended is not None and ended not in moments):
+                    foreign.add((user_id, day))
+    return [pair for pair in pairs if pair not in foreign]
+
+
+def rebuild_attendance(start_date, end_date, chunk_size=REBUILD_CHUNK_SIZE):
+    """
+    Replace the attendance and break rows of every (user, day) between the
+    dates that has clock events with rows derived from those events alone,
+    keeping the days that also hold rows written without a punch. Commits
+    per chunk of users; returns (days rebuilt, days kept).
+    """
+    start = datetime.combine(start_date, time.min)
+    end = datetime.combine(end_date + timedelta(days=1), time.min)
+    in_range = (ClockEvent.occurred_at >= start, ClockEvent.occurred_at < end, ClockEvent.user_id != None)
+
+    rebuilt = kept = 0
+    derive_pending()  # so the rebuild and later incremental runs see the same events
+    with _lock:
+        last_event_id = _cursor() or 0
+        user_ids = db.session.execute(
+            select(ClockEvent.user_id).where(*in_range).distinct().order_by(ClockEvent.user_id)
+        ).scalars().all()
+
+        for i in range(0, len(user_ids), chunk_size):
+            chunk = user_ids[i:i + chunk_size]
+            events = defaultdict(list)
+            for user_id, kind, occurred_at in db.session.execute(
+                select(ClockEvent.user_id, ClockEvent.kind, ClockEvent.occurred_at)
+                .where(*in_range, ClockEvent.user_id.in_(chunk), ClockEvent.id <= last_event_id)
+                .order_by(ClockEvent.user_id, ClockEvent.occurred_at, ClockEvent.id)
+            ):
+                events[user_id, occurred_at.date()].append((kind, occurred_at))
+            if not events:
+                continue
+
+            pairs = _derived_days(list(events), events)
+            kept += len(events) - len(pairs)
+            if not pairs:
+                continue
+            connection = db.session.connection()
+            for some in _pair_chunks(pairs):
+                connection.execute(delete(BreakSession).where(_pairs_in(BreakSession, some)))
+                connection.execute(delete(Attendance).where(_pairs_in(Attendance, some)))
+            for user_id, day in pairs:
+                sessions, breaks = _fold_day(user_id, day, events[user_id, day])
+                db.session.add_all(sessions + breaks)
+            db.session.flush()
+
+            refresh_rollups(connection, {(user_id, month_key(day)) for user_id, day in pairs})
+            bump_data_version(connection)
+            bump_data_version(connection, ATTENDANCE_VERSION)
+            invalidate_presence(db.session)
+            db.session.commit()
+            rebuilt += len(pairs)
+    return rebuilt, kept
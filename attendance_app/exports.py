@@ -0,0 +1,192 @@
+# attendance_app/exports.py
+#
+# File exports (Excel and PDF). Each export is also registered as a
+# background job kind, see attendance_app.jobs. The monthly payroll workbook
+# is streamed: rows are read in chunks and written with xlsxwriter in
+# constant_memory mode into a spooled temporary file, so memory use does not
+# depend on how many rows are exported.
+
+import io
+import tempfile
+from datetime import date
+import pandas as pd
+import xlsxwriter
+from flask import render_template
+from flask_weasyprint import HTML
+from sqlalchemy import and_
+from attendance_app.models import Attendance, LeaveRequest
+from attendance_app.jobs import job_handler
+from attendance_app.payroll import iter_rollup_payroll
+from attendance_app.rollup import month_key
+
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+PDF_MIMETYPE = 'application/pdf'
+
+# Workbooks up to this size stay in memory, larger ones go to disk.
+SPOOL_MAX_SIZE = 8 * 1024 * 1024
+
+MONTHLY_COLUMNS = [
+    ('Month', 'month'),
+    ('Employee', 'employee'),
+    ('Total Work Days', 'work_days'),
+    ('Total Hours', 'total_hours'),
+    ('Regular Hours', 'regular_hours'),
+    ('Hourly Rate', 'hourly_rate'),
+    ('Regular Pay', 'regular_pay'),
+    ('Overtime', 'overtime'),
+    ('Overtime Rate', 'overtime_rate'),
+    ('Overtime Pay', 'overtime_payment'),
+    ('Working Salary', 'working_salary'),
+    ('Deductions', 'deductions'),
+    ('Advanced Payments', 'advances'),
+    ('Total Salary', 'total_salary'),
+]
+
+MONTHLY_CURRENCY_COLUMNS = [5, 6, 8, 9, 10, 11, 12, 13]
+
+
+def _monthly_chunks(start_date, end_date, user_id, chunk_size):
+    for frame in iter_rollup_payroll(month_key(start_date), month_key(end_date), user_id, chunk_size):
+        frame['employee'] = frame['name'].where(
+            frame['name'].notna(), 'User ID ' + frame['user_id'].astype(str)
+        )
+        yield frame
+
+
+def write_monthly_payroll_xlsx(start_date, end_date, user_id=None, chunk_size=1000):
+    """
+    Write the monthly payroll workbook and return it as a file object
+    positioned at the start, or None when there are no rows.
+    """
+    # constant_memory only allows rows to be written top to bottom, so the
+    # summary above the table is computed in a first pass.
+    employees = set()
+    total_salary_sum = 0.0
+    for frame in _monthly_chunks(start_date, end_date, user_id, chunk_size):
+        employees.update(frame['employee'])
+        total_salary_sum += frame['total_salary'].sum()
+    if not employees:
+        return None
+
+    output = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    workbook = xlsxwriter.Workbook(output, {'constant_memory': True})
+    worksheet = workbook.add_worksheet('Monthly Report')
+
+    header_format = workbook.add_format({'bold': True, 'font_color': 'blue', 'font_size': 12})
+    column_header_format = workbook.add_format({'bold': True, 'border': 1, 'align': 'center', 'valign': 'top'})
+    currency_format = workbook.add_format({'num_format': '$#,##0.00'})
+    normal_format = workbook.add_format()
+
+    worksheet.write('A1', 'Summary', header_format)
+    worksheet.write('A2', 'Total Employees', normal_format)
+    worksheet.write('B2', len(employees), normal_format)
+    worksheet.write('A3', 'Sum of Total Salary', normal_format)
+    worksheet.write('B3', total_salary_sum, currency_format)
+
+    # Rows are flushed as soon as the next one starts, so column formats have
+    # to be in place first; widths are tracked while writing and set at the end.
+    for col in MONTHLY_CURRENCY_COLUMNS:
+        worksheet.set_column(col, col, 15, currency_format)
+
+    widths = [len(title) for title, _ in MONTHLY_COLUMNS]
+    for col, (title, _) in enumerate(MONTHLY_COLUMNS):
+        worksheet.write(5, col, title, column_header_format)
+
+    row = 6
+    for frame in _monthly_chunks(start_date, end_date, user_id, chunk_size):
+        columns = [frame[key].tolist() for _, key in MONTHLY_COLUMNS]
+        for values in zip(*columns):
+            for col, value in enumerate(values):
+                worksheet.write(row, col, value)
+                widths[col] = max(widths[col], len(str(value)))
+            row += 1
+
+    for col, width in enumerate(widths):
+        if col not in MONTHLY_CURRENCY_COLUMNS:
+            worksheet.set_column(col, col, width + 2)
+
+    workbook.close()
+    output.seek(0)
+    return output
+
+
+@job_handler('monthly_payroll_xlsx')
+def monthly_payroll_job(start_date, end_date, user_id=None):
+    output = write_monthly_payroll_xlsx(date.fromisoformat(start_date), date.fromisoformat(end_date), user_id)
+    if output is None:
+        raise ValueError("No monthly data found for the given filters.")
+    return output, 'monthly_report.xlsx', XLSX_MIMETYPE
+
+
+def get_daily_attendance_data(day, user_id=None):
+    query = Attendance.query.filter(Attendance.date == day)
+
+    if user_id:
+        query = query.filter(Attendance.user_id == user_id)
+
+    records = query.order_by(Attendance.clock_in).all()
+
+    data = []
+    for record in records:
+        user = record.user
+        data.append({
+            'username': user.username,
+            'name': user.name,
+            'date': record.date.strftime('%Y-%m-%d'),
+            'clock_in': record.clock_in.strftime('%H:%M') if record.clock_in else '',
+            'clock_out': record.clock_out.strftime('%H:%M') if record.clock_out else '',
+            'regular_hours': record.regular_hours or 0,
+            'overtime_hours': record.overtime or 0,
+            'late_minutes': record.late_minutes or 0
+        })
+
+    return data
+
+
+@job_handler('daily_report_pdf')
+def daily_report_pdf_job(day, user_id=None):
+    day = date.fromisoformat(day)
+    daily_data = get_daily_attendance_data(day, user_id)
+    html = render_template('daily_report_pdf.html', daily_data=daily_data, report_date=day.strftime('%Y-%m-%d'))
+    return HTML(string=html).write_pdf(), f'daily_report_{day.strftime("%Y-%m-%d")}.pdf', PDF_MIMETYPE
+
+
+@job_handler('daily_report_xlsx')
+def daily_report_xlsx_job(day, user_id=None):
+    day = date.fromisoformat(day)
+    df = pd.DataFrame(get_daily_attendance_data(day, user_id))
+
+    output = io.BytesIO()
+    with pd.ExcelWriter(output, engine='openpyxl') as writer:
+        df.to_excel(writer, index=False, sheet_name='Daily Report')
+    return output.getvalue(), f'daily_report_{day.strftime("%Y-%m-%d")}.xlsx', XLSX_MIMETYPE
+
+
+@job_handler('leave_requests')
+def leave_requests_job(file_type, user_id=None, start_date=None, end_date=None):
+    query = LeaveRequest.query
+    if user_id:
+        query = query.filter_by(user_id=user_id)
+    if start_date and end_date:
+        query = query.filter(and_(
+            LeaveRequest.start_date >= start_date,
+            LeaveRequest.end_date <= end_date
+        ))
+
+    leave_requests = query.order_by(LeaveRequest.start_date.desc()).all()
+
+    if file_type == 'excel':
+        df = pd.DataFrame([{
+            'Employee': lr.user.name if lr.user else "N/A",
+            'Start Date': lr.start_date,
+            'End Date': lr.end_date,
+            'Reason': lr.reason,
+            'Status': lr.status,
+        } for lr in leave_requests])
+        output = io.BytesIO()
+        with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
+            df.to_excel(writer, index=False, sheet_name='Leave Requests')
+        return output.getvalue(), 'leave_requests.xlsx', XLSX_MIMETYPE
+
+    html = render_template('leave_requests_pdf.html', leave_requests=leave_requests)
+    return HTML(string=html).write_pdf(), 'leave_requests.pdf', PDF_MIMETYPE
@@ -0,0 +1,94 @@
+# attendance_app/identity.py
+#
+# Process-local index of who is who: card serial number, registered device
+# id and username each map to a small Identity record, so the scan paths
+# resolve a card or phone without a user query. The index is loaded when
+# the app starts and dropped after any commit here that adds, changes or
+# deletes a user (add_user, edit_user, delete_user, assign_device,
+# reset_device, ...). Writes made by other processes (another worker, the
+# CLI) move the user version (see attendance_app/cache.py), which a request
+# checks once, at its first lookup.
+
+import threading
+from collections import namedtuple
+from sqlalchemy import event, select
+from sqlalchemy.exc import OperationalError
+from attendance_app import app, db
+from attendance_app.models import User
+from attendance_app.cache import (
+    USER_VERSION, data_version, request_version, committed_versions, bumped_in_transaction
+)
+
+Identity = namedtuple('Identity', 'id name username role')
+
+
+class IdentityIndex:
+    def __init__(self):
+        self._maps = None
+        self._version = None
+        self._lock = threading.Lock()
+
+    def load(self, version=None):
+        """Read every user once and replace the lookup maps."""
+        if version is None:
+            version = data_version(USER_VERSION)  # before the rows: a write in between only causes a reload
+        by_serial, by_device, by_username, by_id = {}, {}, {}, {}
+        rows = db.session.execute(
+            select(User.id, User.name, User.username, User.role, User.serial_number, User.device_id)
+        ).all()
+        for user_id, name, username, role, serial_number, device_id in rows:
+            identity = Identity(user_id, name, username, role)
+            by_username[username] = identity
+            by_id[user_id] = identity
+            if serial_number:
+                by_serial[serial_number] = identity
+            if device_id:
+                by_device[device_id] = identity
+        maps = (by_serial, by_device, by_username, by_id)
+        if bumped_in_transaction(db.session, USER_VERSION):
+            return maps
+        with self._lock:
+            self._maps, self._version = maps, version
+        return maps
+
+    def invalidate(self):
+        with self._lock:
+            self._maps = None
+
+    def _get_maps(self):
+        version = request_version(USER_VERSION)
+        with self._lock:
+            if self._maps is not None and self._version == version:
+                return self._maps
+        return self.load(version)
+
+    def by_serial(self, serial_number):
+        return self._get_maps()[0].get(serial_number) if serial_number else None
+
+    def by_device(self, device_id):
+        return self._get_maps()[1].get(device_id) if device_id else None
+
+    def by_username(self, username):
+        return self._get_maps()[2].get(username) if username else None
+
+    def by_id(self, user_id):
+        return self._get_maps()[3].get(user_id) if user_id else None
+
+
+identity_index = IdentityIndex()
+
+
+def load_identity_index():
+    """Fill the index at startup, so the first scan does not pay for it."""
+    with app.app_context():
+        try:
+            identity_index.load()
+        except OperationalError:
+            # No user table yet (before `flask db upgrade`): the first lookup loads it.
+            db.session.rollback()
+
+
+@event.listens_for(db.session, 'after_commit')
+def _drop_changed_users(session):
+    if committed_versions(session, USER_VERSION) is not None:
+        identity_index.invalidate()
@@ -0,0 +1,456 @@
+# attendance_app/imports.py
+#
+# Bulk imports. Uploaded sheets (.xlsx or .csv) are streamed in chunks of
+# IMPORT_CHUNK_SIZE rows by a background job, which commits and reports
+# progress after each chunk, so memory stays flat however long the file is.
+#
+# Attendance chunks are processed column by column: usernames
+# are resolved with one IN query, dates and times are parsed by pandas,
+# overtime, late minutes and the stored minute columns are computed with
+# numpy, and the rows are written with chunked executemany statements.
+#
+# Sessions are identified by their natural key (user_id, date, clock_in),
+# which has a unique index. Rows are compared with the stored sessions
+# first: 'append' mode only inserts new sessions, 'upsert' mode also
+# rewrites sessions whose values changed. Unchanged rows are never written.
+# Bulk writes bypass the ORM flush, so the payroll rollups and the data
+# version are refreshed explicitly.
+#
+# A job whose worker died is run again from the first row (see
+# attendance_app/jobs.py). Attendance rows land on their natural key, so a
+# rerun writes each one once. Advances have no natural key: each row records
+# the import job that added it, and a rerun first deletes what the earlier
+# attempt committed.
+
+import os
+import tempfile
+import time as timer
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+from sqlalchemy import select, delete
+from sqlalchemy.dialects.sqlite import insert
+from attendance_app import app, db
+from attendance_app.models import User, Attendance, AdvanceSalary
+from attendance_app.cache import ATTENDANCE_VERSION, bump_data_version
+from attendance_app.exports import SPOOL_MAX_SIZE
+from attendance_app.jobs import job_handler, report_progress, current_job_id
+from attendance_app.payroll import round2
+from attendance_app.presence import invalidate_presence
+from attendance_app.rollup import refresh_rollups, month_key
+from attendance_app.work_calendar import WORK_SCHEDULE, LATE_THRESHOLD
+
+IMPORT_CHUNK_SIZE = 5000
+IMPORT_MODES = ('append', 'upsert')
+SHEET_EXTENSIONS = {'xlsx', 'csv'}
+
+ATTENDANCE_COLUMNS = ('username', 'date', 'clock_in', 'clock_out')
+ADVANCE_COLUMNS = ('username', 'amount', 'date')
+REJECT_COLUMNS = ('row', 'username', 'amount', 'date', 'reason')
+
+NATURAL_KEY = ['user_id', 'date', 'clock_in']
+VALUE_COLUMNS = ['clock_out', 'overtime', 'late_minutes', 'worked_minutes', 'regular_minutes']
+
+# SQLite limits the number of bound parameters per statement.
+LOOKUP_CHUNK_SIZE = 500
+
+
+def _xlsx_chunks(workbook, chunk_size):
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = ['' if name is None else str(name) for name in header]
+        width = len(columns)
+        chunk, index = [], []
+        for number, row in enumerate(rows):
+            if all(value is None for value in row):
+                continue
+            # Read-only rows stop at their last filled cell.
+            chunk.append(row[:width] + (None,) * (width - len(row)))
+            index.append(number)
+            if len(chunk) == chunk_size:
+                yield pd.DataFrame(chunk, columns=columns, index=index)
+                chunk, index = [], []
+        if chunk:
+            yield pd.DataFrame(chunk, columns=columns, index=index)
+    finally:
+        workbook.close()
+
+
+def _count_lines(path):
+    with open(path, 'rb') as source:
+        return sum(block.count(b'\n') for block in iter(lambda: source.read(1024 * 1024), b''))
+
+
+def open_sheet(path, chunk_size=IMPORT_CHUNK_SIZE):
+    """
+    Open an .xlsx (first worksheet) or .csv file for streaming. Returns
+    (expected data rows or None, iterator of DataFrames of at most chunk_size
+    rows); the first row names the columns and index + 2 is the sheet row
+    number. CSV values are read as strings.
+    """
+    if path.lower().endswith('.csv'):
+        return max(_count_lines(path) - 1, 0), pd.read_csv(path, dtype=str, chunksize=chunk_size)
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    max_row = workbook.worksheets[0].max_row
+    return (max_row - 1 if max_row else None), _xlsx_chunks(workbook, chunk_size)
+
+
+def _require_columns(df, columns):
+    missing = [column for column in columns if column not in df.columns]
+    if missing:
+        raise ValueError(f"Missing column(s): {', '.join(missing)}")
+
+
+def import_file(path, import_frame, chunk_size=IMPORT_CHUNK_SIZE, **options):
+    """
+    Stream the sheet at path through import_frame(df, **options) chunk by
+    chunk, committing and reporting progress after each one. The counts
+    returned by import_frame are summed into the returned summary.
+    """
+    started = timer.perf_counter()
+    total, chunks = open_sheet(path, chunk_size)
+    summary = {'rows': 0}
+    report_progress(0, total)
+    db.session.commit()
+
+    for df in chunks:
+        for key, value in import_frame(df, **options).items():
+            if key not in ('seconds', 'rows_per_second'):
+                summary[key] = summary.get(key, 0) + value
+        report_progress(summary['rows'], total)
+        db.session.commit()
+
+    seconds = timer.perf_counter() - started
+    summary['seconds'] = seconds
+    summary['rows_per_second'] = summary['rows'] / seconds if seconds else 0.0
+    return summary
+
+
+def _seconds(value):
+    return value.hour * 3600 + value.minute * 60 + value.second
+
+
+# Per-weekday schedule in seconds since midnight; NaN marks a day off.
+_DAY_START = np.array([_seconds(s['start']) if s else np.nan for _, s in sorted(WORK_SCHEDULE.items())])
+_DAY_END = np.array([_seconds(s['end']) if s else np.nan for _, s in sorted(WORK_SCHEDULE.items())])
+_GRACE = _seconds(LATE_THRESHOLD)
+
+
+def resolve_usernames(usernames):
+    """Map usernames to user ids with one IN query per LOOKUP_CHUNK_SIZE names."""
+    usernames = list(usernames)
+    user_ids = {}
+    for offset in range(0, len(usernames), LOOKUP_CHUNK_SIZE):
+        chunk = usernames[offset:offset + LOOKUP_CHUNK_SIZE]
+        user_ids.update(db.session.execute(
+            select(User.username, User.id).where(User.username.in_(chunk))
+        ).all())
+    return user_ids
+
+
+def parse_dates(values):
+    """
+    Parse date cells (NaT when missing or invalid). The format is inferred
+    per cell, as the row-by-row import did, so a sheet mixing 2024-01-05
+    and 05/01/2024 keeps both.
+    """
+    return pd.to_datetime(values, format='mixed', errors='coerce')
+
+
+def parse_times(values):
+    """Parse HH:MM:SS values into seconds since midnight (NaN when missing or invalid)."""
+    parsed = pd.to_datetime(values.astype(str), format='%H:%M:%S', errors='coerce')
+    return (parsed.dt.hour * 3600 + parsed.dt.minute * 60 + parsed.dt.second).to_numpy(dtype='float64')
+
+
+def attendance_metrics(weekdays, clock_in, clock_out):
+    """
+    Vectorized calculate_attendance_metrics(): returns (overtime, late_minutes)
+    arrays for sessions given as weekday numbers and seconds since midnight.
+    """
+    complete = ~np.isnan(clock_in) & ~np.isnan(clock_out)
+    start = _DAY_START[weekdays]
+    end = _DAY_END[weekdays]
+    day_off = np.isnan(start)
+
+    with np.errstate(invalid='ignore'):
+        early = np.where(clock_in < start, (start - clock_in) / 3600, 0.0)
+        late_seconds = np.where(clock_in > _GRACE, clock_in - _GRACE, 0.0)
+        after_end = np.where(clock_out > end, (clock_out - end) / 3600, 0.0)
+
+    overtime = np.where(day_off, (clock_out - clock_in) / 3600, early + after_end)
+    late_minutes = np.where(day_off, 0, late_seconds // 60)
+
+    overtime = np.where(complete, round2(np.nan_to_num(overtime)), 0.0)
+    late_minutes = np.where(complete, late_minutes, 0).astype(int)
+    return overtime, late_minutes
+
+
+def attendance_minutes(clock_in, clock_out, overtime):
+    """Vectorized Attendance.compute_minutes(): (worked_minutes, regular_minutes)."""
+    complete = ~np.isnan(clock_in) & ~np.isnan(clock_out)
+    worked = np.where(complete, (clock_out - clock_in) / 60, 0.0)
+    regular = np.where((worked != 0) & (overtime != 0), worked - overtime * 60, worked)
+    return worked, regular
+
+
+def _to_time(seconds):
+    return pd.to_datetime(seconds, unit='s').dt.time.where(~np.isnan(seconds), None)
+
+
+def prepare_attendance(df):
+    """
+    Turn a sheet with username, date, clock_in and clock_out columns into
+    Attendance rows. Returns (rows DataFrame, unknown-user count, invalid count).
+    """
+    usernames = df['username'].astype(str).str.strip()
+    user_ids = resolve_usernames(usernames.unique())
+    user_id = usernames.map(user_ids)
+    known = user_id.notna()
+
+    dates = parse_dates(df['date'])
+    clock_in = parse_times(df['clock_in'])
+    clock_out = parse_times(df['clock_out'])
+
+    # clock_in is required; a present but unparseable clock_out is rejected too.
+    valid = dates.notna().to_numpy() & ~np.isnan(clock_in) & ~(np.isnan(clock_out) & df['clock_out'].notna().to_numpy())
+    keep = known.to_numpy() & valid
+
+    dates, clock_in, clock_out = dates[keep], clock_in[keep], clock_out[keep]
+    overtime, late_minutes = attendance_metrics(dates.dt.weekday.to_numpy(), clock_in, clock_out)
+    worked, regular = attendance_minutes(clock_in, clock_out, overtime)
+
+    rows = pd.DataFrame({
+        'user_id': user_id[keep].astype(int).to_numpy(),
+        'date': dates.dt.date.to_numpy(),
+        'clock_in': _to_time(pd.Series(clock_in)).to_numpy(),
+        'clock_out': _to_time(pd.Series(clock_out)).to_numpy(),
+        'overtime': overtime,
+        'late_minutes': late_minutes,
+        'worked_minutes': worked,
+        'regular_minutes': regular,
+    })
+    return rows, int((~known).sum()), int((known.to_numpy() & ~valid).sum())
+
+
+def _stored_attendance(rows):
+    """Stored sessions of the users and date range covered by rows."""
+    columns = NATURAL_KEY + VALUE_COLUMNS
+    user_ids = sorted(set(rows['user_id'].tolist()))
+    stored = []
+    for offset in range(0, len(user_ids), LOOKUP_CHUNK_SIZE):
+        stored += db.session.execute(
+            select(*[getattr(Attendance, column) for column in columns]).where(
+                Attendance.user_id.in_(user_ids[offset:offset + LOOKUP_CHUNK_SIZE]),
+                Attendance.date >= rows['date'].min(),
+                Attendance.date <= rows['date'].max(),
+            )
+        ).all()
+    return pd.DataFrame(stored, columns=columns)
+
+
+def _same(left, right):
+    return (left == right) | (left.isna() & right.isna())
+
+
+def write_attendance(rows, mode='append', chunk_size=IMPORT_CHUNK_SIZE):
+    """
+    Write prepared rows keyed on (user_id, date, clock_in) and refresh the
+    rollups they touch. Returns (inserted, updated, unchanged, differing,
+    duplicates), where differing counts the rows append mode left alone
+    although their values differ from the stored ones.
+    """
+    if mode not in IMPORT_MODES:
+        raise ValueError(f"Unknown import mode: {mode}")
+    if rows.empty:
+        return 0, 0, 0, 0, 0
+
+    # A key repeated within the sheet counts once, with its last values.
+    unique_rows = rows.drop_duplicates(NATURAL_KEY, keep='last')
+    duplicates = len(rows) - len(unique_rows)
+
+    merged = unique_rows.merge(
+        _stored_attendance(unique_rows), on=NATURAL_KEY, how='left', suffixes=('', '_stored'), indicator=True
+    )
+    new = (merged['_merge'] == 'left_only').to_numpy()
+    same = np.logical_and.reduce([
+        _same(merged[column], merged[column + '_stored']).to_numpy() for column in VALUE_COLUMNS
+    ])
+    changed = ~new & ~same
+
+    write = new | changed if mode == 'upsert' else new
+    records = merged.loc[write, NATURAL_KEY + VALUE_COLUMNS].to_dict('records')
+
+    stmt = insert(Attendance)
+    if mode == 'upsert':
+        stmt = stmt.on_conflict_do_update(
+            index_elements=NATURAL_KEY,
+            set_={column: stmt.excluded[column] for column in VALUE_COLUMNS}
+        )
+    else:
+        stmt = stmt.on_conflict_do_nothing(index_elements=NATURAL_KEY)
+
+    connection = db.session.connection()
+    for offset in range(0, len(records), chunk_size):
+        connection.execute(stmt, records[offset:offset + chunk_size])
+
+    if records:
+        written = merged.loc[write]
+        months = pd.to_datetime(written['date']).dt.strftime('%Y-%m')
+        refresh_rollups(connection, set(zip(written['user_id'].tolist(), months)))
+        bump_data_version(connection)
+        bump_data_version(connection, ATTENDANCE_VERSION)
+        invalidate_presence(db.session)
+
+    updated = int(changed.sum()) if mode == 'upsert' else 0
+    differing = int(changed.sum()) - updated
+    return int(new.sum()), updated, int((~new & same).sum()), differing, duplicates
+
+
+def import_attendance_frame(df, mode='append', chunk_size=IMPORT_CHUNK_SIZE):
+    """Import a sheet in the current transaction and return a summary dict."""
+    _require_columns(df, ATTENDANCE_COLUMNS)
+    started = timer.perf_counter()
+    rows, unknown_users, invalid = prepare_attendance(df)
+    inserted, updated, unchanged, differing, duplicates = write_attendance(rows, mode, chunk_size)
+    seconds = timer.perf_counter() - started
+    return {
+        'rows': len(df),
+        'inserted': inserted,
+        'updated': updated,
+        'unchanged': unchanged,
+        'differing': differing,
+        'duplicates': duplicates,
+        'unknown_users': unknown_users,
+        'invalid': invalid,
+        'seconds': seconds,
+        'rows_per_second': len(df) / seconds if seconds else 0.0,
+    }
+
+
+def import_advances_frame(df, rejects=None, job_id=None):
+    """
+    Add the advance salaries in a sheet with username, amount and date
+    columns with one username lookup and one bulk insert, tagged with the
+    import job_id. Rejected rows are appended to rejects as CSV (see
+    REJECT_COLUMNS) when it is given.
+    """
+    _require_columns(df, ADVANCE_COLUMNS)
+    usernames = df['username'].astype(str).str.strip()
+    user_id = usernames.map(resolve_usernames(usernames.unique()))
+    amounts = pd.to_numeric(df['amount'], errors='coerce')
+    dates = parse_dates(df['date'])
+
+    reason = pd.Series(None, index=df.index, dtype=object)
+    reason[dates.isna()] = 'invalid date'
+    reason[amounts.isna()] = 'invalid amount'
+    reason[user_id.isna()] = 'unknown user'
+    accepted = reason.isna()
+
+    records = pd.DataFrame({
+        'user_id': user_id[accepted].astype(int),
+        'amount': amounts[accepted].astype(float),
+        'date': dates[accepted].dt.date,
+        'import_job_id': job_id,
+    }).to_dict('records')
+    if records:
+        connection = db.session.connection()
+        connection.execute(insert(AdvanceSalary), records)
+        months = dates[accepted].dt.strftime('%Y-%m')
+        refresh_rollups(connection, set(zip(user_id[accepted].astype(int).tolist(), months)))
+        bump_data_version(connection)
+
+    rejected = ~accepted
+    if rejects is not None and rejected.any():
+        rejects.write(pd.DataFrame({
+            'row': df.index[rejected] + 2,
+            'username': df['username'][rejected],
+            'amount': df['amount'][rejected],
+            'date': df['date'][rejected],
+            'reason': reason[rejected],
+        }).to_csv(header=False, index=False).encode())
+
+    return {
+        'rows': len(df),
+        'imported': len(records),
+        'unknown_users': int((reason == 'unknown user').sum()),
+        'invalid': int(rejected.sum() - (reason == 'unknown user').sum()),
+    }
+
+
+def _skipped_warning(summary, invalid_what):
+    if summary.get('unknown_users') or summary.get('invalid'):
+        return (f"Skipped {summary.get('unknown_users', 0)} row(s) with unknown users and "
+                f"{summary.get('invalid', 0)} row(s) with invalid {invalid_what}.")
+    return None
+
+
+@job_handler('attendance_import')
+def attendance_import_job(path, mode='append'):
+    try:
+        summary = import_file(path, import_attendance_frame, mode=mode)
+    finally:
+        os.remove(path)
+
+    app.logger.info("Attendance import: %(inserted)d inserted, %(updated)d updated, %(unchanged)d unchanged, "
+                    "%(differing)d skipped (differs from stored) of %(rows)d rows in %(seconds).2fs "
+                    "(%(rows_per_second).0f rows/s)", summary)
+    summary['message'] = (f"{summary.get('inserted', 0)} attendance record(s) imported, "
+                          f"{summary.get('updated', 0)} updated, {summary.get('unchanged', 0)} unchanged, "
+                          f"{summary.get('differing', 0)} skipped (differs from stored) "
+                          f"({summary['rows_per_second']:,.0f} rows/s).")
+    summary['warnings'] = [warning for warning in (
+        _skipped_warning(summary, 'dates or times'),
+        f"{summary['differing']} row(s) skipped because they differ from the stored record; "
+        f"import with \"Update existing records\" to overwrite them." if summary.get('differing') else None,
+        f"{summary['duplicates']} repeated row(s) in the file were imported once." if summary.get('duplicates') else None,
+    ) if warning]
+    report_progress(summary['rows'], summary['rows'], summary)
+    db.session.commit()
+
+
+def remove_imported_advances(job_id):
+    """Delete the advances an earlier attempt of an import job committed. Does not commit."""
+    connection = db.session.connection()
+    removed = connection.execute(
+        delete(AdvanceSalary).where(AdvanceSalary.import_job_id == job_id)
+        .returning(AdvanceSalary.user_id, AdvanceSalary.date)
+    ).all()
+    if removed:
+        refresh_rollups(connection, {(user_id, month_key(day)) for user_id, day in removed})
+        bump_data_version(connection)
+        app.logger.warning("Advance import %s run again: removed %d row(s) of the earlier attempt",
+                           job_id, len(removed))
+    return len(removed)
+
+
+@job_handler('advance_import')
+def advance_import_job(path):
+    job_id = current_job_id()
+    if job_id is not None:
+        remove_imported_advances(job_id)  # committed with the first progress report
+    rejects = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    rejects.write((','.join(REJECT_COLUMNS) + '\n').encode())
+    try:
+        summary = import_file(path, import_advances_frame, rejects=rejects, job_id=job_id)
+    except Exception:
+        rejects.close()
+        raise
+    finally:
+        os.remove(path)
+
+    app.logger.info("Advance import: %(imported)d of %(rows)d rows in %(seconds).2fs", summary)
+    summary['message'] = f"{summary.get('imported', 0)} advance salary record(s) imported."
+    summary['warnings'] = [warning for warning in (_skipped_warning(summary, 'amounts or dates'),) if warning]
+    report_progress(summary['rows'], summary['rows'], summary)
+    db.session.commit()
+
+    if not summary.get('unknown_users') and not summary.get('invalid'):
+        rejects.close()
+        return None
+    rejects.seek(0)
+    return rejects, 'advance_import_rejected.csv', 'text/csv'
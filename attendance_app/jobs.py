@@ -0,0 +1,307 @@
+# attendance_app/jobs.py
+#
+# Background jobs for slow exports and imports. A request records a Job row
+# and returns at once; the job is run by a small thread pool in the web
+# process (sized by JOB_WORKERS) or by `flask run-jobs` in a separate
+# process. Finished artifacts are written to JOB_ARTIFACT_DIR and
+# downloaded by job id; long jobs report progress on their Job row.
+#
+# Jobs outlive the process that queued them. While a job runs, job_monitor
+# refreshes its heartbeat_at; a running job whose heartbeat is older than
+# JOB_STALE_SECONDS belonged to a worker that died and is queued again
+# (or failed after JOB_MAX_ATTEMPTS). A queued job sits in the executor of
+# the process that queued it, so when a web process starts it takes every
+# queued job it finds, and later any that has been waiting longer than
+# JOB_STALE_SECONDS. Claiming is atomic, so a job offered to two processes
+# still runs once.
+
+import json
+import os
+import threading
+import time as timer
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from sqlalchemy import func, select, update
+from attendance_app import app, db
+from attendance_app.models import Job
+
+JOB_HANDLERS = {}
+
+_executor = None
+_executor_lock = threading.Lock()
+_current = threading.local()
+
+# Jobs waiting in this process's executor, and jobs running in this process.
+_submitted = set()
+_running = set()
+_local_lock = threading.Lock()
+
+
+def job_handler(kind):
+    """
+    Register func as the handler for jobs of this kind. The handler is
+    called with the job params as keyword arguments and returns
+    (data, filename, mimetype), where data is bytes or a file object, or
+    None when the job leaves no artifact.
+    """
+    def decorator(func):
+        JOB_HANDLERS[kind] = func
+        return func
+    return decorator
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=app.config['JOB_WORKERS'], thread_name_prefix='job'
+            )
+        return _executor
+
+
+def artifact_path(job):
+    return os.path.join(app.config['JOB_ARTIFACT_DIR'], job.id)
+
+
+def enqueue(kind, params, user_id=None):
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f"Unknown job kind: {kind}")
+
+    job = Job(id=uuid.uuid4().hex, kind=kind, params=json.dumps(params), status='queued', user_id=user_id)
+    db.session.add(job)
+    db.session.commit()
+
+    if app.config['JOB_WORKERS'] > 0:
+        _submit(job.id)
+    return job
+
+
+def _submit(job_id):
+    with _local_lock:
+        if job_id in _submitted:
+            return
+        _submitted.add(job_id)
+    _get_executor().submit(run_job, job_id)
+
+
+def _claim(job_id):
+    """Mark a queued job running; returns its attempt number, or None if another runner has it."""
+    # Only one runner gets a queued job, whichever process it lives in.
+    now = datetime.utcnow()
+    attempt = db.session.execute(
+        update(Job)
+        .where(Job.id == job_id, Job.status == 'queued')
+        .values(status='running', started_at=now, heartbeat_at=now, attempts=Job.attempts + 1)
+        .returning(Job.attempts)
+    ).scalar()
+    db.session.commit()
+    return attempt
+
+
+def _write_artifact(job, data):
+    os.makedirs(app.config['JOB_ARTIFACT_DIR'], exist_ok=True)
+    with open(artifact_path(job), 'wb') as target:
+        if isinstance(data, bytes):
+            target.write(data)
+        else:
+            try:
+                while True:
+                    block = data.read(1024 * 1024)
+                    if not block:
+                        break
+                    target.write(block)
+            finally:
+                data.close()
+
+
+def current_job_id():
+    """The id of the job running in this thread, or None outside a job."""
+    return getattr(_current, 'job_id', None)
+
+
+def report_progress(progress, total=None, summary=None):
+    """
+    Record the running job's progress (and optionally its expected total and
+    a JSON-serializable summary). Saved by the handler's next commit, so a
+    job that commits in chunks reports each chunk as it lands.
+    """
+    job_id = current_job_id()
+    if job_id is None:
+        return
+    values = {'progress': progress, 'heartbeat_at': datetime.utcnow()}
+    if total is not None:
+        values['total'] = total
+    if summary is not None:
+        values['summary'] = json.dumps(summary)
+    db.session.execute(update(Job).where(Job.id == job_id).values(**values))
+
+
+def run_job(job_id):
+    with _local_lock:
+        _submitted.discard(job_id)
+    with app.app_context():
+        attempt = _claim(job_id)
+        if attempt is None:
+            return
+
+        job = db.session.get(Job, job_id)
+        kind, params = job.kind, job.params
+        with _local_lock:
+            _running.add(job_id)
+        job_monitor.start()
+        _current.job_id = job_id
+        try:
+            handler = JOB_HANDLERS[kind]
+            result = handler(**json.loads(params))
+            if result is not None:
+                data, filename, mimetype = result
+                _write_artifact(job, data)
+        except Exception as e:
+            db.session.rollback()
+            values = {'status': 'failed', 'error': str(e)}
+            app.logger.exception("Job %s (%s) failed", job_id, kind)
+        else:
+            values = {'status': 'done'}
+            if result is not None:
+                values.update(filename=filename, mimetype=mimetype)
+        finally:
+            _current.job_id = None
+            with _local_lock:
+                _running.discard(job_id)
+        # Unless the job was taken back as stale meanwhile and belongs to a later attempt.
+        db.session.execute(
+            update(Job)
+            .where(Job.id == job_id, Job.status == 'running', Job.attempts == attempt)
+            .values(finished_at=datetime.utcnow(), **values)
+        )
+        db.session.commit()
+
+
+def requeue_stale_jobs(now=None):
+    """
+    Take back running jobs whose heartbeat stopped: queue them again, or
+    fail them once they have used JOB_MAX_ATTEMPTS. Returns how many.
+    """
+    now = now or datetime.utcnow()
+    cutoff = now - timedelta(seconds=app.config['JOB_STALE_SECONDS'])
+    with _local_lock:
+        running = list(_running)
+    stale = (
+        Job.status == 'running',
+        func.coalesce(Job.heartbeat_at, Job.started_at) < cutoff,
+        Job.id.notin_(running),
+    )
+    if db.session.execute(select(Job.id).where(*stale).limit(1)).first() is None:
+        return 0
+    max_attempts = app.config['JOB_MAX_ATTEMPTS']
+    failed = db.session.execute(
+        update(Job)
+        .where(*stale, Job.attempts >= max_attempts)
+        .values(status='failed', error='The worker running this job stopped.', finished_at=now)
+    ).rowcount
+    requeued = db.session.execute(
+        update(Job)
+        .where(*stale, Job.attempts < max_attempts)
+        .values(status='queued', started_at=None, heartbeat_at=None, progress=0)
+    ).rowcount
+    db.session.commit()
+    if failed or requeued:
+        app.logger.warning("Took back %d stale job(s): %d queued again, %d failed", failed + requeued, requeued, failed)
+    return failed + requeued
+
+
+class JobMonitor:
+    """Heartbeats the jobs this process runs and recovers the ones other processes left behind."""
+
+    def __init__(self):
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='job-monitor', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        startup = True
+        while True:
+            try:
+                with app.app_context():
+                    self.sweep(startup)
+                startup = False
+            except Exception:
+                app.logger.exception("Job monitor sweep failed")
+            timer.sleep(app.config['JOB_HEARTBEAT_SECONDS'])
+
+    def sweep(self, startup=False):
+        now = datetime.utcnow()
+        with _local_lock:
+            running = list(_running)
+        if running:
+            db.session.execute(
+                update(Job).where(Job.id.in_(running), Job.status == 'running').values(heartbeat_at=now)
+            )
+            db.session.commit()
+        requeue_stale_jobs(now)
+        if app.config['JOB_WORKERS'] > 0:
+            # Queued jobs in nobody's executor: at startup every one we see
+            # was queued by another process, later only the ones left waiting.
+            query = select(Job.id).where(Job.status == 'queued').order_by(Job.created_at)
+            if not startup:
+                query = query.where(Job.created_at < now - timedelta(seconds=app.config['JOB_STALE_SECONDS']))
+            job_ids = db.session.execute(query).scalars().all()
+            db.session.rollback()
+            for job_id in job_ids:
+                _submit(job_id)
+
+
+job_monitor = JobMonitor()
+
+
+@app.before_request
+def _start_job_monitor():
+    if app.config['JOB_WORKERS'] > 0:
+        job_monitor.start()
+
+
+def run_queued_jobs(limit=None):
+    """Run queued jobs oldest first in this process. Returns the number run."""
+    requeue_stale_jobs()
+    query = db.session.query(Job.id).filter(Job.status == 'queued').order_by(Job.created_at)
+    if limit:
+        query = query.limit(limit)
+    job_ids = [job_id for job_id, in query.all()]
+    for job_id in job_ids:
+        run_job(job_id)
+    return len(job_ids)
+
+
+def purge_jobs(older_than):
+    """Delete finished jobs and their artifacts older than the timedelta."""
+    cutoff = datetime.utcnow() - older_than
+    jobs = Job.query.filter(Job.status.in_(('done', 'failed')), Job.created_at < cutoff).all()
+    for job in jobs:
+        try:
+            os.remove(artifact_path(job))
+        except FileNotFoundError:
+            pass
+        db.session.delete(job)
+    db.session.commit()
+    return len(jobs)
+
+
+def job_status(job):
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'error': job.error,
+        'progress': job.progress,
+        'total': job.total,
+        'summary': json.loads(job.summary) if job.summary else None,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    }
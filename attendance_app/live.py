@@ -0,0 +1,257 @@
+# attendance_app/live.py
+#
+# In-process pub/sub behind the /live/stream Server-Sent Events endpoint.
+# Each open stream is a Subscription with a bounded queue; publishing
+# encodes the event once and drops the frame into every subscriber's queue,
+# so the cost of a push is one JSON dump plus a queue put per listener
+# instead of every client polling. A subscriber that falls
+# SSE_QUEUE_SIZE events behind is dropped and its browser reconnects.
+#
+# Two kinds of events are published:
+#   token   on "qr:<kiosk>", at every QR token rotation, by token_ticker
+#   punch   on "punches", when one of today's attendance sessions is opened
+#           or closed, by punch_tailer
+#
+# punch_tailer reads the punches from the database rather than from this
+# process's sessions: while someone listens it checks the attendance version every
+# PUNCH_POLL_SECONDS and, when it moved, compares today's sessions with the
+# ones it saw last. So with several web workers every stream sees the
+# punches derived by any of them. The streams hold a worker thread each, so
+# serve them from a threaded worker class (gunicorn --threads / gthread).
+
+import json
+import queue
+import threading
+import time as timer
+from collections import defaultdict
+from datetime import date
+from sqlalchemy import select
+from attendance_app import app, db
+from attendance_app.models import Attendance
+from attendance_app.cache import ATTENDANCE_VERSION, data_version
+from attendance_app.identity import identity_index
+from attendance_app.presence import Punch
+from attendance_app.qr_tokens import issue_token
+
+SSE_QUEUE_SIZE = 100
+SSE_KEEPALIVE = 15  # seconds between comment lines on an idle stream
+SSE_MAX_AGE = 300  # seconds before a stream is closed and the browser reconnects
+SSE_RETRY_MS = 3000
+PUNCH_POLL_SECONDS = 1
+
+PUNCH_TOPIC = 'punches'
+QR_TOPIC_PREFIX = 'qr:'
+
+
+def sse_frame(event_name, data):
+    return f"event: {event_name}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+class Subscription:
+    def __init__(self, topics, maxsize=SSE_QUEUE_SIZE):
+        self.topics = frozenset(topics)
+        self.dropped = False
+        self._queue = queue.Queue(maxsize)
+
+    def put(self, frame):
+        try:
+            self._queue.put_nowait(frame)
+            return True
+        except queue.Full:
+            self.dropped = True
+            return False
+
+    def get(self, timeout=None):
+        """The next frame, or None if nothing arrived within timeout."""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class Broker:
+    def __init__(self, queue_size=SSE_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._topics = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, topics):
+        subscription = Subscription(topics, self.queue_size)
+        with self._lock:
+            for topic in subscription.topics:
+                self._topics[topic].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for topic in subscription.topics:
+                subscribers = self._topics.get(topic)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._topics[topic]
+
+    def topics(self):
+        with self._lock:
+            return list(self._topics)
+
+    def subscribers(self, topic):
+        with self._lock:
+            return len(self._topics.get(topic, ()))
+
+    def publish(self, topic, event_name, data):
+        """Queue an event for every subscriber of topic; returns how many got it."""
+        with self._lock:
+            subscribers = list(self._topics.get(topic, ()))
+        if not subscribers:
+            return 0
+        frame = sse_frame(event_name, data)
+        delivered = 0
+        for subscription in subscribers:
+            if subscription.put(frame):
+                delivered += 1
+            else:
+                self.unsubscribe(subscription)
+        return delivered
+
+
+broker = Broker()
+
+
+def stream(subscription, initial=(), max_age=SSE_MAX_AGE, keepalive=SSE_KEEPALIVE):
+    """
+    Generator of SSE text for a response body; unsubscribes when the client
+    goes away. A generator closed before its first read never gets here, so
+    the response must also unsubscribe on close (see the /live/stream route).
+    """
+    deadline = timer.monotonic() + max_age
+    try:
+        yield f"retry: {SSE_RETRY_MS}\n\n"
+        for frame in initial:
+            yield frame
+        while not subscription.dropped:
+            remaining = deadline - timer.monotonic()
+            if remaining <= 0:
+                return
+            frame = subscription.get(min(keepalive, remaining))
+            yield frame if frame is not None else ": keepalive\n\n"
+    finally:
+        broker.unsubscribe(subscription)
+
+
+class TokenTicker:
+    """Publishes each kiosk's new QR token when the token window rolls over."""
+
+    def __init__(self):
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='qr-token-ticker', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            seconds = app.config['QR_TOKEN_SECONDS']
+            timer.sleep(seconds - timer.time() % seconds + 0.01)
+            for topic in broker.topics():
+                if topic.startswith(QR_TOPIC_PREFIX):
+                    kiosk_id = topic[len(QR_TOPIC_PREFIX):]
+                    broker.publish(topic, 'token', {'kiosk': kiosk_id, 'token': issue_token(kiosk_id)})
+
+
+token_ticker = TokenTicker()
+
+
+def token_event(kiosk_id):
+    """The frame a new kiosk stream starts with."""
+    return sse_frame('token', {'kiosk': kiosk_id, 'token': issue_token(kiosk_id)})
+
+
+def _punch_data(attendance, kind):
+    """An 'in' event carries the clock-in only; clock-out, overtime and lateness come with 'out'."""
+    identity = identity_index.by_id(attendance.user_id)
+    data = {
+        'kind': kind,
+        'user_id': attendance.user_id,
+        'name': (identity.name or identity.username) if identity else None,
+        'date': attendance.date.isoformat(),
+        'clock_in': attendance.clock_in.strftime('%H:%M') if attendance.clock_in else None,
+    }
+    if kind == 'out':
+        data.update(
+            clock_out=attendance.clock_out.strftime('%H:%M'),
+            overtime=attendance.overtime or 0,
+            late_minutes=attendance.late_minutes or 0,
+        )
+    return data
+
+
+class PunchTailer:
+    """Publishes today's opened and closed sessions, as committed by any process."""
+
+    def __init__(self):
+        self._thread = None
+        self._lock = threading.Lock()
+        self._poll_lock = threading.Lock()
+        self._version = None
+        self._day = None
+        self._sessions = {}
+
+    def start(self):
+        """Start tailing; call with an app context, after subscribing to PUNCH_TOPIC."""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='punch-tailer', daemon=True)
+                self._thread.start()
+        # Take the snapshot now, so punches made before the first poll are news.
+        with self._poll_lock:
+            if self._day is None:
+                self._poll()
+
+    def poll(self):
+        """The punch events since the last poll; the first one only takes a snapshot."""
+        with self._poll_lock:
+            return self._poll()
+
+    def _poll(self):
+        today = date.today()
+        version = data_version(ATTENDANCE_VERSION)  # before the rows, so a commit in between is seen next time
+        if version == self._version and today == self._day:
+            return []
+        rows = db.session.execute(
+            select(*[getattr(Attendance, field) for field in Punch._fields]).where(Attendance.date == today)
+        ).all()
+        sessions = {row.id: Punch(*row) for row in rows}
+        events = []
+        if today == self._day:
+            for row_id, row in sessions.items():
+                seen = self._sessions.get(row_id)
+                if seen is None:
+                    # Opened since the last poll, and maybe closed again too.
+                    events.append(_punch_data(row, 'in'))
+                if row.clock_out is not None and (seen is None or row.clock_out != seen.clock_out):
+                    events.append(_punch_data(row, 'out'))
+        self._version, self._day, self._sessions = version, today, sessions
+        return events
+
+    def _run(self):
+        while True:
+            timer.sleep(PUNCH_POLL_SECONDS)
+            if not broker.subscribers(PUNCH_TOPIC):
+                # Nobody to tell; start from a fresh snapshot when someone listens again.
+                with self._poll_lock:
+                    if not broker.subscribers(PUNCH_TOPIC):
+                        self._version = self._day = None
+                continue
+            try:
+                with app.app_context():
+                    for data in self.poll():
+                        broker.publish(PUNCH_TOPIC, 'punch', data)
+            except Exception:
+                app.logger.exception("Reading punches for the live stream failed")
+
+
+punch_tailer = PunchTailer()
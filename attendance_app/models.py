@@ -1,4 +1,5 @@
 from datetime import datetime, time, date
+from sqlalchemy import event
 from attendance_app import db, login_manager
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
@@ -25,6 +26,11 @@ class User(UserMixin, db.Model):
         return self.password == password
 
 class Attendance(db.Model):
+    __table_args__ = (
+        db.Index('uq_attendance_user_date_clock_in', 'user_id', 'date', 'clock_in', unique=True),
+        db.Index('ix_attendance_date', 'date'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     date = db.Column(db.Date, nullable=False)
@@ -32,32 +38,70 @@ class Attendance(db.Model):
     clock_out = db.Column(db.Time, nullable=True)
     overtime = db.Column(db.Float)
     late_minutes = db.Column(db.Integer)
+    worked_minutes = db.Column(db.Float)
+    regular_minutes = db.Column(db.Float)
     
     user = db.relationship('User', backref='attendances')
 
+    @staticmethod
+    def compute_hours(day, clock_in, clock_out, overtime):
+        """Return (total_hours, regular_hours) for a single session."""
+        total_hours = 0.0
+        if clock_in and clock_out:
+            start = datetime.combine(day, clock_in)
+            end = datetime.combine(day, clock_out)
+            duration = end - start
+            total_hours = round(duration.total_seconds() / 3600, 2)
+        if total_hours and overtime:
+            return total_hours, round(total_hours - overtime, 2)
+        return total_hours, total_hours or 0.0
+
+    @staticmethod
+    def compute_minutes(day, clock_in, clock_out, overtime):
+        """Return (worked_minutes, regular_minutes) for a single session."""
+        if not (clock_in and clock_out):
+            return 0.0, 0.0
+        worked = (datetime.combine(day, clock_out) - datetime.combine(day, clock_in)).total_seconds() / 60
+        if worked and overtime:
+            return worked, worked - overtime * 60
+        return worked, worked
+
     @property
     def total_hours(self):
-        if self.clock_in and self.clock_out:
-            start = datetime.combine(self.date, self.clock_in)
-            end = datetime.combine(self.date, self.clock_out)
-            duration = end - start
-            return round(duration.total_seconds() / 3600, 2)
-        return 0.0  
+        return self.compute_hours(self.date, self.clock_in, self.clock_out, self.overtime)[0]
+
     @property
     def regular_hours(self):
-        if self.total_hours and self.overtime:
-            return round(self.total_hours - self.overtime, 2)
-        return self.total_hours or 0.0
+        return self.compute_hours(self.date, self.clock_in, self.clock_out, self.overtime)[1]
+
+@event.listens_for(Attendance, 'before_insert')
+@event.listens_for(Attendance, 'before_update')
+def _store_attendance_minutes(mapper, connection, target):
+    target.worked_minutes, target.regular_minutes = Attendance.compute_minutes(
+        target.date, target.clock_in, target.clock_out, target.overtime
+    )
 
 class AdvanceSalary(db.Model):
+    __table_args__ = (
+        db.Index('ix_advance_salary_user_date', 'user_id', 'date'),
+        db.Index('ix_advance_salary_date', 'date'),
+        db.Index('ix_advance_salary_import_job', 'import_job_id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     amount = db.Column(db.Float, nullable=False)
     date = db.Column(db.Date, default=date.today)
+    import_job_id = db.Column(db.String(32))  # the import job that added the row, see attendance_app/imports.py
     user = db.relationship('User', backref='advances')
 
 class BreakSession(db.Model):
     __tablename__ = 'break_session'
+    __table_args__ = (
+        db.Index('ix_break_session_user_date', 'user_id', 'date'),
+        db.Index('ix_break_session_date', 'date'),
+        db.Index('ix_break_session_attendance_id', 'attendance_id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -71,9 +115,9 @@ class BreakSession(db.Model):
 
     @property
     def duration_minutes(self):
-        if self.break_start and self.break_end:
-            start = datetime.combine(date.today(), self.break_start)
-            end = datetime.combine(date.today(), self.break_end)
+        if self.start_time and self.end_time:
+            start = datetime.combine(date.today(), self.start_time)
+            end = datetime.combine(date.today(), self.end_time)
             return round((end - start).total_seconds() / 60)
         return 0
 
@@ -95,6 +139,11 @@ class Overtime(db.Model):
     reason = db.Column(db.String(255))
 
 class Deduction(db.Model):
+    __table_args__ = (
+        db.Index('ix_deduction_user_date', 'user_id', 'date'),
+        db.Index('ix_deduction_date', 'date'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     amount = db.Column(db.Float, nullable=False)
@@ -102,8 +151,89 @@ class Deduction(db.Model):
     date = db.Column(db.Date, default=date.today)
     user = db.relationship('User', backref='deductions')
 
+# No longer written: kiosk QR tokens are signed and checked without a table
+# (attendance_app/qr_tokens.py). Kept so existing databases still migrate.
 class QRCodeToken(db.Model):
+    # One row per (kiosk token, user) redemption, see attendance_app/qr_tokens.py.
     id = db.Column(db.Integer, primary_key=True)
     token = db.Column(db.String(64), unique=True, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    used = db.Column(db.Boolean, default=False)    
\ No newline at end of file
+    used = db.Column(db.Boolean, default=False)    
+
+class Holiday(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    date = db.Column(db.Date, unique=True, nullable=False)
+    name = db.Column(db.String(150))
+
+class PayrollRollup(db.Model):
+    __tablename__ = 'payroll_rollup'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'month', name='uq_payroll_rollup_user_month'),
+        db.Index('ix_payroll_rollup_month', 'month'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    month = db.Column(db.String(7), nullable=False)  # YYYY-MM
+    work_days = db.Column(db.Integer, default=0)
+    total_hours = db.Column(db.Float, default=0.0)
+    regular_hours = db.Column(db.Float, default=0.0)
+    overtime = db.Column(db.Float, default=0.0)
+    deductions = db.Column(db.Float, default=0.0)
+    advances = db.Column(db.Float, default=0.0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    user = db.relationship('User', backref=db.backref('payroll_rollups', cascade='all, delete-orphan'))
+
+class DataVersion(db.Model):
+    __tablename__ = 'data_version'
+
+    id = db.Column(db.Integer, primary_key=True)  # one row per scope, see attendance_app/cache.py
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class Job(db.Model):
+    __table_args__ = (
+        db.Index('ix_job_status_created', 'status', 'created_at'),
+    )
+
+    id = db.Column(db.String(32), primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    params = db.Column(db.Text, nullable=False, default='{}')  # JSON
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, done, failed
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    heartbeat_at = db.Column(db.DateTime)  # refreshed while running, see attendance_app/jobs.py
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    finished_at = db.Column(db.DateTime)
+    error = db.Column(db.Text)
+    filename = db.Column(db.String(255))
+    mimetype = db.Column(db.String(100))
+    progress = db.Column(db.Integer, nullable=False, default=0)  # rows processed so far
+    total = db.Column(db.Integer)  # rows expected, when known
+    summary = db.Column(db.Text)  # JSON
+
+    user = db.relationship('User', backref=db.backref('jobs', cascade='all, delete-orphan'))
+
+class ClockEvent(db.Model):
+    __tablename__ = 'clock_event'
+    __table_args__ = (
+        db.Index('ix_clock_event_user_occurred', 'user_id', 'occurred_at'),
+        db.Index('ix_clock_event_occurred', 'occurred_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    key = db.Column(db.String(64), unique=True, nullable=False)  # idempotency key
+    kind = db.Column(db.String(20), nullable=False, default='scan', server_default='scan')  # scan, in, out, break_start, break_end
+    reader_id = db.Column(db.String(64), nullable=False)  # NFC reader id, or web / qr / backfill
+    serial_number = db.Column(db.String(255))
+    occurred_at = db.Column(db.DateTime, nullable=False)
+    received_at = db.Column(db.DateTime, default=datetime.utcnow)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))  # None for unknown cards
+
+class ClockEventCursor(db.Model):
+    __tablename__ = 'clock_event_cursor'
+
+    id = db.Column(db.Integer, primary_key=True)  # single row, id = 1
+    last_event_id = db.Column(db.Integer, nullable=False, default=0)  # events up to here are derived
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
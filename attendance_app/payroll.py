@@ -0,0 +1,157 @@
+# attendance_app/payroll.py
+#
+# Columnar payroll calculator. Attendance is loaded for a date range as
+# pandas columns and every employee-month is computed with vectorized
+# operations; the resulting DataFrame feeds the HTML report, the Excel
+# export and the printable monthly report.
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import select, cast, String
+from attendance_app import db
+from attendance_app.models import User, Attendance, PayrollRollup
+from attendance_app.work_calendar import get_expected_regular_hours
+
+OVERTIME_RATE_MULTIPLIER = 1.5
+
+HOURS_COLUMNS = ['user_id', 'month', 'work_days', 'total_hours', 'regular_hours', 'overtime']
+
+PAYROLL_COLUMNS = [
+    'month', 'user_id', 'name', 'work_days', 'total_hours', 'regular_hours', 'overtime',
+    'hourly_rate', 'regular_pay', 'overtime_rate', 'overtime_payment',
+    'deductions', 'advances', 'total_salary', 'working_salary',
+]
+
+
+def round2(values):
+    """Vectorized equivalent of round(x, 2) for every element of values."""
+    values = np.asarray(values, dtype='float64')
+    scaled = values * 100
+    result = np.rint(scaled) / 100
+
+    # x * 100 can land next to .5 and round the other way than Python's
+    # correctly-rounded round(); settle those few elements one by one.
+    near_half = np.abs(np.abs(scaled - np.trunc(scaled)) - 0.5) < 1e-6
+    if near_half.any():
+        result[near_half] = [round(float(v), 2) for v in values[near_half]]
+    return result
+
+
+def load_attendance_frame(start_date, end_date, user_id=None):
+    # Durations are read from the stored minute columns; dates are fetched
+    # as text so that pandas can parse the whole column at once.
+    stmt = select(
+        Attendance.user_id,
+        cast(Attendance.date, String).label('date'),
+        Attendance.overtime,
+        Attendance.worked_minutes,
+        Attendance.regular_minutes,
+    ).where(
+        Attendance.date >= start_date,
+        Attendance.date <= end_date,
+        Attendance.user_id != None
+    )
+    if user_id is not None:
+        stmt = stmt.where(Attendance.user_id == user_id)
+
+    frame = pd.read_sql(stmt, db.session.connection())
+    frame['date'] = pd.to_datetime(frame['date'])
+    frame['overtime'] = frame['overtime'].fillna(0)
+    frame['total_hours'] = frame.pop('worked_minutes').fillna(0) / 60
+    frame['regular_hours'] = frame.pop('regular_minutes').fillna(0) / 60
+    return frame
+
+
+def monthly_hours(frame):
+    """Sum an attendance frame into one row per (user_id, month)."""
+    if frame.empty:
+        return pd.DataFrame(columns=HOURS_COLUMNS)
+
+    frame = frame.assign(month=frame['date'].dt.strftime('%Y-%m'))
+    return frame.groupby(['user_id', 'month'], sort=True).agg(
+        work_days=('date', 'nunique'),
+        total_hours=('total_hours', 'sum'),
+        regular_hours=('regular_hours', 'sum'),
+        overtime=('overtime', 'sum'),
+    ).reset_index()
+
+
+def payroll_frame(hours):
+    """
+    Compute pay for every row of hours, which needs month, salary,
+    regular_hours, overtime, deductions and advances columns.
+    """
+    if hours.empty:
+        return pd.DataFrame(columns=PAYROLL_COLUMNS)
+
+    months = hours['month'].unique()
+    expected = {m: get_expected_regular_hours(*map(int, m.split('-'))) for m in months}
+    expected_hours = hours['month'].map(expected).to_numpy(dtype='float64')
+
+    salary = hours['salary'].fillna(0).to_numpy(dtype='float64')
+    regular_hours = hours['regular_hours'].fillna(0).to_numpy(dtype='float64')
+    overtime = hours['overtime'].fillna(0).to_numpy(dtype='float64')
+    deductions = hours['deductions'].fillna(0).to_numpy(dtype='float64')
+    advances = hours['advances'].fillna(0).to_numpy(dtype='float64')
+
+    hourly_rate = np.divide(salary, expected_hours, out=np.zeros_like(salary), where=expected_hours > 0)
+    regular_pay = regular_hours * hourly_rate
+    overtime_rate = hourly_rate * OVERTIME_RATE_MULTIPLIER
+    overtime_payment = overtime * overtime_rate
+    working_salary = regular_pay + overtime_payment
+
+    result = pd.DataFrame({
+        'month': hours['month'].to_numpy(),
+        'user_id': hours['user_id'].to_numpy(),
+        'name': hours['name'].to_numpy() if 'name' in hours else None,
+        'work_days': hours['work_days'].fillna(0).astype(int).to_numpy(),
+        'total_hours': round2(hours['total_hours'].fillna(0)),
+        'regular_hours': round2(regular_hours),
+        'overtime': round2(overtime),
+        'hourly_rate': round2(hourly_rate),
+        'regular_pay': round2(regular_pay),
+        'overtime_rate': round2(overtime_rate),
+        'overtime_payment': round2(overtime_payment),
+        'deductions': round2(deductions),
+        'advances': round2(advances),
+        'total_salary': round2(working_salary - deductions - advances),
+        'working_salary': round2(working_salary),
+    })
+    return result[PAYROLL_COLUMNS]
+
+
+def _rollup_statement(start_month, end_month, user_id=None, include_empty=False):
+    stmt = select(
+        PayrollRollup.month,
+        PayrollRollup.user_id,
+        User.name,
+        User.salary_per_month.label('salary'),
+        PayrollRollup.work_days,
+        PayrollRollup.total_hours,
+        PayrollRollup.regular_hours,
+        PayrollRollup.overtime,
+        PayrollRollup.deductions,
+        PayrollRollup.advances,
+    ).outerjoin(User, User.id == PayrollRollup.user_id).where(
+        PayrollRollup.month >= start_month,
+        PayrollRollup.month <= end_month,
+    ).order_by(PayrollRollup.month, PayrollRollup.user_id)
+    if not include_empty:
+        stmt = stmt.where(PayrollRollup.work_days > 0)
+    if user_id is not None:
+        stmt = stmt.where(PayrollRollup.user_id == user_id)
+    return stmt
+
+
+def rollup_payroll_frame(start_month, end_month, user_id=None, include_empty=False):
+    """Payroll for every rolled-up employee-month between two YYYY-MM keys."""
+    stmt = _rollup_statement(start_month, end_month, user_id, include_empty)
+    return payroll_frame(pd.read_sql(stmt, db.session.connection()))
+
+
+def iter_rollup_payroll(start_month, end_month, user_id=None, chunk_size=1000):
+    """Like rollup_payroll_frame, but yields the result in frames of chunk_size rows."""
+    stmt = _rollup_statement(start_month, end_month, user_id)
+    connection = db.session.connection().execution_options(stream_results=True)
+    for chunk in pd.read_sql(stmt, connection, chunksize=chunk_size):
+        yield payroll_frame(chunk)
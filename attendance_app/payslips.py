@@ -0,0 +1,117 @@
+# attendance_app/payslips.py
+#
+# Bulk payslips. Figures for every employee come from one aggregated pass
+# (reports.employees_month); the print_monthly_report.html pages are
+# rendered to HTML and converted to PDF, then packed into a ZIP or merged
+# into a single PDF.
+#
+# The conversion runs in this process unless workers > 1 is asked for
+# (`flask generate-payslips --workers N`). The pool then starts fresh
+# interpreters with the spawn method: forking a web worker that has other
+# threads running would copy whatever locks they held. Each child imports
+# the app once, so a pool only pays off for large batches.
+
+import io
+import multiprocessing
+import tempfile
+import zipfile
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from flask import render_template
+from werkzeug.utils import secure_filename
+from attendance_app.exports import PDF_MIMETYPE, SPOOL_MAX_SIZE
+from attendance_app.jobs import job_handler
+from attendance_app.reports import employees_month
+
+PAYSLIP_FORMATS = ('zip', 'pdf')
+
+PayslipUser = namedtuple('PayslipUser', 'id name salary_per_month')
+
+
+def payslip_context(user, row, year, month):
+    """Template arguments for print_monthly_report.html."""
+    return {
+        'user': user,
+        'fixed_salary': user.salary_per_month,
+        'report_month': datetime(year, month, 1).strftime("%B %Y"),  # e.g. "June 2025"
+        'total_hours': row['total_hours'],
+        'regular_hours': row['regular_hours'],
+        'overtime_hours': row['overtime'],
+        'hourly_rate': row['hourly_rate'],
+        'overtime_rate': row['overtime_rate'],
+        'regular_pay': row['regular_pay'],
+        'overtime_pay': row['overtime_payment'],
+        'deductions': row['deductions'],
+        'advances': row['advances'],
+        'total_salary': row['total_salary'],
+        'working_salary': row['working_salary'],
+        'currency': "$",
+    }
+
+
+def _write_pdf(html):
+    from weasyprint import HTML
+    return HTML(string=html).write_pdf()
+
+
+def render_pdfs(htmls, workers=1):
+    """Convert HTML documents to PDF bytes, keeping their order; in a spawned pool if workers > 1."""
+    workers = min(workers or 1, len(htmls))
+    if workers <= 1:
+        return [_write_pdf(html) for html in htmls]
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        chunksize = max(1, len(htmls) // (workers * 4))
+        return list(pool.map(_write_pdf, htmls, chunksize=chunksize))
+
+
+def _merge_pdfs(pdfs, output):
+    from pypdf import PdfWriter
+
+    writer = PdfWriter()
+    for pdf in pdfs:
+        writer.append(io.BytesIO(pdf))
+    writer.write(output)
+
+
+def build_payslips(year, month, output_format='zip', user_ids=None, workers=1):
+    """
+    Render the payslips of every employee for one month. Returns
+    (file object, filename, mimetype), or None when there are no employees.
+    """
+    if output_format not in PAYSLIP_FORMATS:
+        raise ValueError(f"Unsupported payslip format: {output_format}")
+
+    rows = employees_month(year, month, user_ids)
+    if not rows:
+        return None
+
+    htmls = []
+    for row in rows:
+        user = PayslipUser(row['user_id'], row['name'], row['salary'])
+        htmls.append(render_template('print_monthly_report.html', **payslip_context(user, row, year, month)))
+    pdfs = render_pdfs(htmls, workers)
+
+    month_str = f"{year:04d}-{month:02d}"
+    output = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    if output_format == 'pdf':
+        _merge_pdfs(pdfs, output)
+        filename, mimetype = f'payslips_{month_str}.pdf', PDF_MIMETYPE
+    else:
+        with zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) as archive:
+            for row, pdf in zip(rows, pdfs):
+                name = secure_filename(row['name'] or '') or 'employee'
+                archive.writestr(f"payslip_{month_str}_{row['user_id']}_{name}.pdf", pdf)
+        filename, mimetype = f'payslips_{month_str}.zip', 'application/zip'
+
+    output.seek(0)
+    return output, filename, mimetype
+
+
+@job_handler('payslips')
+def payslips_job(month, output_format='zip'):
+    year, month_num = map(int, month.split('-'))
+    result = build_payslips(year, month_num, output_format)
+    if result is None:
+        raise ValueError("No employees found.")
+    return result
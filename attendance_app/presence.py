@@ -0,0 +1,158 @@
+# attendance_app/presence.py
+#
+# Who is clocked in today. The punch routes (clock_in, clock_out,
+# attendance_scan, scan_page, process_attendance) used to query Attendance
+# for the user's session before every punch; they now ask this process-local
+# store, which holds each user's latest session of the day. It is read from
+# the database on first use and at the start of each day, and kept current
+# from the session events of every committed Attendance write. Bulk writes
+# that bypass the ORM call invalidate_presence(). A request checks the
+# attendance version (attendance_app/cache.py) once, at its first lookup: if
+# another process has written attendance since the store was loaded, the day
+# is read again. Commits made here advance the store's version along with its
+# contents.
+
+import threading
+from collections import namedtuple
+from datetime import date
+from sqlalchemy import event, select
+from sqlalchemy.orm import make_transient_to_detached
+from attendance_app import db
+from attendance_app.models import Attendance
+from attendance_app.cache import (
+    ATTENDANCE_VERSION, data_version, request_version, committed_versions, bumped_in_transaction
+)
+
+Punch = namedtuple('Punch', 'id user_id date clock_in clock_out overtime late_minutes')
+
+_PUNCH_COLUMNS = [getattr(Attendance, field) for field in Punch._fields]
+
+
+def _is_later(punch, other):
+    return other is None or (punch.clock_in, punch.id) >= (other.clock_in, other.id)
+
+
+class PresenceStore:
+    def __init__(self):
+        self._day = None
+        self._latest = {}
+        self._version = None
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def load(self, day=None, version=None):
+        """Read the day's sessions once, keeping each user's latest."""
+        day = day or date.today()
+        generation = self._generation
+        if version is None:
+            version = data_version(ATTENDANCE_VERSION)  # before the rows: a write in between only causes a reload
+        latest = {}
+        rows = db.session.execute(select(*_PUNCH_COLUMNS).where(Attendance.date == day)).all()
+        for row in rows:
+            punch = Punch(*row)
+            if punch.user_id is not None and _is_later(punch, latest.get(punch.user_id)):
+                latest[punch.user_id] = punch
+        if bumped_in_transaction(db.session, ATTENDANCE_VERSION):
+            return latest
+        with self._lock:
+            self._day, self._latest = day, latest
+            # Invalidated while reading: use this state once, then reload.
+            self._version = version if generation == self._generation else None
+        return latest
+
+    def invalidate(self):
+        with self._lock:
+            self._day = None
+            self._generation += 1
+
+    def latest(self, user_id):
+        """The user's latest session today as a Punch, or None."""
+        today = date.today()
+        version = request_version(ATTENDANCE_VERSION)
+        with self._lock:
+            if self._day == today and self._version == version:
+                return self._latest.get(user_id)
+        return self.load(today, version).get(user_id)
+
+    def open_session(self, user_id):
+        """The user's open session today as a Punch, or None."""
+        punch = self.latest(user_id)
+        return punch if punch is not None and punch.clock_out is None else None
+
+    def apply(self, punches, deleted_ids, versions=None):
+        """
+        Fold committed writes into the store. versions is what
+        committed_versions() reported for their transaction.
+        """
+        with self._lock:
+            self._generation += 1  # a load already under way may predate these writes
+            if self._day is None:
+                return
+            if versions is not None:
+                if versions is False or versions[0] != self._version:
+                    # Someone else wrote in between: read the day again.
+                    self._day = None
+                    return
+                self._version = versions[1]
+            held = {punch.id: punch for punch in self._latest.values()}
+            moved = any(
+                punch.id in held and held[punch.id][1:4] != punch[1:4]  # user_id, date, clock_in
+                for punch in punches
+            )
+            if moved or deleted_ids & held.keys():
+                # A tracked session was deleted or re-keyed: read the day again.
+                self._day = None
+                return
+            for punch in punches:
+                if punch.date == self._day and punch.user_id is not None:
+                    current = self._latest.get(punch.user_id)
+                    if (current is not None and current.id == punch.id) or _is_later(punch, current):
+                        self._latest[punch.user_id] = punch
+
+
+presence = PresenceStore()
+
+
+def invalidate_presence(session):
+    """Reload the store after session commits a write that bypassed the ORM."""
+    session.info['presence_stale'] = True
+
+
+def attach(punch):
+    """
+    Persistent Attendance for a Punch without reading the row again; only
+    the columns changed afterwards are written on flush.
+    """
+    attendance = Attendance(**punch._asdict())
+    make_transient_to_detached(attendance)
+    return db.session.merge(attendance, load=False)
+
+
+@event.listens_for(db.session, 'after_flush')
+def _collect_punches(session, flush_context):
+    punches = session.info.setdefault('presence_punches', [])
+    deleted_ids = session.info.setdefault('presence_deleted', set())
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, Attendance):
+            punches.append(Punch(*(getattr(obj, field) for field in Punch._fields)))
+    for obj in session.deleted:
+        if isinstance(obj, Attendance):
+            deleted_ids.add(obj.id)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _apply_punches(session):
+    punches = session.info.pop('presence_punches', [])
+    deleted_ids = session.info.pop('presence_deleted', set())
+    versions = committed_versions(session, ATTENDANCE_VERSION)
+    if session.info.pop('presence_stale', False):
+        presence.invalidate()
+    elif punches or deleted_ids or versions is not None:
+        presence.apply(punches, deleted_ids, versions)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_punches(session):
+    session.info.pop('presence_punches', None)
+    session.info.pop('presence_deleted', None)
+    session.info.pop('presence_stale', None)
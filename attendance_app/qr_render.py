@@ -0,0 +1,86 @@
+# attendance_app/qr_render.py
+#
+# QR codes rendered in-process, as PNG or SVG. The module matrix comes from
+# qrcode; the PNG is drawn from it in one Pillow resize rather than module
+# by module, and the SVG is one <path> of horizontal runs. Rendered images
+# are kept in a small LRU cache keyed on (payload, format), so the static
+# QR and every kiosk showing the same token are served from memory.
+# prerender_qr() renders a payload on a background thread ahead of time;
+# the kiosk routes use it for the next token window, so the refresh after a
+# rotation is a cache hit as well.
+
+import io
+from concurrent.futures import ThreadPoolExecutor
+import qrcode
+from PIL import Image
+from flask import make_response
+from attendance_app.cache import ResultCache
+
+QR_RENDER_CACHE_SIZE = 64
+QR_BOX_SIZE = 10  # pixels per module in PNGs
+QR_BORDER = 4  # modules of quiet zone
+
+QR_FORMATS = {'png': 'image/png', 'svg': 'image/svg+xml'}
+
+qr_cache = ResultCache(maxsize=QR_RENDER_CACHE_SIZE)
+_prerender = ThreadPoolExecutor(max_workers=1, thread_name_prefix='qr-prerender')
+
+
+def qr_matrix(payload):
+    """Rows of booleans (True = dark), quiet zone included."""
+    qr = qrcode.QRCode(border=QR_BORDER)
+    qr.add_data(payload)
+    qr.make(fit=True)
+    return qr.get_matrix()
+
+
+def _render_png(matrix):
+    size = len(matrix)
+    pixels = bytes(0 if dark else 255 for row in matrix for dark in row)
+    image = Image.frombytes('L', (size, size), pixels).convert('1')
+    image = image.resize((size * QR_BOX_SIZE, size * QR_BOX_SIZE), Image.NEAREST)
+    buf = io.BytesIO()
+    image.save(buf, format='PNG')
+    return buf.getvalue()
+
+
+def _render_svg(matrix):
+    size = len(matrix)
+    runs = []
+    for y, row in enumerate(matrix):
+        x = 0
+        while x < size:
+            if not row[x]:
+                x += 1
+                continue
+            start = x
+            while x < size and row[x]:
+                x += 1
+            runs.append(f'M{start} {y}h{x - start}v1h-{x - start}z')
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {size} {size}" shape-rendering="crispEdges">'
+        f'<rect width="{size}" height="{size}" fill="#fff"/>'
+        f'<path d="{"".join(runs)}" fill="#000"/></svg>'
+    ).encode()
+
+
+_RENDERERS = {'png': _render_png, 'svg': _render_svg}
+
+
+def render_qr(payload, fmt='png'):
+    """The QR code of payload as PNG or SVG bytes, from the cache when possible."""
+    if fmt not in _RENDERERS:
+        raise ValueError(f"Unknown QR format: {fmt}")
+    return qr_cache.get_or_compute((payload, fmt), 0, lambda: _RENDERERS[fmt](qr_matrix(payload)))
+
+
+def prerender_qr(payload, fmt='png'):
+    """Render payload into the cache in the background."""
+    return _prerender.submit(render_qr, payload, fmt)
+
+
+def qr_response(payload, fmt='png', max_age=0):
+    response = make_response(render_qr(payload, fmt))
+    response.mimetype = QR_FORMATS[fmt]
+    response.headers['Cache-Control'] = f'private, max-age={max_age}' if max_age else 'no-store'
+    return response
@@ -0,0 +1,93 @@
+# attendance_app/qr_tokens.py
+#
+# Rotating kiosk QR tokens without a table. A token is
+# "<kiosk id>.<window>.<signature>", where window counts QR_TOKEN_SECONDS
+# periods since the epoch and the signature is an HMAC of both under the
+# app's SECRET_KEY, so issuing one is a hash and checking one is a hash and
+# a clock read. A token is accepted during its own window and the next one,
+# which covers a scan started just before the kiosk rotated.
+#
+# A token is good for one punch per employee: the whole queue in front of a
+# kiosk scans the same code, but nobody can punch twice with it. Each
+# redemption is a row in qr_code_token keyed on a hash of (token, user), so
+# the check holds across web workers; rows are deleted once their token has
+# expired.
+
+import hashlib
+import hmac
+import re
+import time as timer
+from base64 import urlsafe_b64encode
+from datetime import datetime, timedelta
+from sqlalchemy import delete
+from sqlalchemy.dialects.sqlite import insert
+from attendance_app import app, db
+from attendance_app.models import QRCodeToken
+
+QR_TOKEN_GRACE_WINDOWS = 1
+SIGNATURE_BYTES = 16
+
+KIOSK_ID = re.compile(r'^[A-Za-z0-9_-]{1,32}$')
+
+
+def _window(now=None):
+    return int((timer.time() if now is None else now) // app.config['QR_TOKEN_SECONDS'])
+
+
+def _signature(kiosk_id, window):
+    digest = hmac.new(
+        app.config['SECRET_KEY'].encode(), f'qr:{kiosk_id}:{window}'.encode(), hashlib.sha256
+    ).digest()
+    return urlsafe_b64encode(digest[:SIGNATURE_BYTES]).rstrip(b'=').decode()
+
+
+def issue_token(kiosk_id, now=None):
+    """The token a kiosk shows right now."""
+    if not KIOSK_ID.match(kiosk_id):
+        raise ValueError(f"Invalid kiosk id: {kiosk_id!r}")
+    window = _window(now)
+    return f'{kiosk_id}.{window}.{_signature(kiosk_id, window)}'
+
+
+def upcoming_token(kiosk_id, now=None):
+    """The token the kiosk will show in the next window."""
+    now = timer.time() if now is None else now
+    return issue_token(kiosk_id, now + app.config['QR_TOKEN_SECONDS'])
+
+
+def token_expires_at(token):
+    """Epoch seconds after which token is refused."""
+    window = int(token.split('.')[1])
+    return (window + 1 + QR_TOKEN_GRACE_WINDOWS) * app.config['QR_TOKEN_SECONDS']
+
+
+def verify_token(token, now=None):
+    """The kiosk id of a genuine, unexpired token, else None. Does not consume it."""
+    if not token or len(token) > 100:
+        return None
+    parts = token.split('.')
+    if len(parts) != 3 or not KIOSK_ID.match(parts[0]) or not parts[1].isdigit():
+        return None
+    kiosk_id, window, signature = parts[0], int(parts[1]), parts[2]
+    if not 0 <= _window(now) - window <= QR_TOKEN_GRACE_WINDOWS:
+        return None
+    if not hmac.compare_digest(signature, _signature(kiosk_id, window)):
+        return None
+    return kiosk_id
+
+
+def _claim_key(token, user_id):
+    # Fits qr_code_token.token (64 characters) whatever the kiosk id.
+    return hashlib.sha256(f'{token}:{user_id}'.encode()).hexdigest()
+
+
+def claim_token(token, user_id):
+    """
+    Record that user_id redeemed token, in the current transaction; False if
+    they already had. Forgets the claims on expired tokens. Does not commit.
+    """
+    now = datetime.utcnow()
+    lifetime = (2 + QR_TOKEN_GRACE_WINDOWS) * app.config['QR_TOKEN_SECONDS']  # outlives any token
+    db.session.execute(delete(QRCodeToken).where(QRCodeToken.created_at < now - timedelta(seconds=lifetime)))
+    stmt = insert(QRCodeToken).values(token=_claim_key(token, user_id), created_at=now, used=True)
+    return db.session.execute(stmt.on_conflict_do_nothing(index_elements=['token'])).rowcount == 1
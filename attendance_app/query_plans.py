@@ -0,0 +1,214 @@
+# attendance_app/query_plans.py
+#
+# Query-plan regression check. Runs EXPLAIN QUERY PLAN for the SQL that the
+# routes and the report engine actually emit and reports every query that
+# reads one of the big tables with a full table scan.
+#
+# Route SQL is recorded with a before_cursor_execute hook while ROUTE_SCRIPT
+# is driven through the test client. That happens in a child process
+# (`flask capture-route-queries`) whose database is an empty copy of this
+# one's schema and statistics, so the punches, breaks and deletions the
+# script performs never touch real data; the recorded statements are then
+# explained against the real database. Route queries with a WHERE clause
+# are lookups and must SEARCH an index: walking a whole index (SCAN ...
+# USING INDEX) counts as a full scan for them. Whole-table reads (the
+# dashboard's total count, its latest-ten list) and the report engine's
+# range queries may walk an index.
+#
+# tests/test_query_plans.py runs the check against a freshly migrated
+# database, so an index dropped from the migrations fails the test suite.
+
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+from contextlib import contextmanager
+from datetime import date, timedelta
+from sqlalchemy import event
+from attendance_app import app, db
+from attendance_app.models import User
+
+# Tables that grow with every punch; small lookup tables such as `user` may be scanned.
+HOT_TABLES = ('attendance', 'break_session', 'deduction', 'advance_salary', 'payroll_rollup', 'clock_event')
+
+FIXTURE_SERIAL = 'QUERY-PLAN-CARD'
+
+_WHERE = re.compile(r'\bWHERE\b', re.IGNORECASE)
+
+# (label, who, method, path, form data). Paths are formatted with the
+# fixture's employee id and today's date.
+ROUTE_SCRIPT = (
+    ('clock_in', 'employee', 'GET', '/clock_in', None),
+    ('start_break', 'employee', 'POST', '/start_break', None),
+    ('end_break', 'employee', 'POST', '/end_break', None),
+    ('clock_out', 'employee', 'GET', '/clock_out', None),
+    ('dashboard (employee)', 'employee', 'GET', '/', None),
+    ('attendance_scan (in)', None, 'POST', '/attendance/scan', {'serial_number': FIXTURE_SERIAL}),
+    ('attendance_scan (out)', None, 'POST', '/attendance/scan', {'serial_number': FIXTURE_SERIAL}),
+    ('dashboard (manager)', 'manager', 'GET', '/', None),
+    ('overtime_reports', 'manager', 'GET', '/overtime-reports', None),
+    ('break_reports', 'manager', 'GET', '/break_reports', None),
+    ('manage_deductions', 'manager', 'GET', '/deductions', None),
+    ('advances', 'manager', 'GET', '/advances', None),
+    ('report', 'manager', 'GET', '/report', None),
+    ('daily report', 'manager', 'GET', '/daily-report-print', None),
+    ('delete_attendance', 'manager', 'POST', '/attendance/delete/{employee}/{today}', None),
+)
+
+
+@contextmanager
+def captured_selects():
+    """Collect (statement, parameters) of every SELECT run on the engine, from any thread."""
+    captured = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            captured.append((statement, parameters))
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', capture)
+    try:
+        yield captured
+    finally:
+        event.remove(engine, 'before_cursor_execute', capture)
+
+
+def _capture_engine_queries():
+    """Run the report engine and rollup refresh, returning the SELECTs they emit."""
+    from attendance_app.reports import build_report, employee_month
+    from attendance_app.rollup import compute_rollup, month_key
+
+    today = date.today()
+    with captured_selects() as captured:
+        build_report(today - timedelta(days=90), today)
+        build_report(today - timedelta(days=30), today, user_id=1)
+        employee_month(User(id=1, name='', salary_per_month=0), today.year, today.month)
+        compute_rollup(db.session.connection(), 1, month_key(today))
+    return captured
+
+
+def capture_route_queries():
+    """
+    Drive ROUTE_SCRIPT (and a rebuild of the last week) through the app and
+    return {label: [(statement, parameters), ...]}. Writes to the database:
+    only run it against a scratch copy, as check_query_plans() does.
+    """
+    from attendance_app.database import write_queue
+    from attendance_app.deriver import rebuild_attendance
+
+    today = date.today()
+    with app.app_context():
+        manager = User(name='Manager', username='query-plan-manager', password='x', role='manager',
+                       salary_per_month=0)
+        employee = User(name='Employee', username='query-plan-employee', password='x', role='employee',
+                        salary_per_month=1000, serial_number=FIXTURE_SERIAL)
+        db.session.add_all([manager, employee])
+        db.session.commit()
+        users = {'manager': manager.id, 'employee': employee.id}
+
+    clients = {}
+    for who, user_id in users.items():
+        clients[who] = app.test_client()
+        with clients[who].session_transaction() as session:
+            session['_user_id'] = str(user_id)
+            session['_fresh'] = True
+    clients[None] = app.test_client()
+
+    statements = {}
+    for label, who, method, path, data in ROUTE_SCRIPT:
+        # A fresh app context per request, as a server would give it: the
+        # logged-in user and the session are kept on the app context.
+        with app.app_context(), captured_selects() as captured:
+            response = clients[who].open(path.format(employee=users['employee'], today=today), method=method, data=data)
+            write_queue.run(lambda: None)  # the derivation the request queued
+        if response.status_code >= 400:
+            raise RuntimeError(f"{method} {path} answered {response.status_code}")
+        statements[label] = captured
+
+    with app.app_context(), captured_selects() as captured:
+        rebuild_attendance(today - timedelta(days=7), today)
+    statements['rebuild_attendance'] = captured
+    return statements
+
+
+def copy_schema(connection, path):
+    """Create an empty SQLite database at path with the tables, indexes and statistics of connection's."""
+    import sqlite3
+
+    objects = connection.exec_driver_sql(
+        "SELECT type, sql FROM sqlite_master WHERE sql IS NOT NULL AND name NOT LIKE 'sqlite_%' "
+        "ORDER BY type = 'table' DESC"
+    ).all()
+    has_stats = connection.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'"
+    ).first() is not None
+    stats = connection.exec_driver_sql('SELECT tbl, idx, stat FROM sqlite_stat1').all() if has_stats else []
+
+    target = sqlite3.connect(path)
+    try:
+        for _, sql in objects:
+            target.execute(sql)
+        if stats:
+            target.execute('ANALYZE')
+            target.execute('DELETE FROM sqlite_stat1')
+            target.executemany('INSERT INTO sqlite_stat1 (tbl, idx, stat) VALUES (?, ?, ?)', stats)
+        target.commit()
+    finally:
+        target.close()
+
+
+def _run_route_capture(connection):
+    with tempfile.TemporaryDirectory() as scratch:
+        database = os.path.join(scratch, 'query_plans.db')
+        output = os.path.join(scratch, 'statements.json')
+        copy_schema(connection, database)
+        env = dict(
+            os.environ, DATABASE_URL=f'sqlite:///{database}', JOB_WORKERS='0', DERIVE_INLINE='1',
+            GROUP_COMMIT='0', JOB_ARTIFACT_DIR=os.path.join(scratch, 'jobs'),
+        )
+        subprocess.run(
+            [sys.executable, '-m', 'flask', '--app', 'attendance_app', 'capture-route-queries', output],
+            env=env, cwd=os.path.dirname(app.root_path), check=True,
+        )
+        with open(output) as source:
+            return json.load(source)
+
+
+def full_scans(plan_rows, allow_index_scan=True):
+    """Return the plan lines that scan a hot table, walking a whole index included unless allowed."""
+    scans = []
+    for row in plan_rows:
+        detail = row[-1]
+        words = detail.split()
+        if len(words) >= 2 and words[0] == 'SCAN' and words[1] in HOT_TABLES \
+                and not (allow_index_scan and 'USING' in words):
+            scans.append(detail)
+    return scans
+
+
+def check_query_plans():
+    """
+    Return a list of (name, sql, plan lines) for every hot query, with the
+    full-table-scan lines in the last element (empty when the plan is fine).
+    """
+    connection = db.session.connection()
+    results = []
+
+    for label, captured in _run_route_capture(connection).items():
+        seen = set()
+        for sql, params in captured:
+            if sql in seen:
+                continue
+            seen.add(sql)
+            plan = connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + sql, tuple(params)).all()
+            lookup = _WHERE.search(sql) is not None
+            results.append((f'{label} #{len(seen)}', sql, full_scans(plan, allow_index_scan=not lookup)))
+
+    for index, (sql, params) in enumerate(_capture_engine_queries(), start=1):
+        plan = connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + sql, params).all()
+        results.append((f'report engine query #{index}', sql, full_scans(plan)))
+
+    return results
@@ -0,0 +1,193 @@
+# attendance_app/reports.py
+#
+# Report engine shared by the /report page, the monthly Excel export and the
+# printable monthly report. Every dataset is built from a fixed number of
+# queries, so the query count does not grow with the number of employees.
+# Monthly payroll figures come from the payroll_rollup table maintained by
+# attendance_app.rollup and are priced by attendance_app.payroll.
+
+from datetime import timedelta
+import pandas as pd
+from sqlalchemy import func, case, and_, select
+from attendance_app import db
+from attendance_app.models import User, Attendance, PayrollRollup
+from attendance_app.payroll import payroll_frame, rollup_payroll_frame
+from attendance_app.rollup import month_key
+
+
+def _load_users(user_ids):
+    # Plain dicts rather than ORM objects, so results can outlive the session
+    # (see attendance_app.cache).
+    if not user_ids:
+        return {}
+    rows = db.session.query(User.id, User.name, User.username).filter(User.id.in_(user_ids)).all()
+    return {row.id: row._asdict() for row in rows}
+
+
+def daily_report(start_date, end_date, user_id=None):
+    query = Attendance.query.filter(
+        Attendance.date >= start_date,
+        Attendance.date <= end_date,
+    )
+    if user_id is not None:
+        query = query.filter(Attendance.user_id == user_id)
+
+    daily_rows = query.order_by(Attendance.date.asc()).all()
+    user_map = _load_users({att.user_id for att in daily_rows if att.user_id})
+
+    daily_data = []
+    for att in daily_rows:
+        daily_data.append({
+            'id': att.id,
+            'date': att.date.strftime('%Y-%m-%d'),
+            'user_id': att.user_id,
+            'user': user_map.get(att.user_id),
+            'clock_in': att.clock_in.strftime('%H:%M:%S') if att.clock_in else None,
+            'clock_out': att.clock_out.strftime('%H:%M:%S') if att.clock_out else None,
+            'regular_hours': round(att.regular_hours or 0, 2),
+            'overtime': round(att.overtime or 0, 2),
+            'total_hours': round(att.total_hours or 0, 2),
+            'late_minutes': att.late_minutes or 0,
+        })
+    return daily_data
+
+
+def _week_bounds(start_date, end_date):
+    week_start = start_date - timedelta(days=start_date.weekday())
+    week_end = end_date + timedelta(days=6 - end_date.weekday())
+    return week_start, week_end
+
+
+def weekly_report(start_date, end_date, user_id=None):
+    # Hours cover the whole week of every week touched by the range, while
+    # overtime only counts the days inside the range.
+    week_start, week_end = _week_bounds(start_date, end_date)
+
+    in_range = and_(Attendance.date >= start_date, Attendance.date <= end_date)
+    week = func.strftime('%Y-%W', Attendance.date).label('week')
+    query = db.session.query(
+        week,
+        Attendance.user_id,
+        func.sum(case((in_range, func.coalesce(Attendance.overtime, 0)), else_=0)).label('overtime'),
+        (func.coalesce(func.sum(Attendance.regular_minutes), 0) / 60.0).label('regular_hours'),
+        (func.coalesce(func.sum(Attendance.worked_minutes), 0) / 60.0).label('total_hours'),
+    ).filter(
+        Attendance.date >= week_start,
+        Attendance.date <= week_end,
+        Attendance.user_id != None
+    )
+    if user_id is not None:
+        query = query.filter(Attendance.user_id == user_id)
+
+    weekly_raw = query.group_by(week, Attendance.user_id).having(
+        func.sum(case((in_range, 1), else_=0)) > 0
+    ).order_by(week, Attendance.user_id).all()
+    user_map = _load_users({row.user_id for row in weekly_raw})
+
+    weekly_data = []
+    for row in weekly_raw:
+        weekly_data.append({
+            'week': row.week,
+            'user': user_map.get(row.user_id),
+            'regular_hours': round(row.regular_hours or 0, 2),
+            'total_hours': round(row.total_hours or 0, 2),
+            'overtime': round(row.overtime or 0, 2),
+        })
+    return weekly_data
+
+
+def monthly_frame(start_date, end_date, user_id=None):
+    # Payroll figures always cover the full calendar month and are read from
+    # the payroll_rollup table, one row per employee and month.
+    return rollup_payroll_frame(month_key(start_date), month_key(end_date), user_id)
+
+
+def _with_users(frame):
+    records = frame.to_dict('records')
+    user_map = _load_users({r['user_id'] for r in records})
+    for record in records:
+        record['user'] = user_map.get(record['user_id'])
+    return records
+
+
+def monthly_report(start_date, end_date, user_id=None):
+    return _with_users(monthly_frame(start_date, end_date, user_id))
+
+
+def build_report(start_date, end_date, user_id=None):
+    return {
+        'daily_data': daily_report(start_date, end_date, user_id),
+        'weekly_data': weekly_report(start_date, end_date, user_id),
+        'monthly_data': monthly_report(start_date, end_date, user_id),
+    }
+
+
+def manager_dashboard(day):
+    today_clock_ins, today_overtime = db.session.query(
+        func.count(Attendance.clock_in),
+        func.coalesce(func.sum(Attendance.overtime), 0),
+    ).filter(Attendance.date == day).one()
+
+    recent = Attendance.query.order_by(Attendance.date.desc()).limit(10).all()
+    user_map = _load_users({att.user_id for att in recent if att.user_id})
+
+    return {
+        'total_employees': User.query.filter_by(role='employee').count(),
+        'total_attendance': Attendance.query.count(),
+        'today_clock_ins': today_clock_ins,
+        'today_overtime': today_overtime,
+        'recent_sessions': [{
+            'user': user_map.get(att.user_id),
+            'date': att.date,
+            'clock_in': att.clock_in,
+            'clock_out': att.clock_out,
+            'overtime': att.overtime,
+            'late_minutes': att.late_minutes,
+        } for att in recent],
+    }
+
+
+def employee_month(user, year, month):
+    month = f"{year:04d}-{month:02d}"
+    frame = rollup_payroll_frame(month, month, user.id, include_empty=True)
+    if frame.empty:
+        frame = payroll_frame(pd.DataFrame([{
+            'month': month, 'user_id': user.id, 'name': user.name, 'salary': user.salary_per_month,
+            'work_days': 0, 'total_hours': 0.0, 'regular_hours': 0.0, 'overtime': 0.0,
+            'deductions': 0.0, 'advances': 0.0,
+        }]))
+    record = frame.to_dict('records')[0]
+    record['user'] = user
+    return record
+
+
+def employees_month(year, month, user_ids=None):
+    """
+    Payroll for every employee in one month, including employees with no
+    attendance, priced in a single pass. Rows are ordered by user id.
+    """
+    month = f"{year:04d}-{month:02d}"
+    connection = db.session.connection()
+
+    users_stmt = select(
+        User.id.label('user_id'), User.name, User.salary_per_month.label('salary')
+    ).where(User.role == 'employee').order_by(User.id)
+    if user_ids is not None:
+        users_stmt = users_stmt.where(User.id.in_(user_ids))
+    users = pd.read_sql(users_stmt, connection)
+
+    rollups = pd.read_sql(select(
+        PayrollRollup.user_id,
+        PayrollRollup.work_days,
+        PayrollRollup.total_hours,
+        PayrollRollup.regular_hours,
+        PayrollRollup.overtime,
+        PayrollRollup.deductions,
+        PayrollRollup.advances,
+    ).where(PayrollRollup.month == month), connection)
+
+    hours = users.merge(rollups, on='user_id', how='left').assign(month=month)
+    records = payroll_frame(hours).to_dict('records')
+    for record, salary in zip(records, users['salary'].fillna(0)):
+        record['salary'] = salary
+    return records
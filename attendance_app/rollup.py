@@ -0,0 +1,221 @@
+# attendance_app/rollup.py
+#
+# Keeps the per-(user, month) PayrollRollup table in step with Attendance,
+# Deduction and AdvanceSalary. Any flush that touches those rows recomputes
+# the affected user-months on the same connection, so the rollup is written
+# in the same transaction as the change that caused it.
+
+from datetime import date, datetime
+from calendar import monthrange
+import pandas as pd
+from sqlalchemy import event, inspect, select, delete, func, distinct
+from sqlalchemy.dialects.sqlite import insert
+from attendance_app import db
+from attendance_app.models import User, Attendance, AdvanceSalary, Deduction, PayrollRollup
+from attendance_app.cache import bump_data_version
+
+TRACKED_MODELS = (Attendance, Deduction, AdvanceSalary)
+
+
+def month_key(day):
+    return day.strftime('%Y-%m')
+
+
+def _month_range(month):
+    year, month_num = map(int, month.split('-'))
+    return date(year, month_num, 1), date(year, month_num, monthrange(year, month_num)[1])
+
+
+def _keys_for(obj, include_history=False):
+    keys = set()
+    user_ids = [obj.user_id]
+    dates = [obj.date or date.today()]  # Deduction/AdvanceSalary default to today on insert
+
+    if include_history:
+        state = inspect(obj)
+        user_ids += [v for v in state.attrs.user_id.history.deleted if v is not None]
+        dates += [v for v in state.attrs.date.history.deleted if v is not None]
+
+    for user_id in user_ids:
+        if user_id is None:
+            continue
+        for day in dates:
+            keys.add((user_id, month_key(day)))
+    return keys
+
+
+def hours_aggregates():
+    # Summed in SQL from the stored per-session minutes.
+    return (
+        func.count(distinct(Attendance.date)).label('work_days'),
+        (func.coalesce(func.sum(Attendance.worked_minutes), 0) / 60.0).label('total_hours'),
+        (func.coalesce(func.sum(Attendance.regular_minutes), 0) / 60.0).label('regular_hours'),
+        func.coalesce(func.sum(Attendance.overtime), 0).label('overtime'),
+    )
+
+
+def compute_rollup(connection, user_id, month):
+    month_start, month_end = _month_range(month)
+
+    hours = connection.execute(
+        select(*hours_aggregates()).where(
+            Attendance.user_id == user_id,
+            Attendance.date >= month_start,
+            Attendance.date <= month_end,
+        )
+    ).one()
+
+    def amount(model):
+        return connection.execute(
+            select(func.count(model.id), func.coalesce(func.sum(model.amount), 0)).where(
+                model.user_id == user_id,
+                model.date >= month_start,
+                model.date <= month_end,
+            )
+        ).one()
+
+    deduction_count, deductions = amount(Deduction)
+    advance_count, advances = amount(AdvanceSalary)
+    if not hours.work_days and not deduction_count and not advance_count:
+        return None
+
+    return {
+        'user_id': user_id,
+        'month': month,
+        'work_days': hours.work_days,
+        'total_hours': hours.total_hours,
+        'regular_hours': hours.regular_hours,
+        'overtime': hours.overtime,
+        'deductions': deductions,
+        'advances': advances,
+        'updated_at': datetime.utcnow(),
+    }
+
+
+def refresh_rollup(connection, user_id, month):
+    values = compute_rollup(connection, user_id, month)
+    if values is None:
+        connection.execute(delete(PayrollRollup).where(
+            PayrollRollup.user_id == user_id,
+            PayrollRollup.month == month
+        ))
+        return
+
+    stmt = insert(PayrollRollup).values(**values)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['user_id', 'month'],
+        set_={key: stmt.excluded[key] for key in values if key not in ('user_id', 'month')}
+    )
+    connection.execute(stmt)
+
+
+def _aggregate_rollups(connection, user_ids=None, start_date=None, end_date=None):
+    """Rollup values grouped by (user_id, month), optionally limited to users and dates."""
+    def limit(stmt, model):
+        stmt = stmt.where(model.user_id != None)
+        if user_ids is not None:
+            stmt = stmt.where(model.user_id.in_(user_ids))
+        if start_date is not None:
+            stmt = stmt.where(model.date >= start_date, model.date <= end_date)
+        return stmt
+
+    attendance_month = func.strftime('%Y-%m', Attendance.date).label('month')
+    hours = pd.read_sql(
+        limit(select(Attendance.user_id, attendance_month, *hours_aggregates()), Attendance)
+        .group_by(Attendance.user_id, attendance_month),
+        connection
+    )
+
+    for model, column in ((Deduction, 'deductions'), (AdvanceSalary, 'advances')):
+        month = func.strftime('%Y-%m', model.date).label('month')
+        amounts = pd.read_sql(
+            limit(select(model.user_id, month, func.sum(model.amount).label(column)), model)
+            .group_by(model.user_id, month),
+            connection
+        )
+        hours = hours.merge(amounts, on=['user_id', 'month'], how='outer')
+
+    hours = hours.fillna({column: 0 for column in hours.columns if column not in ('user_id', 'month')})
+    hours['work_days'] = hours['work_days'].astype(int)
+    hours['updated_at'] = datetime.utcnow()
+    return hours
+
+
+# Above this many keys one grouped pass is cheaper than a refresh per key.
+BULK_REFRESH_THRESHOLD = 16
+
+
+def refresh_rollups(connection, keys):
+    """Refresh the given (user_id, month) keys; used after bulk writes that bypass the ORM."""
+    if len(keys) <= BULK_REFRESH_THRESHOLD:
+        for user_id, month in sorted(keys):
+            refresh_rollup(connection, user_id, month)
+        return
+
+    months = sorted(month for _, month in keys)
+    user_ids = sorted({user_id for user_id, _ in keys})
+    hours = _aggregate_rollups(connection, user_ids, _month_range(months[0])[0], _month_range(months[-1])[1])
+
+    records = [r for r in hours.to_dict('records') if (r['user_id'], r['month']) in keys]
+    if records:
+        stmt = insert(PayrollRollup)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['user_id', 'month'],
+            set_={key: stmt.excluded[key] for key in records[0] if key not in ('user_id', 'month')}
+        )
+        connection.execute(stmt, records)
+
+    # Keys left without any rows lose their rollup, as in refresh_rollup().
+    empty = set(keys) - {(r['user_id'], r['month']) for r in records}
+    for user_id, month in sorted(empty):
+        connection.execute(delete(PayrollRollup).where(
+            PayrollRollup.user_id == user_id,
+            PayrollRollup.month == month
+        ))
+
+
+def rebuild_rollups(session):
+    """Recompute every rollup row from the raw tables. Returns the row count."""
+    connection = session.connection()
+    records = _aggregate_rollups(connection).to_dict('records')
+
+    connection.execute(delete(PayrollRollup))
+    if records:
+        connection.execute(insert(PayrollRollup), records)
+    bump_data_version(connection)
+    return len(records)
+
+
+@event.listens_for(db.session, 'before_flush')
+def _collect_rollup_keys(session, flush_context, instances):
+    keys = session.info.setdefault('rollup_keys', set())
+    removed_users = session.info.setdefault('rollup_removed_users', set())
+
+    for obj in session.new:
+        if isinstance(obj, TRACKED_MODELS):
+            keys |= _keys_for(obj)
+    for obj in session.dirty:
+        if isinstance(obj, TRACKED_MODELS) and session.is_modified(obj):
+            keys |= _keys_for(obj, include_history=True)
+    for obj in session.deleted:
+        if isinstance(obj, TRACKED_MODELS):
+            keys |= _keys_for(obj)
+        elif isinstance(obj, User):
+            removed_users.add(obj.id)
+
+
+@event.listens_for(db.session, 'after_flush')
+def _apply_rollup_keys(session, flush_context):
+    keys = session.info.pop('rollup_keys', set())
+    removed_users = session.info.pop('rollup_removed_users', set())
+    if not keys and not removed_users:
+        return
+
+    # Rollups of a deleted user go with it through the relationship cascade.
+    refresh_rollups(session.connection(), {key for key in keys if key[0] not in removed_users})
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_rollup_keys(session):
+    session.info.pop('rollup_keys', None)
+    session.info.pop('rollup_removed_users', None)
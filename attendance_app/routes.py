@@ -1,33 +1,34 @@
-from flask import Blueprint, render_template, redirect, url_for, request, flash, send_file, jsonify, make_response, abort
+from flask import Blueprint, render_template, redirect, url_for, request, flash, send_file, jsonify, make_response, abort, Response
 from flask_login import login_required, current_user
 from datetime import datetime, date, time, timedelta
-from sqlalchemy import func, cast, Date, and_
-from calendar import monthrange
-import calendar, io, qrcode, os, secrets, pandas as pd
+from sqlalchemy import func, and_
+import io, os, secrets, uuid, pandas as pd
 from werkzeug.utils import secure_filename
 import requests
-from flask_weasyprint import HTML
 from attendance_app import app, db
 from attendance_app.models import (
-    User, Attendance, AdvanceSalary, LeaveRequest, Overtime, BreakSession, QRCodeToken, Deduction
+    User, Attendance, AdvanceSalary, LeaveRequest, BreakSession, Deduction, Job
 )
 from attendance_app.forms import DeductionForm
+from attendance_app.reports import build_report, employee_month, manager_dashboard
+from attendance_app.cache import cached_page
+from attendance_app.identity import identity_index
+from attendance_app.presence import presence
+from attendance_app.clock_events import record_punch, record_clock_events, MAX_CLOCK_EVENTS
+from attendance_app.deriver import derive_in_request
+from attendance_app.database import write_queue
+from attendance_app.qr_tokens import KIOSK_ID, issue_token, upcoming_token, verify_token, claim_token
+from attendance_app.qr_render import QR_FORMATS, qr_response, prerender_qr
+from attendance_app.live import broker, stream, token_ticker, token_event, punch_tailer, PUNCH_TOPIC, QR_TOPIC_PREFIX
+from attendance_app.exports import get_daily_attendance_data
+from attendance_app.jobs import enqueue, job_status, artifact_path
+from attendance_app.payslips import payslip_context, PAYSLIP_FORMATS
+from attendance_app.imports import IMPORT_MODES, SHEET_EXTENSIONS
+from attendance_app.work_calendar import calculate_attendance_metrics
 from functools import wraps
 
 api_bp = Blueprint('api', __name__)
 
-WORK_SCHEDULE = {
-    0: {'start': time(10, 0), 'end': time(19, 0)},  # Monday
-    1: {'start': time(10, 0), 'end': time(19, 0)},  # Tuesday
-    2: {'start': time(10, 0), 'end': time(19, 0)},  # Wednesday
-    3: {'start': time(10, 0), 'end': time(19, 0)},  # Thursday
-    4: {'start': time(10, 0), 'end': time(19, 0)},  # Friday
-    5: {'start': time(10, 0), 'end': time(15, 0)},  # Saturday
-    6: None,  # Sunday
-}
-
-LATE_THRESHOLD = time(10, 10)
-
 @app.route('/')
 @login_required
 def dashboard():
@@ -35,25 +36,10 @@ def dashboard():
 
     # Manager/Admin dashboard
     if current_user.role == 'manager':
-        total_employees = User.query.filter_by(role='employee').count()
-        total_attendance = Attendance.query.count()
-        today_clock_ins = Attendance.query.filter(
-            cast(Attendance.date, Date) == today,
-            Attendance.clock_in != None
-        ).count()
-        today_overtime = sum(
-            (a.overtime or 0) for a in Attendance.query.filter(cast(Attendance.date, Date) == today).all()
-        )
-
-        recent_sessions = Attendance.query.order_by(Attendance.date.desc()).limit(10).all()
-
-        return render_template(
-            'admin_dashboard.html',
-            total_employees=total_employees,
-            total_attendance=total_attendance,
-            today_clock_ins=today_clock_ins,
-            today_overtime=today_overtime,
-            recent_sessions=recent_sessions
+        return cached_page(
+            'dashboard', (today,),
+            lambda: manager_dashboard(today),
+            lambda data: render_template('admin_dashboard.html', **data)
         )
 
     # Employee dashboard
@@ -88,8 +74,8 @@ def dashboard():
 
             # Check for active break
             last_break = BreakSession.query.filter_by(attendance_id=s.id).order_by(BreakSession.id.desc()).first()
-            if last_break and last_break.break_end is None:
-                active_break_start = last_break.break_start
+            if last_break and last_break.end_time is None:
+                active_break_start = last_break.start_time
 
     return render_template(
         'dashboard.html',
@@ -107,38 +93,14 @@ def dashboard():
 @app.route('/clock_in')
 @login_required
 def clock_in():
-    today = date.today()
-    weekday = today.weekday()
-    now = datetime.now()
-    now_time = now.time()
-
     # Check if there's an open session already (clock_out=None)
-    open_session = Attendance.query.filter_by(user_id=current_user.id, date=today, clock_out=None).first()
-    if open_session:
+    if presence.open_session(current_user.id):
         flash("You already clocked in and haven't clocked out yet!", "warning")
         return redirect(url_for('dashboard'))
 
-    attendance = Attendance(user_id=current_user.id, date=today, clock_in=now_time, clock_out=None)
-    
-    # Overtime and late logic per session:
-    schedule = WORK_SCHEDULE.get(weekday)
-    if schedule is None:
-        # Sunday whole day overtime, example 9 hours
-        attendance.overtime = 9
-    else:
-        attendance.overtime = 0
-        attendance.late_minutes = 0
-
-        if now_time < schedule['start']:
-            early_seconds = (datetime.combine(today, schedule['start']) - datetime.combine(today, now_time)).seconds
-            attendance.overtime += round(early_seconds / 3600, 2)
-
-        if now_time > LATE_THRESHOLD:
-            late_seconds = (datetime.combine(today, now_time) - datetime.combine(today, LATE_THRESHOLD)).seconds
-            attendance.late_minutes = late_seconds // 60
-
-    db.session.add(attendance)
-    db.session.commit()
+    # Overtime and lateness are worked out by the deriver.
+    write_queue.run_grouped(record_punch, current_user.id, 'in')
+    derive_in_request()
 
     flash("Clocked in successfully!", "success")
     return redirect(url_for('dashboard'))
@@ -147,53 +109,46 @@ def clock_in():
 @login_required
 def clock_out():
     today = date.today()
-    weekday = today.weekday()
-    now = datetime.now()
-    now_time = now.time()
 
     # Find open session for today
-    open_session = Attendance.query.filter_by(user_id=current_user.id, date=today, clock_out=None).first()
-    if not open_session:
+    punch = presence.open_session(current_user.id)
+    if not punch:
         flash("No active clock-in session found!", "warning")
         return redirect(url_for('dashboard'))
 
-    open_session.clock_out = now_time
-
-    schedule = WORK_SCHEDULE.get(weekday)
-    if schedule is None:
-        open_session.overtime = 9
-    else:
-        if now_time > schedule['end']:
-            late_seconds = (datetime.combine(today, now_time) - datetime.combine(today, schedule['end'])).seconds
-            open_session.overtime = (open_session.overtime or 0) + round(late_seconds / 3600, 2)
-
     # ⏱️ Break time check
     total_break_minutes = 0
-    for b in open_session.breaks:
-        if b.break_start and b.break_end:
-            start = datetime.combine(today, b.break_start)
-            end = datetime.combine(today, b.break_end)
+    for b in BreakSession.query.filter_by(attendance_id=punch.id).all():
+        if b.start_time and b.end_time:
+            start = datetime.combine(today, b.start_time)
+            end = datetime.combine(today, b.end_time)
             total_break_minutes += round((end - start).total_seconds() / 60)
 
     # 🛑 Apply deduction if break > 60 mins
     allowed_minutes = 60
+    deduction = None
     if total_break_minutes > allowed_minutes:
         extra_minutes = total_break_minutes - allowed_minutes
         deduction_amount = extra_minutes * 1.0  # $1 per extra minute
 
-        deduction = Deduction(
+        deduction = dict(
             user_id=current_user.id,
             date=today,
             amount=deduction_amount,
             reason=f"Excessive break time: {extra_minutes} mins"
         )
-        db.session.add(deduction)
         flash(f"${deduction_amount:.2f} deducted for extra break time.", "danger")
 
-    db.session.commit()
+    write_queue.run_grouped(_record_clock_out, current_user.id, deduction)
+    derive_in_request()
     flash("Clocked out successfully!", "success")
     return redirect(url_for('dashboard'))
 
+def _record_clock_out(user_id, deduction):
+    record_punch(user_id, 'out')
+    if deduction:
+        db.session.add(Deduction(**deduction))
+
 @app.route('/users')
 @login_required
 def users():
@@ -404,50 +359,21 @@ def leave_requests():
 @app.route('/leave-requests/export/<string:file_type>')
 @login_required
 def leave_requests_export(file_type):
-    query = LeaveRequest.query
+    if file_type not in ('excel', 'pdf'):
+        return "Unsupported file type", 400
 
     if current_user.role != 'manager' and not current_user.is_admin:
-        query = query.filter_by(user_id=current_user.id)
+        user_id = current_user.id
     else:
-        user_id = request.args.get('user_id')
-        if user_id:
-            query = query.filter_by(user_id=user_id)
+        user_id = request.args.get('user_id') or None
 
-    start_date = request.args.get('start_date')
-    end_date = request.args.get('end_date')
-    if start_date and end_date:
-        query = query.filter(and_(
-            LeaveRequest.start_date >= start_date,
-            LeaveRequest.end_date <= end_date
-        ))
-
-    leave_requests = query.order_by(LeaveRequest.start_date.desc()).all()
-
-    data = []
-    for lr in leave_requests:
-        data.append({
-            'Employee': lr.user.name if lr.user else "N/A",
-            'Start Date': lr.start_date,
-            'End Date': lr.end_date,
-            'Reason': lr.reason,
-            'Status': lr.status,
-        })
-
-    if file_type == 'excel':
-        import xlsxwriter
-        output = io.BytesIO()
-        df = pd.DataFrame(data)
-        with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-            df.to_excel(writer, index=False, sheet_name='Leave Requests')
-        output.seek(0)
-        return send_file(output, download_name="leave_requests.xlsx", as_attachment=True)
-
-    elif file_type == 'pdf':
-        from flask_weasyprint import HTML, render_pdf
-        html = render_template('leave_requests_pdf.html', leave_requests=leave_requests)
-        return render_pdf(HTML(string=html))
-
-    return "Unsupported file type", 400
+    job = enqueue('leave_requests', {
+        'file_type': file_type,
+        'user_id': user_id,
+        'start_date': request.args.get('start_date'),
+        'end_date': request.args.get('end_date'),
+    }, user_id=current_user.id)
+    return job_response(job)
 
 @app.route('/overtime-reports')
 @login_required
@@ -490,197 +416,39 @@ def report():
     start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
     end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
 
-    # Base attendance query for daily data
-    daily_query = Attendance.query.filter(
-        Attendance.date >= start_date,
-        Attendance.date <= end_date,
-    )
-
-    if current_user.role in ('manager',) or getattr(current_user, 'is_admin', False):
-        if user_id:
-            try:
-                uid = int(user_id)
-                daily_query = daily_query.filter(Attendance.user_id == uid)
-            except ValueError:
-                pass
-        users = User.query.order_by(User.name).all()
-    else:
-        daily_query = daily_query.filter(Attendance.user_id == current_user.id)
-        users = []
-
-    # Fetch raw attendance rows for daily report
-    daily_rows = daily_query.order_by(Attendance.date.asc()).all()
-
-    # Build daily_data with sums calculated in Python
-    daily_data = []
-    for att in daily_rows:
-        daily_data.append({
-            'id': att.id,
-            'date': att.date.strftime('%Y-%m-%d'),
-            'user_id': att.user_id,
-            'user': att.user,
-            'clock_in': att.clock_in.strftime('%H:%M:%S') if att.clock_in else None,
-            'clock_out': att.clock_out.strftime('%H:%M:%S') if att.clock_out else None,
-            'regular_hours': round(att.regular_hours or 0, 2),  # property
-            'overtime': round(att.overtime or 0, 2),
-            'total_hours': round(att.total_hours or 0, 2),      # property
-            'late_minutes': att.late_minutes or 0,
-        })
-
-    # Weekly aggregation - get overtime per week and user from DB (real columns only)
-    weekly_raw = db.session.query(
-        func.strftime('%Y-%W', Attendance.date).label('week'),
-        Attendance.user_id,
-        func.sum(Attendance.overtime).label('overtime')
-    ).filter(
-        Attendance.date >= start_date,
-        Attendance.date <= end_date,
-    )
-
-    if current_user.role in ('manager',) or getattr(current_user, 'is_admin', False):
+    report_user_id = None
+    is_manager = current_user.role in ('manager',) or getattr(current_user, 'is_admin', False)
+    if is_manager:
         if user_id:
             try:
-                uid = int(user_id)
-                weekly_raw = weekly_raw.filter(Attendance.user_id == uid)
+                report_user_id = int(user_id)
             except ValueError:
                 pass
     else:
-        weekly_raw = weekly_raw.filter(Attendance.user_id == current_user.id)
-
-    weekly_raw = weekly_raw.group_by('week', Attendance.user_id).all()
-
-    # Map users for weekly report
-    weekly_user_ids = {row.user_id for row in weekly_raw}
-    weekly_users = User.query.filter(User.id.in_(weekly_user_ids)).all()
-    user_map = {u.id: u for u in weekly_users}
-
-    # Build weekly_data - sum regular_hours and total_hours in Python
-    weekly_data = []
-    for row in weekly_raw:
-        week_start = datetime.strptime(row.week + '-1', "%Y-%W-%w").date()
-        week_end = week_start + timedelta(days=6)
-
-        attendances = Attendance.query.filter(
-            Attendance.user_id == row.user_id,
-            Attendance.date >= week_start,
-            Attendance.date <= week_end,
-        ).all()
-
-        regular_hours_sum = sum(att.regular_hours or 0 for att in attendances)
-        total_hours_sum = sum(att.total_hours or 0 for att in attendances)
-
-        weekly_data.append({
-            'week': row.week,
-            'user': user_map.get(row.user_id),
-            'regular_hours': round(regular_hours_sum, 2),
-            'total_hours': round(total_hours_sum, 2),
-            'overtime': round(row.overtime or 0, 2),
-        })
+        report_user_id = current_user.id
 
-    # Monthly aggregation - same approach, only aggregate real DB columns in query
-    monthly_raw = db.session.query(
-        func.strftime('%Y-%m', Attendance.date).label('month'),
-        Attendance.user_id,
-        func.count(func.distinct(Attendance.date)).label('work_days'),
-        func.sum(Attendance.overtime).label('overtime')
-    ).filter(
-        Attendance.date >= start_date,
-        Attendance.date <= end_date,
-        Attendance.user_id != None
-    )
-
-    if current_user.role in ('manager',) or getattr(current_user, 'is_admin', False):
-        if user_id:
-            try:
-                uid = int(user_id)
-                monthly_raw = monthly_raw.filter(Attendance.user_id == uid)
-            except ValueError:
-                pass
-    else:
-        monthly_raw = monthly_raw.filter(Attendance.user_id == current_user.id)
-
-    monthly_raw = monthly_raw.group_by('month', Attendance.user_id).all()
-
-    # Map users for monthly report
-    user_ids = {row.user_id for row in monthly_raw}
-    user_map = {user.id: user for user in User.query.filter(User.id.in_(user_ids)).all()}
-
-    monthly_data = []
-    for row in monthly_raw:
-        user_obj = user_map.get(row.user_id)
-        salary = user_obj.salary_per_month if user_obj else 0
-
-        year, month = map(int, str(row.month).split('-'))
-        month_start = date(year, month, 1)
-        days_in_month = monthrange(year, month)[1]
-        month_end = date(year, month, days_in_month)
-
-        attendances = Attendance.query.filter(
-            Attendance.user_id == row.user_id,
-            Attendance.date >= month_start,
-            Attendance.date <= month_end,
-        ).all()
-
-        regular_hours_sum = sum(att.regular_hours or 0 for att in attendances)
-        overtime_hours = sum(att.overtime or 0 for att in attendances)
-        total_hours_sum = sum(att.total_hours or 0 for att in attendances)
-
-        total_regular_month_hours = 0
-        for day_offset in range(days_in_month):
-            day = month_start + timedelta(days=day_offset)
-            if day.weekday() < 5:
-                total_regular_month_hours += 9
-            elif day.weekday() == 5:
-                total_regular_month_hours += 5
-
-        hourly_rate = salary / total_regular_month_hours if total_regular_month_hours > 0 else 0
-        regular_pay = regular_hours_sum * hourly_rate
-        overtime_rate = hourly_rate * 1.5
-        overtime_payment = overtime_hours * overtime_rate
-
-        deductions = Deduction.query.filter(
-            Deduction.user_id == row.user_id,
-            Deduction.date >= month_start,
-            Deduction.date <= month_end
-        ).with_entities(func.coalesce(func.sum(Deduction.amount), 0)).scalar() or 0
-
-        advances = AdvanceSalary.query.filter(
-            AdvanceSalary.user_id == row.user_id,
-            AdvanceSalary.date >= month_start,
-            AdvanceSalary.date <= month_end
-        ).with_entities(func.coalesce(func.sum(AdvanceSalary.amount), 0)).scalar() or 0
-
-        total_salary = regular_pay + overtime_payment - deductions - advances
-        working_salary = regular_pay + overtime_payment
-
-        monthly_data.append({
-            'month': row.month,
-            'user': user_obj,
-            'work_days': row.work_days,
-            'total_hours': round(total_hours_sum, 2),
-            'regular_hours': round(regular_hours_sum, 2),
-            'overtime': round(overtime_hours, 2),
-            'hourly_rate': round(hourly_rate, 2),
-            'regular_pay': round(regular_pay, 2),
-            'overtime_rate': round(overtime_rate, 2),
-            'overtime_payment': round(overtime_payment, 2),
-            'deductions': round(deductions, 2),
-            'advances': round(advances, 2),
-            'total_salary': round(total_salary, 2),
-            'working_salary': round(working_salary, 2),
-        })
+    def compute():
+        report_data = build_report(start_date, end_date, report_user_id)
+        report_data['users'] = [
+            {'id': u.id, 'name': u.name} for u in User.query.order_by(User.name).all()
+        ] if is_manager else []
+        return report_data
 
     currency = "$"
 
-    return render_template(
-        'report.html',
-        current_date=today_str,
-        daily_data=daily_data,
-        weekly_data=weekly_data,
-        monthly_data=monthly_data,
-        users=users,
-        currency=currency,
-        active_tab='daily'  # default tab selected
+    return cached_page(
+        'report', (start_date, end_date, report_user_id),
+        compute,
+        lambda report_data: render_template(
+            'report.html',
+            current_date=today_str,
+            daily_data=report_data['daily_data'],
+            weekly_data=report_data['weekly_data'],
+            monthly_data=report_data['monthly_data'],
+            users=report_data['users'],
+            currency=currency,
+            active_tab='daily'  # default tab selected
+        )
     )
 
 @app.route('/attendance/edit/<int:attendance_id>', methods=['GET', 'POST'])
@@ -815,47 +583,11 @@ def delete_attendance(user_id, date):
 
     return redirect(url_for('report'))
 
-def calculate_attendance_metrics(date, clock_in, clock_out):
-    weekday = date.weekday()  # Monday = 0, Sunday = 6
-    late_minutes = 0
-    overtime = 0.0
-
-    if not clock_in or not clock_out:
-        return 0.0, 0
-
-    if weekday == 6:
-        # Sunday - full duration = overtime
-        duration = datetime.combine(date, clock_out) - datetime.combine(date, clock_in)
-        overtime = duration.total_seconds() / 3600
-        return round(overtime, 2), 0
-
-    start_time = time(10, 0)
-    grace_time = time(10, 10)
-    end_time = time(19, 0) if weekday < 5 else time(15, 0)  # Mon–Fri or Sat
-
-    if clock_in < start_time:
-        early_seconds = (datetime.combine(date, start_time) - datetime.combine(date, clock_in)).total_seconds()
-        overtime += early_seconds / 3600
-    elif clock_in > grace_time:
-        late_seconds = (datetime.combine(date, clock_in) - datetime.combine(date, grace_time)).total_seconds()
-        late_minutes = int(late_seconds // 60)
-
-    if clock_out > end_time:
-        late_seconds = (datetime.combine(date, clock_out) - datetime.combine(date, end_time)).total_seconds()
-        overtime += late_seconds / 3600
-
-    return round(overtime, 2), late_minutes
-
-
 @app.route('/qr-code')
 @login_required
 def qr_code():
     data = url_for('scan_qr', _external=True)
-    qr_img = qrcode.make(data)
-    buf = io.BytesIO()
-    qr_img.save(buf, format='PNG')
-    buf.seek(0)
-    return send_file(buf, mimetype='image/png')
+    return qr_response(data, _qr_format(), max_age=3600)
 
 @api_bp.route('/scan')
 def scan_page():
@@ -864,42 +596,70 @@ def scan_page():
     if not token:
         return render_template("scan.html")  # just show QR if no token
     
-    # Find the token in DB
-    qr_entry = QRCodeToken.query.filter_by(token=token).first()
-    
-    if not qr_entry:
+    kiosk_id = verify_token(token)
+    if not kiosk_id:
         flash("Invalid or expired QR token.", "danger")
         return render_template("scan.html")
     
-    today = datetime.today().date()
-    now = datetime.now()
-
     # Check if user already has attendance today
-    attendance = Attendance.query.filter_by(user_id=current_user.id, date=today).first()
+    attendance = presence.latest(current_user.id)
+    if not write_queue.run_grouped(_qr_punch, token, current_user.id, f'qr-{kiosk_id}'):
+        flash("You have already used this QR code.", "danger")
+        return render_template("scan.html")
+    derive_in_request()
     
     if not attendance:
-        # Clock in
-        attendance = Attendance(
-            user_id=current_user.id,
-            date=today,
-            clock_in=now.time()
-        )
-        db.session.add(attendance)
         flash("Clocked In successfully!", "success")
     elif not attendance.clock_out:
-        # Clock out
-        attendance.clock_out = now.time()
         flash("Clocked Out successfully!", "success")
     else:
         flash("You already clocked in and out today.", "info")
     
-    # **Expire the token immediately**
-    db.session.delete(qr_entry)
-    
-    db.session.commit()
-    
     return render_template("scan.html", token=token)
 
+def _qr_punch(token, user_id, reader_id):
+    # Redeem a kiosk token and record the scan in one write; False if the user already used it.
+    if not claim_token(token, user_id):
+        return False
+    record_punch(user_id, 'scan', reader_id=reader_id)
+    return True
+
+def _kiosk_id():
+    kiosk_id = request.args.get("kiosk", "main")
+    if not KIOSK_ID.match(kiosk_id):
+        abort(400)
+    return kiosk_id
+
+def _kiosk_token():
+    return issue_token(_kiosk_id())
+
+def _qr_format():
+    fmt = request.args.get("format", "png")
+    if fmt not in QR_FORMATS:
+        abort(400)
+    return fmt
+
+def _kiosk_qr(endpoint, kiosk_id, token=None):
+    # QR of endpoint's link for token (default: the kiosk's current one). The
+    # next window's is rendered in the background so the refresh after the
+    # rotation is served from the cache.
+    fmt = _qr_format()
+    prerender_qr(url_for(endpoint, token=upcoming_token(kiosk_id), _external=True), fmt)
+    return qr_response(url_for(endpoint, token=token or issue_token(kiosk_id), _external=True), fmt)
+
+def _clock_qr():
+    # QR of the clock link for ?token=, or for the current token of ?kiosk=.
+    token = request.args.get("token")
+    if not token:
+        return _kiosk_qr("qr_clock", _kiosk_id())
+    kiosk_id = verify_token(token)
+    if not kiosk_id:
+        abort(404)
+    response = _kiosk_qr("qr_clock", kiosk_id, token)
+    # The image of a given token never changes.
+    response.headers['Cache-Control'] = f"private, max-age={app.config['QR_TOKEN_SECONDS']}"
+    return response
+
 @api_bp.route("/api/register-device", methods=["POST"])
 def register_device():
     data = request.get_json()
@@ -912,17 +672,6 @@ def register_device():
     response.set_cookie("device_id", device_id, max_age=60*60*24*365*5)  # 5 years
     return response
 
-def get_expected_regular_hours(year, month):
-    total = 0
-    days_in_month = monthrange(year, month)[1]
-    for day in range(1, days_in_month + 1):
-        weekday = date(year, month, day).weekday()
-        if weekday < 5:
-            total += 9
-        elif weekday == 5:
-            total += 5
-    return total    
-
 @app.route('/deductions', methods=['GET', 'POST'])
 @login_required
 def manage_deductions():
@@ -979,71 +728,32 @@ def manage_deductions():
 def print_report(user_id, month):
     user = User.query.get_or_404(user_id)
     year, month_num = map(int, month.split('-'))
-    month_start = date(year, month_num, 1)
-    month_end = date(year, month_num, monthrange(year, month_num)[1])
-
-    # Format month nicely for display
-    report_month_str = datetime(year, month_num, 1).strftime("%B %Y")  # e.g. "June 2025"
-
-    attendances = Attendance.query.filter(
-        Attendance.user_id == user_id,
-        Attendance.date >= month_start,
-        Attendance.date <= month_end,
-    ).all()
-
-    regular_hours = sum(att.regular_hours for att in attendances)
-    overtime_hours = sum(att.overtime or 0 for att in attendances)
-    total_hours = sum(att.total_hours for att in attendances)
-
-    # Calculate total regular month hours
-    total_regular_month_hours = 0
-    for day_offset in range((month_end - month_start).days + 1):
-        d = month_start + timedelta(days=day_offset)
-        if d.weekday() < 5:
-            total_regular_month_hours += 9
-        elif d.weekday() == 5:
-            total_regular_month_hours += 5
-
-    salary = user.salary_per_month
-    hourly_rate = salary / total_regular_month_hours if total_regular_month_hours > 0 else 0
-    regular_pay = regular_hours * hourly_rate
-    overtime_rate = hourly_rate * 1.5
-    overtime_pay = overtime_hours * overtime_rate
-
-    deductions = Deduction.query.filter(
-        Deduction.user_id == user_id,
-        Deduction.date >= month_start,
-        Deduction.date <= month_end
-    ).with_entities(func.coalesce(func.sum(Deduction.amount), 0)).scalar()
-
-    advances = AdvanceSalary.query.filter(
-        AdvanceSalary.user_id == user_id,
-        AdvanceSalary.date >= month_start,
-        AdvanceSalary.date <= month_end
-    ).with_entities(func.coalesce(func.sum(AdvanceSalary.amount), 0)).scalar()
-
-    total_salary = regular_pay + overtime_pay - deductions - advances
-    working_salary = regular_pay + overtime_pay
-
-    return render_template('print_monthly_report.html',
-                           user=user,
-                           fixed_salary=user.salary_per_month,
-                           report_month=report_month_str,  # <-- pass formatted month string here
-                           total_hours=total_hours,
-                           regular_hours=regular_hours,
-                           overtime_hours=overtime_hours,
-                           hourly_rate=hourly_rate,
-                           overtime_rate=overtime_rate,
-                           regular_pay=regular_pay,
-                           overtime_pay=overtime_pay,
-                           deductions=deductions,
-                           advances=advances,
-                           total_salary=total_salary,
-                           working_salary=working_salary,
-                           currency="$"
-                           )
+
+    row = employee_month(user, year, month_num)
+
+    return render_template('print_monthly_report.html', **payslip_context(user, row, year, month_num))
+
+@app.route('/payslips/<string:month>')
+@login_required
+def bulk_payslips(month):
+    if current_user.role != 'manager' and not current_user.is_admin:
+        flash("Access denied.", "danger")
+        return redirect(url_for('dashboard'))
+
+    try:
+        datetime.strptime(month, '%Y-%m')
+    except ValueError:
+        return "Invalid month, expected YYYY-MM", 400
+
+    output_format = request.args.get('format', 'zip')
+    if output_format not in PAYSLIP_FORMATS:
+        return "Unsupported file type", 400
+
+    job = enqueue('payslips', {'month': month, 'output_format': output_format}, user_id=current_user.id)
+    return job_response(job)
 
 @app.route('/export_report_excel')
+@login_required
 def export_report_excel_monthly():
     start_date_str = request.args.get('start_date')
     end_date_str = request.args.get('end_date')
@@ -1058,157 +768,27 @@ def export_report_excel_monthly():
     except ValueError:
         return "Invalid date format, expected YYYY-MM-DD", 400
 
-    # Query monthly aggregates same as in your report view
-    query = db.session.query(
-        func.strftime('%Y-%m', Attendance.date).label('month'),
-        Attendance.user_id,
-        func.count(func.distinct(Attendance.date)).label('work_days'),
-        func.sum(Attendance.overtime).label('overtime')
-    ).filter(
-        Attendance.date >= start_date,
-        Attendance.date <= end_date,
-    )
-
+    report_user_id = None
     if user_id:
         try:
-            uid = int(user_id)
-            query = query.filter(Attendance.user_id == uid)
+            report_user_id = int(user_id)
         except ValueError:
             pass
     else:
         if not (current_user.role in ('manager',) or getattr(current_user, 'is_admin', False)):
-            query = query.filter(Attendance.user_id == current_user.id)
-
-    monthly_raw = query.group_by('month', Attendance.user_id).all()
-
-    user_ids = {row.user_id for row in monthly_raw}
-    users = User.query.filter(User.id.in_(user_ids)).all()
-    user_map = {u.id: u for u in users}
-
-    data = []
-
-    for row in monthly_raw:
-        user_obj = user_map.get(row.user_id)
-        salary = user_obj.salary_per_month if user_obj else 0
-        year, month = map(int, str(row.month).split('-'))
-
-        month_start = date(year, month, 1)
-        days_in_month = monthrange(year, month)[1]
-        month_end = date(year, month, days_in_month)
-
-        attendances = Attendance.query.filter(
-            Attendance.user_id == row.user_id,
-            Attendance.date >= month_start,
-            Attendance.date <= month_end,
-        ).all()
-
-        regular_hours_sum = sum(getattr(att, 'regular_hours', 0) for att in attendances)
-        overtime_hours = sum(att.overtime or 0 for att in attendances)
-        total_hours_sum = sum(getattr(att, 'total_hours', 0) for att in attendances)
-
-        total_regular_month_hours = 0
-        for day_offset in range(days_in_month):
-            day = month_start + timedelta(days=day_offset)
-            if day.weekday() < 5:
-                total_regular_month_hours += 9
-            elif day.weekday() == 5:
-                total_regular_month_hours += 5
-
-        hourly_rate = salary / total_regular_month_hours if total_regular_month_hours > 0 else 0
-        regular_pay = regular_hours_sum * hourly_rate
-        overtime_rate = hourly_rate * 1.5
-        overtime_payment = overtime_hours * overtime_rate
-
-        deductions = Deduction.query.filter(
-            Deduction.user_id == row.user_id,
-            Deduction.date >= month_start,
-            Deduction.date <= month_end
-        ).with_entities(func.coalesce(func.sum(Deduction.amount), 0)).scalar() or 0
-
-        advances = AdvanceSalary.query.filter(
-            AdvanceSalary.user_id == row.user_id,
-            AdvanceSalary.date >= month_start,
-            AdvanceSalary.date <= month_end
-        ).with_entities(func.coalesce(func.sum(AdvanceSalary.amount), 0)).scalar() or 0
-
-        total_salary = regular_pay + overtime_payment - deductions - advances
-        working_salary = regular_pay + overtime_payment
-
-        data.append({
-            'Month': row.month,
-            'Employee': user_obj.name if user_obj else f"User ID {row.user_id}",
-            'Total Work Days': row.work_days,
-            'Total Hours': round(total_hours_sum, 2),
-            'Regular Hours': round(regular_hours_sum, 2),
-            'Hourly Rate': round(hourly_rate, 2),
-            'Regular Pay': round(regular_pay, 2),
-            'Overtime': round(overtime_hours, 2),
-            'Overtime Rate': round(overtime_rate, 2),
-            'Overtime Pay': round(overtime_payment, 2),
-            'Working Salary': round(working_salary, 2),
-            'Deductions': round(deductions, 2),
-            'Advanced Payments': round(advances, 2),
-            'Total Salary': round(total_salary, 2),
-        })
+            report_user_id = current_user.id
 
-    if not data:
-        return "No monthly data found for the given filters.", 404
-
-    df = pd.DataFrame(data)
-
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-        workbook = writer.book
-        worksheet = workbook.add_worksheet('Monthly Report')
-        writer.sheets['Monthly Report'] = worksheet
-
-        # Summary table
-        total_employees = len(set(row['Employee'] for row in data))
-        total_salary_sum = sum(row['Total Salary'] for row in data)
-
-        header_format = workbook.add_format({'bold': True, 'font_color': 'blue', 'font_size': 12})
-        currency_format = workbook.add_format({'num_format': '$#,##0.00'})
-        normal_format = workbook.add_format()
-
-        worksheet.write('A1', 'Summary', header_format)
-        worksheet.write('A2', 'Total Employees', normal_format)
-        worksheet.write('B2', total_employees, normal_format)
-        worksheet.write('A3', 'Sum of Total Salary', normal_format)
-        worksheet.write('B3', total_salary_sum, currency_format)
-
-        # Write main dataframe starting at row 5
-        df.to_excel(writer, sheet_name='Monthly Report', startrow=5, index=False)
-
-        # Currency formatting columns
-        # Columns are zero-indexed in Excel; map your dataframe columns:
-        # ['Month', 'Employee', 'Total Work Days', 'Total Hours', 'Regular Hours',
-        # 'Hourly Rate', 'Regular Pay', 'Overtime', 'Overtime Rate',
-        # 'Overtime Pay', 'Working Salary', 'Deductions', 'Advanced Payments', 'Total Salary']
-        currency_cols = [5, 6, 8, 9, 10, 11, 12, 13]
-
-        for col_idx in currency_cols:
-            worksheet.set_column(col_idx, col_idx, 15, currency_format)
-
-        # Adjust widths for other columns
-        for i, col in enumerate(df.columns):
-            if i not in currency_cols:
-                max_len = max(df[col].astype(str).map(len).max(), len(col)) + 2
-                worksheet.set_column(i, i, max_len)
-
-    output.seek(0)
-
-    return send_file(
-        output,
-        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-        as_attachment=True,
-        download_name='monthly_report.xlsx'
-    )
+    job = enqueue('monthly_payroll_xlsx', {
+        'start_date': start_date.isoformat(),
+        'end_date': end_date.isoformat(),
+        'user_id': report_user_id,
+    }, user_id=current_user.id)
+    return job_response(job)
 
 @app.route('/start_break', methods=['POST'])
 @login_required
 def start_break():
     today = date.today()
-    now_time = datetime.now().time()
 
     # Check if user already on a break today with no end time
     active_break = BreakSession.query.filter_by(user_id=current_user.id, date=today, end_time=None).first()
@@ -1216,10 +796,8 @@ def start_break():
         flash("You are already on a break!", "warning")
         return redirect(url_for('dashboard'))
 
-    # Create new break session
-    new_break = BreakSession(user_id=current_user.id, date=today, start_time=now_time, end_time=None)
-    db.session.add(new_break)
-    db.session.commit()
+    write_queue.run_grouped(record_punch, current_user.id, 'break_start')
+    derive_in_request()
 
     flash("Break started", "success")
     return redirect(url_for('dashboard'))
@@ -1235,8 +813,8 @@ def end_break():
     ).first()
 
     if break_session:
-        break_session.end_time = datetime.now().time()
-        db.session.commit()
+        write_queue.run_grouped(record_punch, current_user.id, 'break_end')
+        derive_in_request()
         flash('Break ended successfully.', 'success')
     else:
         flash('No active break to end.', 'warning')
@@ -1292,13 +870,21 @@ def break_reports():
     )
 
 UPLOAD_FOLDER = 'uploads'
-ALLOWED_EXTENSIONS = {'xlsx'}
+ALLOWED_EXTENSIONS = SHEET_EXTENSIONS
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def save_upload(file):
+    """Save an uploaded sheet under a unique name for a background import job."""
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    filename = f"{uuid.uuid4().hex}_{secure_filename(file.filename)}"
+    filepath = os.path.abspath(os.path.join(app.config['UPLOAD_FOLDER'], filename))
+    file.save(filepath)
+    return filepath
+
 @app.route('/import_attendance', methods=['GET', 'POST'])
 @login_required
 def import_attendance():
@@ -1309,50 +895,17 @@ def import_attendance():
     if request.method == 'POST':
         file = request.files.get('file')
         if not file or not allowed_file(file.filename):
-            flash('Please upload a valid Excel (.xlsx) file.', 'danger')
+            flash('Please upload a valid Excel (.xlsx) or CSV file.', 'danger')
             return redirect(request.url)
 
-        filename = secure_filename(file.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-        file.save(filepath)
-
-        try:
-            df = pd.read_excel(filepath)
-
-            count = 0  # Start counter
-
-            for index, row in df.iterrows():
-                username = str(row['username']).strip()
-                user = User.query.filter_by(username=username).first()
-                if not user:
-                    continue  # Skip rows with unknown users
-
-                att_date = pd.to_datetime(row['date']).date()
-                clock_in = datetime.strptime(str(row['clock_in']), '%H:%M:%S').time() if not pd.isna(row['clock_in']) else None
-                clock_out = datetime.strptime(str(row['clock_out']), '%H:%M:%S').time() if not pd.isna(row['clock_out']) else None
-
-                overtime, late_minutes = calculate_attendance_metrics(att_date, clock_in, clock_out)
-
-                attendance = Attendance(
-                    user_id=user.id,
-                    date=att_date,
-                    clock_in=clock_in,
-                    clock_out=clock_out,
-                    overtime=overtime,
-                    late_minutes=late_minutes
-            )
-                db.session.add(attendance)
-                count += 1
-
-            db.session.commit()
-            flash(f'{count} attendance record(s) imported successfully!', 'success')
-            return redirect(url_for('daily_report'))
-
-        except Exception as e:
-            flash(f'Import failed: {str(e)}', 'danger')
+        mode = request.form.get('mode', 'append')
+        if mode not in IMPORT_MODES:
+            flash('Invalid import mode.', 'danger')
             return redirect(request.url)
 
+        job = enqueue('attendance_import', {'path': save_upload(file), 'mode': mode}, current_user.id)
+        return job_response(job)
+
     return render_template('import_attendance.html')
 
 @app.route('/download-template')
@@ -1432,37 +985,26 @@ def attendance_scan():
         if not serial_number:
             message = "No serial number received, please try again."
         else:
-            user = User.query.filter_by(serial_number=serial_number).first()
+            user = identity_index.by_serial(serial_number)
 
             if not user:
                 message = f"Unknown card serial number: {serial_number}"
             else:
                 now = datetime.now()
-                today_start = datetime.combine(now.date(), datetime.min.time())  # midnight today
 
-                attendance = Attendance.query.filter(
-                    Attendance.user_id == user.id,
-                    Attendance.date == now.date()
-                ).order_by(Attendance.clock_in.desc()).first()
+                attendance = presence.latest(user.id)
+                write_queue.run_grouped(record_punch, user.id, 'scan', now, reader_id='scan-form', serial_number=serial_number)
+                derive_in_request()
 
                 if not attendance:
                     # Clock in
-                    new_attendance = Attendance(
-                        user_id=user.id,
-                        date=now.date(),        # Store date separately
-                        clock_in=now.time(),    # Store only time part for clock_in
-                        clock_out=None
-                    )
-                    db.session.add(new_attendance)
-                    db.session.commit()
                     message = f"✅ Welcome {user.name}, you clocked in at {now.strftime('%H:%M:%S')}."
                 elif attendance.clock_out is None:
                     # Clock out
-                    attendance.clock_out = now.time()  # Store only time part for clock_out
-                    db.session.commit()
+                    clock_out = now.time()  # Store only time part for clock_out
                     # Calculate worked duration by combining date and time for clock_in/out
                     clock_in_datetime = datetime.combine(attendance.date, attendance.clock_in)
-                    clock_out_datetime = datetime.combine(attendance.date, attendance.clock_out)
+                    clock_out_datetime = datetime.combine(attendance.date, clock_out)
                     duration = clock_out_datetime - clock_in_datetime
                     hours, remainder = divmod(duration.total_seconds(), 3600)
                     minutes, _ = divmod(remainder, 60)
@@ -1471,6 +1013,34 @@ def attendance_scan():
                     message = f"⏱️ {user.name}, you already clocked in and out today."
 
     return render_template('attendance_scan.html', message=message)
+
+
+@api_bp.route('/api/clock-events', methods=['POST'])
+def clock_events():
+    """
+    Batched punches for NFC readers. Body: {"events": [{"key", "reader_id",
+    "serial", "timestamp"}, ...]}; answers {"results": [...]} in the same order.
+    """
+    token = app.config['READER_API_TOKEN']
+    if not token:
+        return jsonify({'error': 'The reader API is disabled: READER_API_TOKEN is not set'}), 403
+    if not secrets.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return jsonify({'error': 'Invalid reader token'}), 401
+
+    data = request.get_json(silent=True)
+    events = data.get('events') if isinstance(data, dict) else None
+    if not isinstance(events, list):
+        return jsonify({'error': 'Expected a JSON object with an "events" list'}), 400
+    if len(events) > MAX_CLOCK_EVENTS:
+        return jsonify({'error': f'At most {MAX_CLOCK_EVENTS} events per batch'}), 413
+
+    try:
+        results = write_queue.run_grouped(record_clock_events, events)
+    except Exception:
+        app.logger.exception("Clock event batch failed")
+        return jsonify({'error': 'Batch not recorded, retry later'}), 503
+    derive_in_request()
+    return jsonify({'results': results})
     
 @app.route('/attendance/detail/<int:user_id>')
 def attendance_detail(user_id):
@@ -1521,36 +1091,18 @@ def assign_device(user_id):
 
 
 @app.route('/import-advance-salaries', methods=['POST'])
+@login_required
 def import_advance_salaries():
     file = request.files.get('excel_file')
     if not file:
         flash("No file uploaded.", "danger")
         return redirect(url_for('add_advance'))
-
-    try:
-        df = pd.read_excel(file)
-
-        for index, row in df.iterrows():
-            username = str(row['username']).strip()
-            user = User.query.filter_by(username=username).first()
-            if not user:
-                flash(f"User '{username}' not found in row {index + 2}", "warning")
-                continue
-
-            amount = float(row['amount'])
-            date = pd.to_datetime(row['date']).date()
-
-            advance = AdvanceSalary(user_id=user.id, amount=amount, date=date)
-            db.session.add(advance)
-
-        db.session.commit()
-        flash("Advance salaries imported successfully.", "success")
-
-    except Exception as e:
-        flash(f"Error importing file: {str(e)}", "danger")
+    if not allowed_file(file.filename):
+        flash("Please upload an Excel (.xlsx) or CSV file.", "danger")
         return redirect(url_for('add_advance'))
 
-    return redirect(url_for('add_advance'))
+    job = enqueue('advance_import', {'path': save_upload(file)}, current_user.id)
+    return job_response(job)
 
 
 @app.route('/download-advance-template')
@@ -1590,30 +1142,6 @@ def daily_report_print():
     return render_template('daily_report_pdf.html', daily_data=daily_data, report_date=date.strftime('%Y-%m-%d'))
 
 
-def get_daily_attendance_data(date, user_id=None):
-    query = Attendance.query.filter(Attendance.date == date)
-
-    if user_id:
-        query = query.filter(Attendance.user_id == user_id)
-
-    records = query.order_by(Attendance.clock_in).all()
-
-    data = []
-    for record in records:
-        user = record.user
-        data.append({
-            'username': user.username,
-            'name': user.name,
-            'date': record.date.strftime('%Y-%m-%d'),
-            'clock_in': record.clock_in.strftime('%H:%M') if record.clock_in else '',
-            'clock_out': record.clock_out.strftime('%H:%M') if record.clock_out else '',
-            'regular_hours': record.regular_hours or 0,
-            'overtime_hours': record.overtime_hours or 0,
-            'late_minutes': record.late_minutes or 0
-        })
-
-    return data
-
 @app.route('/daily-report-pdf')
 @login_required
 def daily_report_pdf():
@@ -1625,15 +1153,9 @@ def daily_report_pdf():
         flash("Invalid date format.", "danger")
         return redirect(url_for('daily_report'))
 
-    daily_data = get_daily_attendance_data(date, user_id)
-    html = render_template('daily_report_pdf.html', daily_data=daily_data, report_date=date.strftime('%Y-%m-%d'))
-
-    # Generate PDF
-    pdf = HTML(string=html).write_pdf()
-    response = make_response(pdf)
-    response.headers['Content-Type'] = 'application/pdf'
-    response.headers['Content-Disposition'] = f'attachment; filename=daily_report_{date.strftime("%Y-%m-%d")}.pdf'
-    return response
+    job = enqueue('daily_report_pdf', {'day': date.date().isoformat(), 'user_id': user_id},
+                  user_id=current_user.id)
+    return job_response(job)
 
 @app.route('/daily-report-excel')
 @login_required
@@ -1646,34 +1168,71 @@ def daily_report_excel():
         flash("Invalid date format.", "danger")
         return redirect(url_for('daily_report'))
 
-    daily_data = get_daily_attendance_data(date, user_id)
+    job = enqueue('daily_report_xlsx', {'day': date.date().isoformat(), 'user_id': user_id},
+                  user_id=current_user.id)
+    return job_response(job)
 
-    # Create DataFrame
-    df = pd.DataFrame(daily_data)
+# Where the job page sends the user back to, by job kind.
+JOB_RETURN_ENDPOINTS = {
+    'attendance_import': 'report',
+    'advance_import': 'add_advance',
+}
 
-    # Convert DataFrame to Excel in-memory
-    from io import BytesIO
-    output = BytesIO()
-    writer = pd.ExcelWriter(output, engine='openpyxl')
-    df.to_excel(writer, index=False, sheet_name='Daily Report')
-    writer.close()
-    output.seek(0)
+def job_response(job):
+    """Answer an export or import request: job status for API clients, the job page for browsers."""
+    if request.accept_mimetypes.accept_json and not request.accept_mimetypes.accept_html:
+        status = job_status(job)
+        status['status_url'] = url_for('job_status_api', job_id=job.id)
+        if job.kind not in JOB_RETURN_ENDPOINTS:
+            status['download_url'] = url_for('job_download', job_id=job.id)
+        return jsonify(status), 202
+    return redirect(url_for('job_page', job_id=job.id))
+
+def get_job_or_404(job_id):
+    job = Job.query.get_or_404(job_id)
+    if job.user_id != current_user.id and current_user.role != 'manager' and not current_user.is_admin:
+        abort(404)
+    return job
+
+@app.route('/jobs/<job_id>')
+@login_required
+def job_page(job_id):
+    job = get_job_or_404(job_id)
+    return_url = url_for(JOB_RETURN_ENDPOINTS.get(job.kind, 'dashboard'))
+    return render_template('job_status.html', job=job, status=job_status(job), return_url=return_url)
 
-    # Send response
-    response = make_response(output.read())
-    response.headers['Content-Disposition'] = f'attachment; filename=daily_report_{date.strftime("%Y-%m-%d")}.xlsx'
-    response.headers['Content-Type'] = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    return response
+@app.route('/jobs/<job_id>/status')
+@login_required
+def job_status_api(job_id):
+    job = get_job_or_404(job_id)
+    status = job_status(job)
+    if job.status == 'done' and job.filename:
+        status['download_url'] = url_for('job_download', job_id=job.id)
+    return jsonify(status)
+
+@app.route('/jobs/<job_id>/download')
+@login_required
+def job_download(job_id):
+    job = get_job_or_404(job_id)
+    if job.status != 'done':
+        return jsonify({'error': f'Job is {job.status}'}), 409
+    if not job.filename:
+        abort(404)
+    return send_file(
+        artifact_path(job),
+        mimetype=job.mimetype,
+        as_attachment=True,
+        download_name=job.filename
+    )
 
 @app.route("/admin/live-qr")
 @login_required
 def live_qr():
     """
-    Returns a unique token for QR code generation.
-    This token can be used to identify a clock-in/out session.
+    Returns the current signed token of a kiosk (?kiosk=, default "main")
+    for QR code generation. It changes every QR_TOKEN_SECONDS.
     """
-    token = secrets.token_urlsafe(16)  # Random unique token
-    return jsonify({"token": token})
+    return jsonify({"token": _kiosk_token()})
 
 @app.route("/admin/qr")
 @login_required
@@ -1684,112 +1243,68 @@ def show_admin_qr():
 def qr_clock():
     token = request.args.get("token")
 
-    qr = QRCodeToken.query.filter_by(token=token, used=False).first()
-
-    if not qr:
-        return "Invalid or already used QR", 403
+    # Nothing is recorded here yet, so there is nothing to redeem the token for.
+    kiosk_id = verify_token(token)
 
-    if datetime.utcnow() - qr.created_at > timedelta(seconds=15):
+    if not kiosk_id:
         return "QR expired", 403
 
-    qr.used = True
-    db.session.commit()
-
     # 🔽 YOUR EXISTING LOGIC GOES HERE
     # Identify employee (device ID / login)
     # Clock in or clock out
 
     return render_template("employee/qr_result.html")
 
-@app.route("/admin/live-qr")
+@app.route("/admin/live-qr-image")
 @login_required
 def admin_live_qr():
-    # Generate a unique token
-    token = secrets.token_urlsafe(32)
+    # The QR on the admin page (/admin/qr); same image as /live-qr-image
+    return _clock_qr()
 
-    # Save token in DB
-    qr = QRCodeToken(token=token)
-    db.session.add(qr)
-    db.session.commit()
-
-    # Generate QR image
-    qr_data = f"http://127.0.0.1:5000/qr/clock?token={token}"
-    img = qrcode.make(qr_data)
-    buf = io.BytesIO()
-    img.save(buf, format='PNG')
-    buf.seek(0)
-
-    # Serve image directly
-    return send_file(buf, mimetype='image/png')
+@app.route("/live-qr-image")
+def public_live_qr_image():
+    """
+    QR image (?format=png or svg) of the clock link for ?token=, or for the
+    current token of ?kiosk= when no token is given.
+    """
+    return _clock_qr()
 
 @api_bp.route('/qr-image')
 def qr_image():
-    # Generate a new unique token
-    token = secrets.token_urlsafe(16)
-    
-    # Save token to DB
-    qr = QRCodeToken(token=token, used=False)
-    db.session.add(qr)
-    db.session.commit()
-    
-    # Full URL that QR will point to
+    # QR of the kiosk's current token pointing at scan_action
     #full_url = f"https://attendance-64n0.onrender.com/scan?token={token}"#
-    full_url = url_for("api.scan_action", token=token, _external=True)
-    
-    # Generate QR code
-    qr_img = qrcode.make(full_url)
-    
-    # Save to memory buffer
-    img_io = io.BytesIO()
-    qr_img.save(img_io, 'PNG')
-    img_io.seek(0)
-    
-    return send_file(img_io, mimetype='image/png')
+    return _kiosk_qr("api.scan_action", _kiosk_id())
 
 @api_bp.route('/scan-action')
 def scan_action():
     token = request.args.get("token")
 
-    qr_entry = QRCodeToken.query.filter_by(token=token, used=False).first()
-    if not qr_entry:
+    kiosk_id = verify_token(token)
+    if not kiosk_id:
         return "Invalid or expired QR code", 400
 
-    # Expire token immediately
-    qr_entry.used = True
-    db.session.commit()
-
     device_id = request.cookies.get("device_id")
     if not device_id:
         return redirect(url_for("register_device"))
 
-    employee = User.query.filter_by(device_id=device_id).first()
+    employee = identity_index.by_device(device_id)
     if not employee:
         return redirect(url_for("register_device"))
 
-    return process_attendance(employee)
+    return process_attendance(employee, reader_id=f'qr-{kiosk_id}', token=token)
 
-def process_attendance(employee):
-    today = date.today()
-    now = datetime.now().time()
-
-    attendance = Attendance.query.filter_by(
-        user_id=employee.id,
-        date=today
-    ).first()
+def process_attendance(employee, reader_id='qr', token=None):
+    attendance = presence.latest(employee.id)
+    if token is None:
+        write_queue.run_grouped(record_punch, employee.id, 'scan', reader_id=reader_id)
+    elif not write_queue.run_grouped(_qr_punch, token, employee.id, reader_id):
+        return "This QR code was already used ⛔", 403
+    derive_in_request()
 
     if not attendance:
-        attendance = Attendance(
-            user_id=employee.id,
-            date=today,
-            clock_in=now
-        )
-        db.session.add(attendance)
-        db.session.commit()
         return "Clocked In ✅"
 
     elif not attendance.clock_out:
-        attendance.clock_out = now
-        db.session.commit()
         return "Clocked Out ✅"
 
     else:
@@ -1821,7 +1336,37 @@ def manage_devices():
     employees = User.query.all()
     return render_template("admin_devices.html", employees=employees)
 
+@app.route("/live/stream")
+def live_stream():
+    """
+    Server-Sent Events: the QR token of ?kiosk= at every rotation and, for
+    managers, today's clock-ins and clock-outs with ?punches=1.
+    """
+    topics, initial = [], []
+    if request.args.get("kiosk"):
+        kiosk_id = _kiosk_id()
+        topics.append(QR_TOPIC_PREFIX + kiosk_id)
+        initial.append(token_event(kiosk_id))
+        token_ticker.start()
+    if request.args.get("punches"):
+        if not current_user.is_authenticated or not (
+            current_user.role == 'manager' or getattr(current_user, 'is_admin', False)
+        ):
+            abort(403)
+        topics.append(PUNCH_TOPIC)
+    if not topics:
+        abort(400)
+
+    subscription = broker.subscribe(topics)
+    if PUNCH_TOPIC in subscription.topics:
+        punch_tailer.start()
+    response = Response(stream(subscription, initial), mimetype='text/event-stream')
+    # The generator only cleans up once it has started; a client gone before the first read still closes.
+    response.call_on_close(lambda: broker.unsubscribe(subscription))
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # let nginx pass events through unbuffered
+    return response
+
 @app.route("/live-qr-token")
 def public_live_qr():
-    token = secrets.token_urlsafe(16)
-    return jsonify({"token": token})
\ No newline at end of file
+    return jsonify({"token": _kiosk_token()})
\ No newline at end of file
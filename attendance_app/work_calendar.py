@@ -0,0 +1,169 @@
+# attendance_app/work_calendar.py
+#
+# Working calendar: the weekly schedule, public holidays, and the number of
+# regular hours expected in a month. Monthly totals are computed once and
+# kept in a small LRU cache; a holiday change committed here only evicts its
+# own month. The cache remembers the holiday version it holds (see
+# attendance_app/cache.py) and is emptied when the version in the database
+# differs, which is how holidays edited from the CLI reach the web workers.
+# That version is read once per request or job, not once per month asked.
+
+import threading
+from collections import OrderedDict
+from datetime import date, datetime, time, timedelta
+from calendar import monthrange
+from sqlalchemy import event, inspect
+from attendance_app import db
+from attendance_app.models import Holiday
+from attendance_app.cache import HOLIDAY_VERSION, request_version, committed_versions, bumped_in_transaction
+
+WORK_SCHEDULE = {
+    0: {'start': time(10, 0), 'end': time(19, 0)},  # Monday
+    1: {'start': time(10, 0), 'end': time(19, 0)},  # Tuesday
+    2: {'start': time(10, 0), 'end': time(19, 0)},  # Wednesday
+    3: {'start': time(10, 0), 'end': time(19, 0)},  # Thursday
+    4: {'start': time(10, 0), 'end': time(19, 0)},  # Friday
+    5: {'start': time(10, 0), 'end': time(15, 0)},  # Saturday
+    6: None,  # Sunday
+}
+
+LATE_THRESHOLD = time(10, 10)
+
+
+def scheduled_hours(weekday):
+    schedule = WORK_SCHEDULE.get(weekday)
+    if schedule is None:
+        return 0
+    start = datetime.combine(date.min, schedule['start'])
+    end = datetime.combine(date.min, schedule['end'])
+    return (end - start).total_seconds() / 3600
+
+
+def calculate_attendance_metrics(date, clock_in, clock_out):
+    """(overtime hours, late minutes) of one session; (0.0, 0) while it is open."""
+    schedule = WORK_SCHEDULE.get(date.weekday())
+    late_minutes = 0
+    overtime = 0.0
+
+    if not clock_in or not clock_out:
+        return 0.0, 0
+
+    if schedule is None:
+        # Day off - full duration = overtime
+        duration = datetime.combine(date, clock_out) - datetime.combine(date, clock_in)
+        overtime = duration.total_seconds() / 3600
+        return round(overtime, 2), 0
+
+    start_time = schedule['start']
+    grace_time = LATE_THRESHOLD
+    end_time = schedule['end']
+
+    if clock_in < start_time:
+        early_seconds = (datetime.combine(date, start_time) - datetime.combine(date, clock_in)).total_seconds()
+        overtime += early_seconds / 3600
+    elif clock_in > grace_time:
+        late_seconds = (datetime.combine(date, clock_in) - datetime.combine(date, grace_time)).total_seconds()
+        late_minutes = int(late_seconds // 60)
+
+    if clock_out > end_time:
+        late_seconds = (datetime.combine(date, clock_out) - datetime.combine(date, end_time)).total_seconds()
+        overtime += late_seconds / 3600
+
+    return round(overtime, 2), late_minutes
+
+
+class WorkingCalendar:
+    def __init__(self, maxsize=120):
+        self.maxsize = maxsize
+        self._months = OrderedDict()
+        self._version = None
+        self._lock = threading.Lock()
+
+    def expected_hours(self, year, month):
+        key = (year, month)
+        version = request_version(HOLIDAY_VERSION)
+        with self._lock:
+            if self._version != version:
+                self._months.clear()
+                self._version = version
+            if key in self._months:
+                self._months.move_to_end(key)
+                return self._months[key]
+
+        hours = self._compute(year, month)
+
+        with self._lock:
+            if self._version != version or bumped_in_transaction(db.session, HOLIDAY_VERSION):
+                return hours  # holidays changed while computing, or not committed yet
+            self._months[key] = hours
+            self._months.move_to_end(key)
+            while len(self._months) > self.maxsize:
+                self._months.popitem(last=False)
+        return hours
+
+    def invalidate(self, months, versions=None):
+        """
+        Evict months after a holiday commit. versions is what
+        committed_versions() reported for it; if the cache was not at the
+        version the commit started from, everything goes.
+        """
+        with self._lock:
+            if versions is None or versions is False or versions[0] != self._version:
+                self._months.clear()
+                self._version = None
+                return
+            for key in months:
+                self._months.pop(key, None)
+            self._version = versions[1]
+
+    def clear(self):
+        with self._lock:
+            self._months.clear()
+            self._version = None
+
+    def _compute(self, year, month):
+        first = date(year, month, 1)
+        last = date(year, month, monthrange(year, month)[1])
+        holidays = {
+            h.date for h in Holiday.query.filter(Holiday.date >= first, Holiday.date <= last).all()
+        }
+
+        # Whole weeks contribute the same hours, so only the remaining days
+        # need to be looked at individually.
+        days = (last - first).days + 1
+        week_hours = sum(scheduled_hours(weekday) for weekday in range(7))
+        total = (days // 7) * week_hours
+        for offset in range(days - days % 7, days):
+            total += scheduled_hours((first + timedelta(days=offset)).weekday())
+
+        total -= sum(scheduled_hours(day.weekday()) for day in holidays)
+        return total
+
+
+working_calendar = WorkingCalendar()
+
+
+def get_expected_regular_hours(year, month):
+    return working_calendar.expected_hours(year, month)
+
+
+@event.listens_for(db.session, 'before_flush')
+def _collect_holiday_months(session, flush_context, instances):
+    months = session.info.setdefault('holiday_months', set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Holiday):
+            months.add((obj.date.year, obj.date.month))
+            for old in inspect(obj).attrs.date.history.deleted:
+                months.add((old.year, old.month))
+
+
+@event.listens_for(db.session, 'after_commit')
+def _invalidate_holiday_months(session):
+    months = session.info.pop('holiday_months', set())
+    if months:
+        working_calendar.invalidate(months, committed_versions(session, HOLIDAY_VERSION))
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_holiday_months(session):
+    session.info.pop('holiday_months', None)
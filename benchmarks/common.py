@@ -0,0 +1,72 @@
+# benchmarks/common.py
+#
+# Helpers shared by the benchmark scripts. Every benchmark runs against a
+# throwaway SQLite database so it never touches instance/attendance.db.
+
+import os
+import sys
+import random
+import tempfile
+import time as timer
+from datetime import date, time, timedelta
+from sqlalchemy import insert
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+_db_dir = tempfile.mkdtemp(prefix='attendance-bench-')
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(_db_dir, 'bench.db'))
+
+from attendance_app import app, db  # noqa: E402
+from attendance_app.models import User, Attendance, Deduction, AdvanceSalary  # noqa: E402
+
+# The scripts take the app from here, so it is set up on the throwaway database.
+__all__ = ['app', 'db', 'seed', 'best_of']
+
+
+def seed(employees, days, start=date(2025, 1, 1), seed_value=42):
+    """Create employees with `days` consecutive days of attendance each."""
+    rnd = random.Random(seed_value)
+    db.drop_all()
+    db.create_all()
+
+    db.session.execute(insert(User), [
+        {'name': f'Employee {i}', 'username': f'emp{i}', 'password': 'x', 'role': 'employee',
+         'salary_per_month': 1000 + i, 'serial_number': f'CARD{i:06d}'}
+        for i in range(employees)
+    ])
+    user_ids = [u.id for u in User.query.all()]
+
+    attendance, deductions, advances = [], [], []
+    for user_id in user_ids:
+        for offset in range(days):
+            day = start + timedelta(days=offset)
+            clock_in = time(rnd.randint(8, 11), rnd.randint(0, 59), rnd.randint(0, 59))
+            clock_out = time(rnd.randint(15, 21), rnd.randint(0, 59), rnd.randint(0, 59))
+            overtime = round(rnd.random() * 3, 2)
+            worked, regular = Attendance.compute_minutes(day, clock_in, clock_out, overtime)
+            attendance.append({'user_id': user_id, 'date': day, 'clock_in': clock_in, 'clock_out': clock_out,
+                               'overtime': overtime, 'late_minutes': rnd.randint(0, 30),
+                               'worked_minutes': worked, 'regular_minutes': regular})
+        for offset in range(0, days, 30):
+            day = start + timedelta(days=offset)
+            deductions.append({'user_id': user_id, 'amount': rnd.randint(1, 50), 'date': day})
+            advances.append({'user_id': user_id, 'amount': rnd.randint(1, 90), 'date': day})
+
+    db.session.execute(insert(Attendance), attendance)
+    db.session.execute(insert(Deduction), deductions)
+    db.session.execute(insert(AdvanceSalary), advances)
+    db.session.commit()
+    return start, start + timedelta(days=days - 1)
+
+
+def best_of(repeat, func, *args, **kwargs):
+    """Run func `repeat` times and return (best seconds, last result)."""
+    best, result = None, None
+    for _ in range(repeat):
+        started = timer.perf_counter()
+        result = func(*args, **kwargs)
+        elapsed = timer.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
@@ -0,0 +1,74 @@
+# benchmarks/export_benchmark.py
+#
+# Peak Python memory of the monthly payroll Excel export for a one-month
+# range and for the whole seeded range, comparing the DataFrame + BytesIO
+# export with the streaming writer in attendance_app.exports.
+#
+#   python benchmarks/export_benchmark.py --employees 100 --days 1825
+
+import argparse
+import io
+import tracemalloc
+from datetime import timedelta
+
+from common import app, db, seed, best_of
+import pandas as pd
+from attendance_app.exports import write_monthly_payroll_xlsx
+from attendance_app.reports import monthly_frame
+from attendance_app.rollup import rebuild_rollups
+
+
+def dataframe_export(start_date, end_date):
+    payroll = monthly_frame(start_date, end_date)
+    output = io.BytesIO()
+    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
+        payroll.to_excel(writer, sheet_name='Monthly Report', startrow=5, index=False)
+        for i, col in enumerate(payroll.columns):
+            writer.sheets['Monthly Report'].set_column(
+                i, i, max(payroll[col].astype(str).map(len).max(), len(col)) + 2)
+    return len(output.getvalue())
+
+
+def streaming_export(start_date, end_date):
+    output = write_monthly_payroll_xlsx(start_date, end_date)
+    size = output.seek(0, io.SEEK_END)
+    output.close()
+    return size
+
+
+def peak_memory(func, *args):
+    tracemalloc.start()
+    try:
+        func(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--employees', type=int, default=100)
+    parser.add_argument('--days', type=int, default=1825)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    with app.app_context():
+        start_date, end_date = seed(args.employees, args.days)
+        rollups = rebuild_rollups(db.session)
+        db.session.commit()
+
+        ranges = {
+            'one month': (start_date, start_date + timedelta(days=27)),
+            'full range': (start_date, end_date),
+        }
+        print(f"payroll rollup rows: {rollups}")
+        for label, (first, last) in ranges.items():
+            for name, func in (('DataFrame', dataframe_export), ('streaming', streaming_export)):
+                seconds, size = best_of(args.repeat, func, first, last)
+                peak = peak_memory(func, first, last)
+                print(f"{label:<10} {name:<9} {seconds * 1000:9.1f} ms  "
+                      f"peak {peak / 1024 / 1024:7.2f} MiB  file {size / 1024:8.1f} KiB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+# benchmarks/import_benchmark.py
+#
+# Attendance import throughput: the per-row loop import_attendance() used
+# to run against the column-wise pipeline in attendance_app.imports.
+#
+#   python benchmarks/import_benchmark.py --rows 50000 --employees 200
+
+import argparse
+import random
+from datetime import date, time, timedelta, datetime
+
+from common import app, db, seed, best_of
+import pandas as pd
+from attendance_app.models import User, Attendance, PayrollRollup
+from attendance_app.routes import calculate_attendance_metrics
+from attendance_app.imports import import_attendance_frame
+
+
+def make_sheet(rows, employees, seed_value=7):
+    rnd = random.Random(seed_value)
+    start = date(2025, 1, 1)
+    return pd.DataFrame([{
+        'username': f'emp{rnd.randrange(employees)}',
+        'date': (start + timedelta(days=rnd.randrange(365))).isoformat(),
+        'clock_in': time(rnd.randint(8, 11), rnd.randint(0, 59), rnd.randint(0, 59)).strftime('%H:%M:%S'),
+        'clock_out': time(rnd.randint(15, 21), rnd.randint(0, 59), rnd.randint(0, 59)).strftime('%H:%M:%S'),
+    } for _ in range(rows)])
+
+
+def clear():
+    db.session.query(Attendance).delete()
+    db.session.query(PayrollRollup).delete()
+    db.session.commit()
+
+
+def row_loop(df):
+    clear()
+    count = 0
+    for index, row in df.iterrows():
+        user = User.query.filter_by(username=str(row['username']).strip()).first()
+        if not user:
+            continue
+        att_date = pd.to_datetime(row['date']).date()
+        clock_in = datetime.strptime(str(row['clock_in']), '%H:%M:%S').time()
+        clock_out = datetime.strptime(str(row['clock_out']), '%H:%M:%S').time()
+        overtime, late_minutes = calculate_attendance_metrics(att_date, clock_in, clock_out)
+        db.session.add(Attendance(user_id=user.id, date=att_date, clock_in=clock_in, clock_out=clock_out,
+                                  overtime=overtime, late_minutes=late_minutes))
+        count += 1
+    db.session.commit()
+    return count
+
+
+def columnar(df):
+    clear()
+    summary = import_attendance_frame(df)
+    db.session.commit()
+    return summary['inserted']
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=50000)
+    parser.add_argument('--employees', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=1)
+    args = parser.parse_args()
+
+    with app.app_context():
+        seed(args.employees, 1)
+        df = make_sheet(args.rows, args.employees)
+
+        loop_seconds, loop_count = best_of(args.repeat, row_loop, df)
+        col_seconds, col_count = best_of(args.repeat, columnar, df)
+        assert loop_count == col_count
+
+        print(f"rows:         {args.rows}")
+        print(f"row loop:     {loop_seconds:8.2f} s  {args.rows / loop_seconds:10,.0f} rows/s")
+        print(f"column-wise:  {col_seconds:8.2f} s  {args.rows / col_seconds:10,.0f} rows/s")
+        print(f"speedup:      {loop_seconds / col_seconds:8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
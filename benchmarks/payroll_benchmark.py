@@ -0,0 +1,92 @@
+# benchmarks/payroll_benchmark.py
+#
+# Compares the per-row ORM payroll loop that report() used to run with the
+# vectorized calculator in attendance_app.payroll.
+#
+#   python benchmarks/payroll_benchmark.py --employees 100 --days 120
+
+import argparse
+from calendar import monthrange
+from datetime import date
+
+from common import app, db, seed, best_of
+import pandas as pd
+from sqlalchemy import func
+from attendance_app.models import User, Attendance, Deduction, AdvanceSalary
+from attendance_app.payroll import load_attendance_frame, monthly_hours, payroll_frame, get_expected_regular_hours
+
+
+def orm_payroll(start_date, end_date):
+    users = {u.id: u for u in User.query.all()}
+    result = {}
+    for user_id, month in db.session.query(
+        Attendance.user_id, func.strftime('%Y-%m', Attendance.date)
+    ).filter(Attendance.date >= start_date, Attendance.date <= end_date).distinct().all():
+        year, month_num = map(int, month.split('-'))
+        month_start = date(year, month_num, 1)
+        month_end = date(year, month_num, monthrange(year, month_num)[1])
+
+        attendances = Attendance.query.filter(
+            Attendance.user_id == user_id,
+            Attendance.date >= month_start,
+            Attendance.date <= month_end,
+        ).all()
+        regular_hours = sum(att.regular_hours or 0 for att in attendances)
+        overtime = sum(att.overtime or 0 for att in attendances)
+
+        deductions = Deduction.query.filter(
+            Deduction.user_id == user_id, Deduction.date >= month_start, Deduction.date <= month_end
+        ).with_entities(func.coalesce(func.sum(Deduction.amount), 0)).scalar()
+        advances = AdvanceSalary.query.filter(
+            AdvanceSalary.user_id == user_id, AdvanceSalary.date >= month_start, AdvanceSalary.date <= month_end
+        ).with_entities(func.coalesce(func.sum(AdvanceSalary.amount), 0)).scalar()
+
+        hourly_rate = users[user_id].salary_per_month / get_expected_regular_hours(year, month_num)
+        pay = regular_hours * hourly_rate + overtime * hourly_rate * 1.5
+        result[(user_id, month)] = round(pay - deductions - advances, 2)
+    return result
+
+
+def vectorized_payroll(start_date, end_date):
+    hours = monthly_hours(load_attendance_frame(start_date, end_date))
+    for model, column in ((Deduction, 'deductions'), (AdvanceSalary, 'advances')):
+        month = func.strftime('%Y-%m', model.date).label('month')
+        amounts = pd.read_sql(
+            db.select(model.user_id, month, func.sum(model.amount).label(column)).group_by(model.user_id, month),
+            db.session.connection()
+        )
+        hours = hours.merge(amounts, on=['user_id', 'month'], how='left')
+    salaries = pd.read_sql(db.select(User.id.label('user_id'), User.salary_per_month.label('salary')),
+                           db.session.connection())
+    frame = payroll_frame(hours.merge(salaries, on='user_id', how='left'))
+    return dict(zip(zip(frame['user_id'], frame['month']), frame['total_salary']))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--employees', type=int, default=100)
+    parser.add_argument('--days', type=int, default=120)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    with app.app_context():
+        start_date, end_date = seed(args.employees, args.days)
+        rows = Attendance.query.count()
+
+        orm_seconds, orm_result = best_of(args.repeat, orm_payroll, start_date, end_date)
+        db.session.expunge_all()
+        vec_seconds, vec_result = best_of(args.repeat, vectorized_payroll, start_date, end_date)
+
+        # The ORM loop sums hours rounded per session, the vectorized path sums
+        # the exact stored minutes, so totals may differ by a few cents.
+        max_difference = max(abs(orm_result[key] - vec_result[key]) for key in orm_result)
+        print(f"attendance rows:      {rows}")
+        print(f"employee-months:      {len(orm_result)}")
+        print(f"ORM loop:             {orm_seconds * 1000:9.1f} ms")
+        print(f"vectorized:           {vec_seconds * 1000:9.1f} ms")
+        print(f"speedup:              {orm_seconds / vec_seconds:9.1f}x")
+        print(f"max total difference: {max_difference:9.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+# benchmarks/payslip_benchmark.py
+#
+# Time to produce one month of payslips for every employee: the old way,
+# one print_report-style query and PDF at a time, against
+# attendance_app.payslips, which prices everyone in one pass and renders
+# the PDFs in this process, or in a spawned pool of --workers processes.
+# Needs WeasyPrint with its native libraries (Pango); no timings are
+# recorded here because they depend on those and on the core count.
+#
+#   python benchmarks/payslip_benchmark.py --employees 500 --workers 4
+
+import argparse
+
+from common import app, db, seed, best_of
+from weasyprint import HTML
+from flask import render_template
+from attendance_app.models import User
+from attendance_app.payslips import build_payslips, payslip_context
+from attendance_app.reports import employee_month
+from attendance_app.rollup import rebuild_rollups
+
+
+def one_by_one(year, month):
+    pdfs = []
+    for user in User.query.filter_by(role='employee').all():
+        row = employee_month(user, year, month)
+        html = render_template('print_monthly_report.html', **payslip_context(user, row, year, month))
+        pdfs.append(HTML(string=html).write_pdf())
+    return len(pdfs)
+
+
+def bulk(year, month, output_format, workers):
+    output, _, _ = build_payslips(year, month, output_format, workers=workers)
+    output.close()
+    return output_format
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--employees', type=int, default=500)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=1)
+    args = parser.parse_args()
+
+    with app.app_context():
+        start_date, _ = seed(args.employees, 31)
+        rebuild_rollups(db.session)
+        db.session.commit()
+        year, month = start_date.year, start_date.month
+
+        seconds, count = best_of(args.repeat, one_by_one, year, month)
+        print(f"employees:            {count}")
+        print(f"one at a time:        {seconds:9.2f} s  ({seconds / count * 1000:.1f} ms per payslip)")
+        for output_format in ('zip', 'pdf'):
+            bulk_seconds, _ = best_of(args.repeat, bulk, year, month, output_format, args.workers)
+            print(f"bulk {output_format}:             {bulk_seconds:9.2f} s  ({seconds / bulk_seconds:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+# benchmarks/punch_benchmark.py
+#
+# Punch throughput with N worker processes sharing one SQLite file, the way
+# gunicorn workers do. Each worker runs --threads request threads posting
+# card scans to /attendance/scan as fast as they can while --readers
+# processes run the monthly payroll report in a loop. Run once with the WAL
+# / synchronous=NORMAL defaults, once with group commit on top of them and
+# once with the old rollback journal and synchronous=FULL. Commits/punch is
+# the number of write transactions (each one fsync with synchronous=FULL)
+# per punch, derivation runs included.
+#
+#   python benchmarks/punch_benchmark.py --workers 1 2 4 8 --punches 200
+#   python benchmarks/punch_benchmark.py --workers 2 --threads 16 --synchronous FULL
+
+import argparse
+import multiprocessing
+import os
+import tempfile
+import threading
+import time as timer
+
+MODES = {
+    'tuned': {'SQLITE_WAL': '1', 'SQLITE_SYNCHRONOUS': 'NORMAL', 'SQLITE_BUSY_TIMEOUT': '10000',
+              'GROUP_COMMIT': '0'},
+    'group': {'SQLITE_WAL': '1', 'SQLITE_SYNCHRONOUS': 'NORMAL', 'SQLITE_BUSY_TIMEOUT': '10000',
+              'GROUP_COMMIT': '1'},
+    'baseline': {'SQLITE_WAL': '0', 'SQLITE_SYNCHRONOUS': 'FULL', 'SQLITE_BUSY_TIMEOUT': '5000',
+                 'GROUP_COMMIT': '0'},
+}
+
+
+def seed_database(employees, days):
+    from common import app, seed
+    with app.app_context():
+        start, end = seed(employees, days)
+    return start, end
+
+
+def punch_thread(app, first, step, punches, employees, latencies, errors):
+    client = app.test_client()
+    for i in range(punches):
+        serial = f'CARD{(first + i * step) % employees:06d}'
+        started = timer.perf_counter()
+        try:
+            status = client.post('/attendance/scan', data={'serial_number': serial}).status_code
+        except Exception:
+            status = None
+        latencies.append(timer.perf_counter() - started)
+        errors.append(status != 200)
+
+
+def punch_worker(index, workers, threads, punches, employees, start, results):
+    from common import app
+    from attendance_app.database import write_queue
+    latencies, errors = [], []
+    pool = [
+        threading.Thread(target=punch_thread, args=(
+            app, index * threads + t, workers * threads, punches, employees, latencies, errors
+        ))
+        for t in range(threads)
+    ]
+    start.wait()
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    results.put((latencies, sum(errors), write_queue.stats()['commits']))
+
+
+def report_reader(start_date, end_date, start, stop):
+    from common import app
+    from attendance_app.reports import monthly_frame
+    with app.app_context():
+        start.wait()
+        while not stop.is_set():
+            monthly_frame(start_date, end_date)
+
+
+def run(mode, workers, threads, punches, employees, days, readers, synchronous=None):
+    directory = tempfile.mkdtemp(prefix='attendance-punch-bench-')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(directory, 'bench.db')
+    os.environ.update(MODES[mode])
+    if synchronous:
+        os.environ['SQLITE_SYNCHRONOUS'] = synchronous
+
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(1) as pool:
+        start_date, end_date = pool.apply(seed_database, (employees, days))
+
+    start, stop, results = context.Event(), context.Event(), context.Queue()
+    processes = [
+        context.Process(target=punch_worker, args=(i, workers, threads, punches, employees, start, results))
+        for i in range(workers)
+    ]
+    background = [
+        context.Process(target=report_reader, args=(start_date, end_date, start, stop))
+        for _ in range(readers)
+    ]
+    for process in processes + background:
+        process.start()
+    timer.sleep(2)  # let every process import the app before the clock starts
+
+    started = timer.perf_counter()
+    start.set()
+    latencies, errors, commits = [], 0, 0
+    for _ in processes:
+        worker_latencies, worker_errors, worker_commits = results.get()
+        latencies += worker_latencies
+        errors += worker_errors
+        commits += worker_commits
+    elapsed = timer.perf_counter() - started
+    stop.set()
+    for process in processes + background:
+        process.join()
+
+    latencies.sort()
+    return {
+        'rate': len(latencies) / elapsed,
+        'p50': 1000 * latencies[len(latencies) // 2],
+        'p95': 1000 * latencies[int(len(latencies) * 0.95)],
+        'commits': commits / len(latencies),
+        'errors': errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--threads', type=int, default=1, help='Request threads per worker.')
+    parser.add_argument('--punches', type=int, default=200, help='Punches per thread.')
+    parser.add_argument('--employees', type=int, default=200)
+    parser.add_argument('--days', type=int, default=90, help='Attendance history to seed.')
+    parser.add_argument('--readers', type=int, default=1, help='Processes running the payroll report meanwhile.')
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=list(MODES))
+    parser.add_argument('--synchronous', choices=('NORMAL', 'FULL'),
+                        help='Override the synchronous level of every mode.')
+    args = parser.parse_args()
+
+    print(f"{'mode':<10}{'workers':>8}{'punches/s':>12}{'p50 ms':>9}{'p95 ms':>9}"
+          f"{'commits/punch':>15}{'errors':>8}")
+    for mode in args.modes:
+        for workers in args.workers:
+            result = run(mode, workers, args.threads, args.punches, args.employees, args.days,
+                         args.readers, args.synchronous)
+            print(f"{mode:<10}{workers:>8}{result['rate']:>12,.0f}{result['p50']:>9.1f}"
+                  f"{result['p95']:>9.1f}{result['commits']:>15.2f}{result['errors']:>8}")
+
+
+if __name__ == '__main__':
+    main()
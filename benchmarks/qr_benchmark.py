@@ -0,0 +1,81 @@
+# benchmarks/qr_benchmark.py
+#
+# Latency of one kiosk QR image: the old path (qrcode.make() drawn through
+# Pillow module by module, then PNG-encoded) against attendance_app.qr_render
+# rendering PNG and SVG from the module matrix, a render cache hit, and the
+# /live-qr-image route itself when the token's image was pre-rendered.
+#
+#   python benchmarks/qr_benchmark.py --images 200
+
+import argparse
+import io
+import statistics
+import time as timer
+
+import qrcode
+from common import app
+from flask import url_for
+from attendance_app.qr_render import render_qr, prerender_qr, qr_cache
+from attendance_app.qr_tokens import issue_token
+
+
+def pillow_png(payload):
+    buf = io.BytesIO()
+    qrcode.make(payload).save(buf, format='PNG')
+    return buf.getvalue()
+
+
+def latencies(func, payloads):
+    samples = []
+    for payload in payloads:
+        started = timer.perf_counter()
+        func(payload)
+        samples.append(1000 * (timer.perf_counter() - started))
+    return samples
+
+
+def report(label, samples):
+    samples = sorted(samples)
+    print(f"{label:<28}{statistics.median(samples):>9.3f}{samples[int(len(samples) * 0.95)]:>9.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--images', type=int, default=200, help='Distinct tokens to render.')
+    args = parser.parse_args()
+
+    with app.test_request_context():
+        payloads = [
+            f'http://localhost/qr/clock?token={issue_token("main", window * app.config["QR_TOKEN_SECONDS"])}'
+            for window in range(1, args.images + 1)
+        ]
+
+    print(f"{'path':<28}{'p50 ms':>9}{'p95 ms':>9}")
+    report('pillow png (old)', latencies(pillow_png, payloads))
+    qr_cache.clear()
+    report('local png, cold', latencies(lambda payload: render_qr(payload, 'png'), payloads))
+    qr_cache.clear()
+    report('local svg, cold', latencies(lambda payload: render_qr(payload, 'svg'), payloads))
+    report('local svg, cached', latencies(lambda payload: render_qr(payload, 'svg'), payloads[-50:]))
+
+    # The route: a kiosk refresh right after the rotation, with and without
+    # the image rendered ahead of time.
+    client = app.test_client()
+    now = timer.time()
+    tokens = [issue_token(f'k{i}', now) for i in range(min(args.images, 60))]
+    qr_cache.clear()
+    report('/live-qr-image, cold', latencies(
+        lambda token: client.get('/live-qr-image', query_string={'token': token, 'format': 'svg'}), tokens
+    ))
+    qr_cache.clear()
+    with app.test_request_context():
+        futures = [prerender_qr(url_for('qr_clock', token=token, _external=True), 'svg') for token in tokens]
+    for future in futures:
+        future.result()
+    report('/live-qr-image, prerendered', latencies(
+        lambda token: client.get('/live-qr-image', query_string={'token': token, 'format': 'svg'}), tokens
+    ))
+
+
+if __name__ == '__main__':
+    main()
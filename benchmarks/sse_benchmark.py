@@ -0,0 +1,112 @@
+# benchmarks/sse_benchmark.py
+#
+# Cost of pushing live updates to many screens. Opens --subscribers
+# /live/stream?punches=1 connections through the test client, each read by
+# its own thread as a browser would, publishes --events punch events and
+# reports how long publish() takes (the fan-out cost paid by the punch
+# path) and how long until every subscriber has each event. For comparison
+# it times the polling the kiosk pages used to do: one /live-qr-token
+# request per client every 15 seconds.
+#
+#   python benchmarks/sse_benchmark.py --subscribers 200 --events 50
+
+import argparse
+import json
+import statistics
+import threading
+import time as timer
+
+from common import app, db
+from attendance_app.models import User
+from attendance_app.live import broker, PUNCH_TOPIC
+
+POLL_INTERVAL = 15  # seconds, what the kiosk pages polled at
+
+
+def subscriber(client, events, received, ready):
+    response = client.get('/live/stream', query_string={'punches': 1}, buffered=False)
+    ready.release()
+    seen = 0
+    try:
+        for chunk in response.response:
+            frame = chunk.decode() if isinstance(chunk, bytes) else chunk
+            if not frame.startswith('event: punch'):
+                continue
+            data = json.loads(frame.split('data: ', 1)[1])
+            received[data['seq']].append(timer.perf_counter() - data['sent'])
+            seen += 1
+            if seen == events:
+                break
+    finally:
+        response.close()
+
+
+def manager_client(user_id):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+        session['_fresh'] = True
+    return client
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--subscribers', type=int, default=200)
+    parser.add_argument('--events', type=int, default=50)
+    args = parser.parse_args()
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        manager = User(name='Manager', username='manager', password='x', role='manager', salary_per_month=0)
+        db.session.add(manager)
+        db.session.commit()
+        manager_id = manager.id
+
+    # Polling: server time per request, times the clients polling.
+    client = manager_client(manager_id)
+    polls = []
+    for _ in range(200):
+        started = timer.perf_counter()
+        client.get('/live-qr-token')
+        polls.append(timer.perf_counter() - started)
+    poll_ms = 1000 * statistics.median(polls)
+
+    ready = threading.Semaphore(0)
+    received = {seq: [] for seq in range(args.events)}
+    threads = [
+        threading.Thread(target=subscriber, args=(manager_client(manager_id), args.events, received, ready))
+        for _ in range(args.subscribers)
+    ]
+    for thread in threads:
+        thread.start()
+    for _ in threads:
+        ready.acquire()
+    while broker.subscribers(PUNCH_TOPIC) < args.subscribers:
+        timer.sleep(0.01)
+
+    publish = []
+    for seq in range(args.events):
+        started = timer.perf_counter()
+        broker.publish(PUNCH_TOPIC, 'punch', {'seq': seq, 'sent': started, 'user_id': 1, 'kind': 'in'})
+        publish.append(timer.perf_counter() - started)
+        while len(received[seq]) < args.subscribers:
+            timer.sleep(0.0005)
+    for thread in threads:
+        thread.join()
+
+    last = sorted(1000 * max(latencies) for latencies in received.values())
+    every = sorted(1000 * latency for latencies in received.values() for latency in latencies)
+    print(f"subscribers:                 {args.subscribers}")
+    print(f"publish (fan-out) p50:       {1000 * statistics.median(publish):8.3f} ms")
+    print(f"delivery p50 / p95:          {every[len(every) // 2]:8.3f} / {every[int(len(every) * 0.95)]:.3f} ms")
+    print(f"last subscriber p50:         {last[len(last) // 2]:8.3f} ms")
+    print(f"polling, per request:        {poll_ms:8.3f} ms")
+    print(f"polling, server time/minute: {poll_ms * args.subscribers * 60 / POLL_INTERVAL:8.1f} ms "
+          f"({args.subscribers * 60 // POLL_INTERVAL} requests)")
+    print(f"push, publish time/minute:   {1000 * statistics.median(publish) * 60 / POLL_INTERVAL:8.3f} ms "
+          f"(one token event per rotation)")
+
+
+if __name__ == '__main__':
+    main()
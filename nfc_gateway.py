@@ -0,0 +1,289 @@
+# nfc_gateway.py
+#
+# One process for every door. Each reader's serial port is read by its own
+# asyncio task; repeated reads of the same tag on the same reader within the
+# dedupe window are dropped, and every accepted scan goes into the shared
+# durable spool from nfc_read.py, tagged with the reader it came from. A
+# single upload task sends the spool to /api/clock-events in batches, so all
+# doors share one pooled HTTP connection.
+#
+#   reader door-1 --\
+#   reader door-2 ---+--(dedupe)--> SQLite spool --(upload task)--> server
+#   reader door-3 --/
+#
+# Blocking port reads and spool / HTTP calls run on a small thread pool so
+# the event loop never waits on them. Per-reader scan counts, duplicates,
+# scans waiting for upload and scan-to-server latency are printed every
+# STATS_INTERVAL seconds and served as JSON on --stats-port.
+#
+#   python nfc_gateway.py --reader door-1=COM4 --reader door-2=COM5 \
+#       --url http://127.0.0.1:5000/api/clock-events
+
+import argparse
+import asyncio
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from nfc_read import SCAN_BYTES, BATCH_SIZE, FLUSH_INTERVAL, Spool, Uploader, open_serial, _close_quietly
+
+DEDUPE_WINDOW = 3.0     # seconds a tag is ignored on the same reader after a scan
+REOPEN_DELAY = 5.0      # seconds before reopening a port that failed
+STATS_INTERVAL = 60.0   # seconds between stats lines
+LATENCY_SAMPLES = 1000  # latencies kept per reader for the percentiles
+
+
+class ReaderStats:
+    def __init__(self):
+        self.scans = 0
+        self.duplicates = 0
+        self.waiting = 0
+        self.errors = 0
+        self.last_scan = None
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+
+    def as_dict(self):
+        latencies = sorted(self.latencies)
+
+        def percentile(p):
+            return round(1000 * latencies[min(len(latencies) - 1, int(p * len(latencies)))], 1) if latencies else None
+
+        return {
+            'scans': self.scans,
+            'duplicates': self.duplicates,
+            'waiting': self.waiting,
+            'errors': self.errors,
+            'last_scan': self.last_scan,
+            'latency_ms': {'p50': percentile(0.5), 'p95': percentile(0.95),
+                           'max': round(1000 * latencies[-1], 1) if latencies else None},
+        }
+
+
+class Gateway:
+    """
+    Reads every port in readers ({reader_id: port name}) and uploads the
+    scans through uploader. open_port(name) returns an object with a
+    read(n) method returning bytes (empty on timeout) and close().
+    """
+
+    def __init__(self, readers, spool, uploader, open_port, dedupe_window=DEDUPE_WINDOW,
+                 flush_interval=FLUSH_INTERVAL, scan_bytes=SCAN_BYTES, clock=time.monotonic):
+        self.readers = dict(readers)
+        self.spool = spool
+        self.uploader = uploader
+        self.open_port = open_port
+        self.dedupe_window = dedupe_window
+        self.flush_interval = flush_interval
+        self.scan_bytes = scan_bytes
+        self.clock = clock
+        self.stats = {reader_id: ReaderStats() for reader_id in self.readers}
+        self.batches = 0
+        self._last_accepted = {}  # (reader_id, uid) -> clock() of the last accepted scan
+        self._inflight = {}       # spool key -> (reader_id, clock() when read)
+        self._depth = 0
+        self._pending = None
+        self._stopping = None
+        self._loop = None
+        # One thread per port for the blocking reads, plus the spool and uploader.
+        self._executor = ThreadPoolExecutor(max_workers=len(self.readers) + 2, thread_name_prefix='gateway')
+        uploader.on_sent = self._on_sent
+
+    def _run(self, func, *args):
+        return self._loop.run_in_executor(self._executor, func, *args)
+
+    def queue_depth(self):
+        return self._depth
+
+    def snapshot(self):
+        return {
+            'queue_depth': self._depth,
+            'batches': self.batches,
+            'batch_size': self.uploader.batch_size,
+            'backoff': self.uploader.backoff,
+            'readers': {reader_id: stats.as_dict() for reader_id, stats in self.stats.items()},
+        }
+
+    def accept(self, reader_id, uid, now):
+        """False when uid was already accepted on this reader within the dedupe window."""
+        last = self._last_accepted.get((reader_id, uid))
+        if last is not None and now - last < self.dedupe_window:
+            return False
+        self._last_accepted[reader_id, uid] = now
+        if len(self._last_accepted) > 4096:
+            self._last_accepted = {
+                key: seen for key, seen in self._last_accepted.items() if now - seen < self.dedupe_window
+            }
+        return True
+
+    async def read_port(self, reader_id):
+        name, stats = self.readers[reader_id], self.stats[reader_id]
+        port = None
+        while not self._stopping.is_set():
+            try:
+                if port is None:
+                    port = await self._run(self.open_port, name)
+                    print(f"📡 {reader_id}: listening on {name}")
+                data = await self._run(port.read, self.scan_bytes)
+            except Exception as e:
+                print(f"❌ {reader_id}: serial error on {name}:", e)
+                stats.errors += 1
+                if port is not None:
+                    await self._run(_close_quietly, port)
+                    port = None
+                await self._wait(REOPEN_DELAY)
+                continue
+            if not data:
+                continue
+
+            read_at = self.clock()
+            uid_hex = data.hex().upper()
+            if not self.accept(reader_id, uid_hex, read_at):
+                stats.duplicates += 1
+                continue
+            key = await self._run(self.spool.append, uid_hex, None, reader_id)
+            self._inflight[key] = (reader_id, read_at)
+            self._depth += 1
+            stats.scans += 1
+            stats.waiting += 1
+            stats.last_scan = time.strftime('%Y-%m-%dT%H:%M:%S')
+            self._pending.set()
+            print(f"🆔 {reader_id}: tag scanned {uid_hex} ({self._depth} waiting)")
+        if port is not None:
+            await self._run(_close_quietly, port)
+
+    def _on_sent(self, keys):
+        # Called on an executor thread by Uploader.upload_once.
+        self._loop.call_soon_threadsafe(self._acknowledge, keys, self.clock())
+
+    def _acknowledge(self, keys, acked_at):
+        self.batches += 1
+        self._depth = max(0, self._depth - len(keys))
+        for key in keys:
+            reader_id, read_at = self._inflight.pop(key, (None, None))
+            stats = self.stats.get(reader_id)
+            if stats is not None:
+                stats.waiting -= 1
+                stats.latencies.append(acked_at - read_at)
+
+    async def upload(self):
+        """Upload loop: drain the spool whenever scans arrive, backing off while the server is unreachable."""
+        while True:
+            try:
+                await asyncio.wait_for(self._pending.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            if self._stopping.is_set():
+                break
+            if self._pending.is_set() and self._depth < self.uploader.batch_size:
+                # Give the other doors a moment to add to this batch.
+                await self._wait(self.flush_interval)
+            self._pending.clear()
+            await self._drain()
+        await self._run(self.uploader.upload_once)
+
+    async def _drain(self):
+        while not self._stopping.is_set():
+            sent = await self._run(self.uploader.upload_once)
+            if sent is None:
+                await self._wait(self.uploader.next_backoff())
+                continue
+            self.uploader.backoff = 0.0
+            if sent < self.uploader.batch_size:
+                break
+
+    async def _wait(self, delay):
+        try:
+            await asyncio.wait_for(self._stopping.wait(), delay)
+        except asyncio.TimeoutError:
+            pass
+
+    async def report(self, interval=STATS_INTERVAL):
+        while not self._stopping.is_set():
+            await self._wait(interval)
+            for reader_id, stats in self.snapshot()['readers'].items():
+                latency = stats['latency_ms']
+                print(f"📊 {reader_id}: {stats['scans']} scans, {stats['duplicates']} duplicates, "
+                      f"{stats['waiting']} waiting, p50 {latency['p50']} ms, p95 {latency['p95']} ms")
+            print(f"📊 {self._depth} scan(s) waiting for upload")
+
+    async def _serve_stats(self, reader, writer):
+        try:
+            await reader.readline()
+            body = json.dumps(self.snapshot()).encode()
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                         b"Content-Length: " + str(len(body)).encode() + b"\r\nConnection: close\r\n\r\n" + body)
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def run(self, stats_port=None, stats_interval=STATS_INTERVAL):
+        """Run until stop() is called (or the task is cancelled)."""
+        self._loop = asyncio.get_running_loop()
+        self._pending = asyncio.Event()
+        self._stopping = asyncio.Event()
+        self._depth = await self._run(len, self.spool)
+        if self._depth:
+            self._pending.set()  # upload whatever is left from the last run
+
+        server = None
+        if stats_port:
+            server = await asyncio.start_server(self._serve_stats, '127.0.0.1', stats_port)
+        tasks = [asyncio.create_task(self.read_port(reader_id)) for reader_id in self.readers]
+        tasks.append(asyncio.create_task(self.upload()))
+        tasks.append(asyncio.create_task(self.report(stats_interval)))
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            self._stopping.set()
+            if server is not None:
+                server.close()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self._executor.shutdown(wait=False)
+
+    def stop(self):
+        self._loop.call_soon_threadsafe(self._stopping.set)
+
+
+def parse_reader(value):
+    reader_id, sep, port = value.partition('=')
+    if not sep or not reader_id or not port:
+        raise argparse.ArgumentTypeError("expected READER_ID=PORT, e.g. door-1=COM4")
+    return reader_id, port
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--reader', type=parse_reader, action='append', required=True,
+                        help='READER_ID=PORT, once per door')
+    parser.add_argument('--baud', type=int, default=9600)
+    parser.add_argument('--url', default=os.environ.get('READER_URL', 'http://127.0.0.1:5000/api/clock-events'))
+    parser.add_argument('--spool', default=os.environ.get('READER_SPOOL', 'nfc_gateway_spool.db'))
+    parser.add_argument('--dedupe-seconds', type=float, default=DEDUPE_WINDOW)
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--flush-interval', type=float, default=FLUSH_INTERVAL)
+    parser.add_argument('--stats-port', type=int, default=None)
+    parser.add_argument('--stats-interval', type=float, default=STATS_INTERVAL)
+    args = parser.parse_args()
+
+    readers = dict(args.reader)
+    if len(readers) != len(args.reader):
+        parser.error("reader ids must be unique")
+
+    spool = Spool(args.spool)
+    uploader = Uploader(spool, args.url, 'gateway', token=os.environ.get('READER_API_TOKEN'),
+                        batch_size=args.batch_size, flush_interval=args.flush_interval)
+    gateway = Gateway(readers, spool, uploader, lambda name: open_serial(name, args.baud),
+                      dedupe_window=args.dedupe_seconds, flush_interval=args.flush_interval)
+    print(f"📡 Gateway for {len(readers)} reader(s), {len(spool)} scan(s) waiting...")
+    try:
+        asyncio.run(gateway.run(stats_port=args.stats_port, stats_interval=args.stats_interval))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        spool.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,31 +1,271 @@
-# nfc_scanner.py
-import serial
+# nfc_read.py
+#
+# NFC reader client. Three parts connected by a durable local spool:
+#
+#   serial port --(reader thread)--> SQLite spool --(uploader thread)--> server
+#
+# Every scan is written to the spool before anything else, so scans survive
+# a slow or unreachable server and reader restarts. The uploader sends the
+# oldest spooled scans in batches to /api/clock-events over one pooled
+# requests.Session, retrying with exponential backoff, and removes them only
+# once the server has answered for them. Each scan carries its own
+# idempotency key, so a batch re-sent after a lost response is harmless.
+# A serial port that fails (unplugged adapter, driver reset) is closed and
+# reopened, backing off while it keeps failing.
+#
+# The serial port opener, HTTP session, clock and sleep are all passed in,
+# so the pipeline can be driven by a fake port and a local stub server
+# (see tests/test_nfc_read.py).
+#
+#   python nfc_read.py --port COM4 --url http://127.0.0.1:5000/api/clock-events
+
+import argparse
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+
 import requests
+from requests.adapters import HTTPAdapter
+
+SCAN_BYTES = 7          # bytes per tag read from the serial port
+BATCH_SIZE = 100        # scans per upload
+FLUSH_INTERVAL = 0.5    # seconds to wait for more scans before uploading
+REQUEST_TIMEOUT = 10    # seconds
+BACKOFF_START = 1.0     # seconds
+BACKOFF_MAX = 60.0      # seconds
+REOPEN_DELAY = 5.0      # seconds before reopening a port that failed, doubling up to BACKOFF_MAX
+
+
+class Spool:
+    """Durable FIFO of scans waiting to be uploaded (SQLite, safe across threads)."""
+
+    def __init__(self, path):
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=FULL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS scan ("
+                " id INTEGER PRIMARY KEY,"
+                " key TEXT NOT NULL UNIQUE,"
+                " serial TEXT NOT NULL,"
+                " timestamp TEXT NOT NULL,"
+                " reader_id TEXT)"
+            )
+            columns = [row[1] for row in self._db.execute("PRAGMA table_info(scan)")]
+            if 'reader_id' not in columns:  # spool written by an older client
+                self._db.execute("ALTER TABLE scan ADD COLUMN reader_id TEXT")
+
+    def append(self, serial, timestamp=None, reader_id=None):
+        """Record a scan; returns its idempotency key."""
+        key = uuid.uuid4().hex
+        timestamp = (timestamp or datetime.now()).isoformat()
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO scan (key, serial, timestamp, reader_id) VALUES (?, ?, ?, ?)",
+                (key, serial, timestamp, reader_id)
+            )
+        return key
+
+    def peek(self, limit):
+        """The oldest scans as (id, key, serial, timestamp, reader_id) tuples."""
+        with self._lock:
+            return self._db.execute(
+                "SELECT id, key, serial, timestamp, reader_id FROM scan ORDER BY id LIMIT ?", (limit,)
+            ).fetchall()
+
+    def remove(self, ids):
+        with self._lock:
+            self._db.executemany("DELETE FROM scan WHERE id = ?", [(scan_id,) for scan_id in ids])
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM scan").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def read_scans(open_port, spool, stop, pending, scan_bytes=SCAN_BYTES):
+    """
+    Reader loop: spool every tag read from the port open_port() returns
+    (anything with a read(n) method returning bytes, empty on timeout, and
+    close()) until stop is set. A port that raises is closed and reopened.
+    """
+    port = None
+    delay = 0.0
+    while not stop.is_set():
+        try:
+            if port is None:
+                port = open_port()
+                if delay:
+                    print("📡 Serial port reopened")
+            data = port.read(scan_bytes)
+        except Exception as e:
+            print("❌ Serial error:", e)
+            if port is not None:
+                _close_quietly(port)
+                port = None
+            delay = min(BACKOFF_MAX, delay * 2 if delay else REOPEN_DELAY)
+            stop.wait(delay)
+            continue
+        delay = 0.0
+        if not data:
+            continue
+        uid_hex = data.hex().upper()
+        spool.append(uid_hex)
+        pending.set()
+        print(f"🆔 Tag scanned: {uid_hex} ({len(spool)} waiting)")
+    if port is not None:
+        _close_quietly(port)
+
+
+def _close_quietly(port):
+    try:
+        port.close()
+    except Exception:
+        pass
+
+
+class Uploader:
+    """Sends spooled scans to the server in batches, backing off while it is unreachable."""
+
+    def __init__(self, spool, url, reader_id, token=None, session=None, batch_size=BATCH_SIZE,
+                 flush_interval=FLUSH_INTERVAL, sleep=time.sleep, clock=time.monotonic, on_sent=None):
+        self.spool = spool
+        self.url = url
+        self.reader_id = reader_id
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.sleep = sleep
+        self.clock = clock
+        self.on_sent = on_sent  # called with the keys of every batch the server answered for
+        self.backoff = 0.0
+        self.session = session or self._make_session()
+        if token:
+            self.session.headers['Authorization'] = f'Bearer {token}'
+
+    @staticmethod
+    def _make_session():
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=2)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def upload_once(self):
+        """
+        Send one batch. Returns the number of scans the server answered for,
+        0 when the spool is empty, or None when the upload failed.
+        """
+        batch = self.spool.peek(self.batch_size)
+        if not batch:
+            return 0
+        events = [
+            {'key': key, 'reader_id': reader_id or self.reader_id, 'serial': serial, 'timestamp': timestamp}
+            for _, key, serial, timestamp, reader_id in batch
+        ]
+        try:
+            response = self.session.post(self.url, json={'events': events}, timeout=REQUEST_TIMEOUT)
+        except requests.RequestException as e:
+            print("❌ Could not reach the server:", e)
+            return None
+
+        if response.status_code == 413 and self.batch_size > 1:
+            self.batch_size = max(1, self.batch_size // 2)
+            return None
+        try:
+            response.raise_for_status()
+            results = response.json()['results']
+        except (requests.RequestException, ValueError, KeyError) as e:
+            print(f"❌ Server answered {response.status_code}: {e}")
+            return None
+
+        # 'stale' is the server refusing a scan outside its accepted time
+        # window (READER_EVENT_MAX_AGE / READER_EVENT_MAX_AHEAD); like the
+        # other refusals it is final, so the scan leaves the spool.
+        for result in results:
+            if result.get('result') in ('unknown_card', 'invalid', 'stale'):
+                print(f"⚠️ Scan {result.get('key')}: {result['result']}")
+        self.spool.remove([scan_id for scan_id, *_ in batch])
+        if self.on_sent:
+            self.on_sent([key for _, key, *_ in batch])
+        return len(batch)
+
+    def next_backoff(self):
+        """Seconds to wait after a failed upload: doubling, capped, with jitter."""
+        self.backoff = min(BACKOFF_MAX, self.backoff * 2 if self.backoff else BACKOFF_START)
+        return self.backoff * random.uniform(0.5, 1.0)
+
+    def _wait_backoff(self, stop):
+        deadline = self.clock() + self.next_backoff()
+        while not stop.is_set() and self.clock() < deadline:
+            self.sleep(min(0.2, deadline - self.clock()))
+
+    def run(self, stop, pending):
+        """Uploader loop: drain the spool until stop is set, then make one last attempt."""
+        while not stop.is_set():
+            pending.wait(self.flush_interval)
+            pending.clear()
+            while not stop.is_set():
+                sent = self.upload_once()
+                if sent is None:
+                    self._wait_backoff(stop)
+                    continue
+                self.backoff = 0.0
+                if sent < self.batch_size:
+                    break
+        self.upload_once()
+
+
+def open_serial(port, baud):
+    import serial  # pyserial, only needed on the reader machine
+    return serial.Serial(port, baud, timeout=1)
+
+
+def run(open_port, spool, uploader, stop=None):
+    """Run the reader and uploader threads until stop is set (or Ctrl+C)."""
+    stop = stop or threading.Event()
+    pending = threading.Event()
+    pending.set()  # upload whatever is left from the last run
+    threads = [
+        threading.Thread(target=read_scans, args=(open_port, spool, stop, pending), name='reader', daemon=True),
+        threading.Thread(target=uploader.run, args=(stop, pending), name='uploader', daemon=True),
+    ]
+    for thread in threads:
+        thread.start()
+    try:
+        while not stop.is_set():
+            stop.wait(1)
+    except KeyboardInterrupt:
+        stop.set()
+    for thread in threads:
+        thread.join(timeout=REQUEST_TIMEOUT + 1)
+
 
 def main():
-    port = 'COM4'
-    baud = 9600
-    url = "http://127.0.0.1:5000/attendance/scan"  # Your Flask endpoint
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', default=os.environ.get('READER_PORT', 'COM4'))
+    parser.add_argument('--baud', type=int, default=9600)
+    parser.add_argument('--url', default=os.environ.get('READER_URL', 'http://127.0.0.1:5000/api/clock-events'))
+    parser.add_argument('--reader-id', default=os.environ.get('READER_ID', 'reader-1'))
+    parser.add_argument('--spool', default=os.environ.get('READER_SPOOL', 'nfc_spool.db'))
+    args = parser.parse_args()
 
+    spool = Spool(args.spool)
+    uploader = Uploader(spool, args.url, args.reader_id, token=os.environ.get('READER_API_TOKEN'))
+    print(f"📡 Listening on {args.port} at {args.baud} baud, {len(spool)} scan(s) waiting...")
     try:
-        with serial.Serial(port, baud, timeout=1) as ser:
-            print(f"📡 Listening on {port} at {baud} baud...")
-
-            while True:
-                data = ser.read(7)  # Read 7 bytes per scan (adjust if needed)
-                if data:
-                    uid_hex = data.hex().upper()
-                    print(f"🆔 Tag scanned: {uid_hex}")
-
-                    try:
-                        response = requests.post(url, data={'uid': uid_hex})
-                        print("🌐 Status Code:", response.status_code)
-                        print("📄 Response:", response.text)
-                    except Exception as e:
-                        print("❌ Could not send to Flask:", e)
-
-    except Exception as e:
-        print("❌ Serial error:", e)
+        run(lambda: open_serial(args.port, args.baud), spool, uploader)
+    finally:
+        spool.close()
+
 
 if __name__ == "__main__":
     main()
@@ -1,16 +1,11 @@
-from attendance_app import app, db
-from attendance_app.models import QRCodeToken
-import secrets
+from attendance_app import app
+from attendance_app.qr_tokens import issue_token, token_expires_at
+import sys
 
 with app.app_context():  # <- this provides the app context
-    # Generate a token
-    token = secrets.token_urlsafe(16)
-    
-    # Create QRCodeToken entry
-    qr_entry = QRCodeToken(token=token)
-    
-    # Add to DB and commit
-    db.session.add(qr_entry)
-    db.session.commit()
+    # Current signed token of a kiosk (nothing is stored)
+    kiosk_id = sys.argv[1] if len(sys.argv) > 1 else "main"
+    token = issue_token(kiosk_id)
 
     print("QR token created:", token)
+    print("Valid until (epoch seconds):", token_expires_at(token))
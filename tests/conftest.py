@@ -0,0 +1,33 @@
+# tests/conftest.py
+#
+# The app reads its configuration from the environment when attendance_app
+# is imported, so point it at a scratch database before any test imports it.
+
+import os
+import tempfile
+
+import pytest
+
+_scratch = tempfile.mkdtemp(prefix='attendance-tests-')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_scratch, 'attendance.db')
+os.environ['JOB_WORKERS'] = '0'
+os.environ['JOB_ARTIFACT_DIR'] = os.path.join(_scratch, 'jobs')
+
+MIGRATIONS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'migrations')
+
+
+@pytest.fixture(scope='session')
+def app():
+    from attendance_app import app
+    return app
+
+
+@pytest.fixture(scope='session')
+def migrated_db(app):
+    """The scratch database, upgraded to the head migration."""
+    from flask_migrate import upgrade
+    from attendance_app import db
+
+    with app.app_context():
+        upgrade(directory=MIGRATIONS)
+    return db
@@ -0,0 +1,214 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import nfc_read
+from nfc_read import Spool, Uploader, read_scans
+
+
+class FakePort:
+    """A serial port that hands out the given reads in order: bytes, or an exception to raise."""
+
+    def __init__(self, reads):
+        self.reads = list(reads)
+        self.closed = False
+
+    def read(self, n):
+        if self.closed:
+            raise OSError('port is closed')
+        if not self.reads:
+            time.sleep(0.01)  # a read timing out with nothing scanned
+            return b''
+        item = self.reads.pop(0)
+        if isinstance(item, Exception):
+            raise item
+        return item
+
+    def close(self):
+        self.closed = True
+
+
+class StubServer:
+    """/api/clock-events on a local port, answering with the status and result the test sets."""
+
+    def __init__(self):
+        self.batches = []
+        self.status = 200
+        self.result = 'recorded'
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                stub.batches.append((self.headers.get('Authorization'), body['events']))
+                payload = json.dumps({'results': [{'key': event['key'], 'result': stub.result}
+                                                  for event in body['events']]}).encode()
+                self.send_response(stub.status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_port}/api/clock-events'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    @property
+    def events(self):
+        return [event for _, events in self.batches for event in events]
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def spool(tmp_path):
+    spool = Spool(str(tmp_path / 'spool.db'))
+    yield spool
+    spool.close()
+
+
+@pytest.fixture
+def server():
+    server = StubServer()
+    yield server
+    server.close()
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.01)
+
+
+def test_upload_sends_spooled_scans_and_removes_them(spool, server):
+    keys = [spool.append(serial) for serial in ('AA01', 'AA02', 'AA03')]
+    uploader = Uploader(spool, server.url, 'door-1', token='secret', batch_size=2)
+
+    assert uploader.upload_once() == 2
+    assert uploader.upload_once() == 1
+    assert uploader.upload_once() == 0
+
+    assert [event['key'] for event in server.events] == keys
+    assert [event['serial'] for event in server.events] == ['AA01', 'AA02', 'AA03']
+    assert {event['reader_id'] for event in server.events} == {'door-1'}
+    assert {authorization for authorization, _ in server.batches} == {'Bearer secret'}
+    assert len(spool) == 0
+
+
+def test_stale_scans_leave_the_spool(spool, server, capsys):
+    spool.append('AA01')
+    server.result = 'stale'
+
+    assert Uploader(spool, server.url, 'door-1').upload_once() == 1
+    assert len(spool) == 0
+    assert 'stale' in capsys.readouterr().out
+
+
+def test_failed_upload_keeps_the_scans(spool, server):
+    spool.append('AA01')
+    uploader = Uploader(spool, server.url, 'door-1')
+
+    server.status = 500
+    assert uploader.upload_once() is None
+    assert len(spool) == 1
+
+    server.status = 200
+    assert uploader.upload_once() == 1
+    assert len(spool) == 0
+    first, retry = [event['key'] for event in server.events]
+    assert first == retry
+
+
+def test_unreachable_server_backs_off(spool):
+    spool.append('AA01')
+    uploader = Uploader(spool, 'http://127.0.0.1:9/api/clock-events', 'door-1')
+
+    assert uploader.upload_once() is None
+    assert len(spool) == 1
+    for limit in (1, 2, 4):
+        assert limit / 2 <= uploader.next_backoff() <= limit
+
+
+def test_too_large_halves_the_batch(spool, server):
+    for serial in ('AA01', 'AA02', 'AA03', 'AA04'):
+        spool.append(serial)
+    uploader = Uploader(spool, server.url, 'door-1', batch_size=4)
+
+    server.status = 413
+    assert uploader.upload_once() is None
+    assert uploader.batch_size == 2
+
+    server.status = 200
+    assert uploader.upload_once() == 2
+    assert len(spool) == 2
+
+
+def test_reader_reopens_a_failed_port(spool, monkeypatch):
+    monkeypatch.setattr(nfc_read, 'REOPEN_DELAY', 0.01)
+    ports = [FakePort([b'\x01\x02', OSError('device disconnected')]), FakePort([b'\x03\x04'])]
+    opened = []
+
+    def open_port():
+        if not ports:
+            raise OSError('no such port')
+        opened.append(ports.pop(0))
+        return opened[-1]
+
+    stop, pending = threading.Event(), threading.Event()
+    reader = threading.Thread(target=read_scans, args=(open_port, spool, stop, pending))
+    reader.start()
+    try:
+        wait_for(lambda: len(spool) == 2)
+    finally:
+        stop.set()
+        reader.join(timeout=5)
+
+    assert not reader.is_alive()
+    assert [serial for _, _, serial, _, _ in spool.peek(10)] == ['0102', '0304']
+    assert len(opened) == 2
+    assert all(port.closed for port in opened)
+
+
+def test_reader_backs_off_while_the_port_cannot_open(spool, monkeypatch):
+    monkeypatch.setattr(nfc_read, 'REOPEN_DELAY', 0.01)
+    monkeypatch.setattr(nfc_read, 'BACKOFF_MAX', 0.04)
+    waits = []
+    stop, pending = threading.Event(), threading.Event()
+
+    def wait(delay):
+        waits.append(delay)
+        if len(waits) == 5:
+            stop.set()
+
+    def open_port():
+        raise OSError('no such port')
+
+    monkeypatch.setattr(stop, 'wait', wait)
+    read_scans(open_port, spool, stop, pending)
+
+    assert waits == [0.01, 0.02, 0.04, 0.04, 0.04]
+
+
+def test_run_delivers_scans_from_the_port_to_the_server(spool, server):
+    port = FakePort([b'\xde\xad\xbe\xef', b'', b'\xca\xfe'])
+    uploader = Uploader(spool, server.url, 'door-1', flush_interval=0.01)
+    stop = threading.Event()
+    runner = threading.Thread(target=nfc_read.run, args=(lambda: port, spool, uploader, stop))
+    runner.start()
+    try:
+        wait_for(lambda: len(server.events) == 2 and len(spool) == 0)
+    finally:
+        stop.set()
+        runner.join(timeout=15)
+
+    assert [event['serial'] for event in server.events] == ['DEADBEEF', 'CAFE']
+    assert port.closed
@@ -0,0 +1,24 @@
+from attendance_app.query_plans import check_query_plans, full_scans
+
+
+def test_hot_queries_use_an_index(app, migrated_db):
+    with app.app_context():
+        results = check_query_plans()
+        migrated_db.session.rollback()
+
+    assert results
+    failures = [(name, sql, scans) for name, sql, scans in results if scans]
+    assert failures == []
+
+
+def test_full_scans_flags_hot_tables_only():
+    plan = [
+        (2, 0, 0, 'SCAN attendance'),
+        (3, 0, 0, 'SCAN user'),
+        (4, 0, 0, 'SCAN break_session USING INDEX ix_break_session_attendance'),
+        (5, 0, 0, 'SEARCH deduction USING INDEX ix_deduction_user_date (user_id=?)'),
+    ]
+    assert full_scans(plan) == ['SCAN attendance']
+    assert full_scans(plan, allow_index_scan=False) == [
+        'SCAN attendance', 'SCAN break_session USING INDEX ix_break_session_attendance',
+    ]